@@ -0,0 +1,448 @@
+import contextvars
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from openai import OpenAI, OpenAIError, DefaultHttpxClient, RateLimitError
+from hedging import Call, current_call, get_hedger
+from rate_limit import DEFAULT_RETRY_AFTER, get_limiter, reset_limiter, retry_after
+from response_cache import get_response_cache, request_key
+import telemetry
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Per-stage defaults. Override with AI_MODEL_<STAGE> and AI_TIMEOUT_<STAGE>,
+# e.g. AI_MODEL_GENERATE=gpt-4o or AI_TIMEOUT_IMAGE=180. "slo" is the p95
+# latency budget in seconds after which a call is hedged when hedging is on
+# (override with AI_SLO_<STAGE>; see hedging).
+STAGES = {
+    "analyze": {"model": "gpt-4o", "timeout": 60.0, "slo": 20.0},
+    "outline": {"model": "gpt-4o", "timeout": 60.0},
+    "generate": {"model": "gpt-5.1", "timeout": 300.0, "slo": 120.0, "first_token_slo": 20.0},
+    "image": {"model": "dall-e-3", "timeout": 120.0, "slo": 60.0},
+}
+
+DEFAULT_MAX_RETRIES = 2
+
+_client = None
+_lock = threading.Lock()
+
+class UsageMeter:
+    """
+    Tallies the chat calls and billed tokens made while it is active (see
+    metered()). Responses served from the response cache are not billed and
+    are not counted.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        prompt = getattr(usage, "prompt_tokens", 0)
+        completion = getattr(usage, "completion_tokens", 0)
+        with self._lock:
+            self.calls += 1
+            if isinstance(prompt, int) and isinstance(completion, int):
+                self.prompt_tokens += prompt
+                self.completion_tokens += completion
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+_meter = contextvars.ContextVar("usage_meter", default=None)
+
+@contextmanager
+def metered() -> Iterator[UsageMeter]:
+    """
+    Counts the chat calls made in this context. Worker threads are included
+    when their tasks run in a copy of the caller's context
+    (contextvars.copy_context().run).
+    """
+    meter = UsageMeter()
+    token = _meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _meter.reset(token)
+
+def _record_usage(usage, model: str):
+    meter = _meter.get()
+    if meter is not None and usage is not None:
+        meter.add(usage)
+    telemetry.record_usage(model, usage)
+
+# Model of the request being sent from this thread, for _observe_response().
+_request_model = contextvars.ContextVar("request_model", default=None)
+
+def _observe_response(response):
+    # Runs for every HTTP response, including the client's own retries.
+    model = _request_model.get()
+    limiter = get_limiter()
+    if model and limiter is not None:
+        limiter.observe(model, response.status_code, response.headers)
+
+def estimate_tokens(messages: List[Dict]) -> int:
+    """
+    Rough prompt size in tokens (about four characters per token), used to
+    pace calls against the tokens-per-minute budget before they are sent.
+    """
+    return sum(len(str(message.get("content") or "")) for message in messages) // 4
+
+def _quota_exhausted(error: RateLimitError) -> bool:
+    # A 429 for an exhausted billing quota does not clear by waiting.
+    return getattr(error, "code", None) == "insufficient_quota"
+
+def _call_limited(model: str, tokens: int, request: Callable) -> Tuple[object, Callable[[], None]]:
+    """
+    Runs request() in a slot of the shared rate limiter (see
+    rate_limit.AdaptiveLimiter). A 429 that outlasts the client's own retries
+    puts the call back in the queue until the model's retry-after has passed,
+    for up to the limiter's max_wait in total, instead of failing it.
+
+    Returns:
+        The result, and a function that frees the slot; call it once the
+        response has been consumed.
+    """
+    limiter = get_limiter()
+    if limiter is None:
+        return request(), lambda: None
+    deadline = time.monotonic() + limiter.max_wait
+    while True:
+        limiter.acquire(model, tokens)
+        token = _request_model.set(model)
+        try:
+            return request(), lambda: limiter.release(model)
+        except RateLimitError as e:
+            limiter.release(model)
+            if _quota_exhausted(e) or time.monotonic() >= deadline:
+                raise
+            delay = retry_after(getattr(e.response, "headers", None))
+            limiter.hold(model, DEFAULT_RETRY_AFTER if delay is None else delay)
+        except BaseException:
+            limiter.release(model)
+            raise
+        finally:
+            _request_model.reset(token)
+
+def model_for(stage: str) -> str:
+    """
+    Returns the model configured for a pipeline stage.
+    """
+    return os.getenv(f"AI_MODEL_{stage.upper()}") or STAGES[stage]["model"]
+
+def timeout_for(stage: str) -> float:
+    """
+    Returns the request timeout in seconds for a pipeline stage.
+    """
+    value = os.getenv(f"AI_TIMEOUT_{stage.upper()}") or os.getenv("AI_TIMEOUT")
+    return float(value) if value else STAGES[stage]["timeout"]
+
+def slo_for(stage: str) -> Optional[float]:
+    """
+    Returns the latency budget in seconds after which a call of this stage
+    is hedged, or None if the stage is never hedged.
+    """
+    value = os.getenv(f"AI_SLO_{stage.upper()}")
+    if value:
+        return float(value)
+    return STAGES.get(stage, {}).get("slo")
+
+def first_token_slo_for(stage: str) -> Optional[float]:
+    """
+    Returns the budget in seconds for the first token of a streamed call of
+    this stage, after which the stream is hedged, or None if it never is.
+    """
+    value = os.getenv(f"AI_FIRST_TOKEN_SLO_{stage.upper()}")
+    if value:
+        return float(value)
+    return STAGES.get(stage, {}).get("first_token_slo")
+
+def fallback_model_for(stage: str) -> Optional[str]:
+    """
+    Returns the faster model that hedged calls of this stage go to
+    (AI_FALLBACK_MODEL_<STAGE>), or None to hedge with the stage's own model.
+    """
+    return os.getenv(f"AI_FALLBACK_MODEL_{stage.upper()}") or None
+
+def _hedged(stage: str, attempt: Callable[[str], Dict], model: str,
+            validate: Optional[Callable[[Dict], bool]] = None) -> Dict:
+    hedger = get_hedger()
+    if hedger is None:
+        return attempt(model)
+    return hedger.run(stage, slo_for(stage), attempt, model, fallback_model_for(stage), validate)
+
+def _cacheable(result: Dict, model: str, valid: Callable[[Dict], bool]) -> bool:
+    # Entries are keyed by the requested model, so an answer from the
+    # fallback model is not recorded under it; neither is an invalid one.
+    return result.get("model", model) == model and valid(result)
+
+def _client_options() -> dict:
+    return {
+        "api_key": os.getenv("AI_API_KEY"),
+        "base_url": os.getenv("AI_BASE_URL", DEFAULT_BASE_URL),
+        "max_retries": int(os.getenv("AI_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+    }
+
+def get_client() -> OpenAI:
+    """
+    Returns the process-wide OpenAI client, creating it on first use. All
+    callers share one HTTP connection pool, so requests reuse keep-alive
+    connections instead of paying for a new TLS handshake each time.
+    Pass timeout=timeout_for(stage) on each request for per-stage timeouts.
+    Every response is reported to the shared rate limiter.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            http_client = DefaultHttpxClient(event_hooks={"response": [_observe_response]})
+            _client = OpenAI(**_client_options(), http_client=http_client)
+        return _client
+
+class CallCancelled(OpenAIError):
+    """
+    Raised by an attempt of a hedged call that was cut short because another
+    attempt won.
+    """
+
+class _AttemptClient:
+    """
+    A client of its own for one attempt of a hedged call, so the attempt can
+    be cut short from another thread: cancelling the call shuts down the
+    sockets the client opened, which fails the request at once, and the API
+    stops generating (and billing) when the connection drops. The sockets
+    are found through httpcore's trace extension.
+    """
+
+    def __init__(self, call: Call):
+        self._call = call
+        self._sockets = []
+        self._lock = threading.Lock()
+        http_client = DefaultHttpxClient(event_hooks={"request": [self._on_request], "response": [_observe_response]})
+        self.client = OpenAI(**_client_options(), http_client=http_client)
+        call.on_cancel(self._shutdown)
+
+    def _on_request(self, request):
+        # Also stops the client's own retries once the call is cancelled.
+        if self._call.cancelled:
+            raise CallCancelled("another hedged call won")
+        request.extensions["trace"] = self._on_trace
+
+    def _on_trace(self, event: str, info: Dict):
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self._sockets.append(info["return_value"].get_extra_info("socket"))
+            if self._call.cancelled:
+                self._shutdown()
+        elif event.endswith(".failed") and self._call.cancelled:
+            raise CallCancelled("another hedged call won") from info.get("exception")
+
+    def _shutdown(self):
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        self.client.close()
+
+def _open_client() -> Tuple[OpenAI, Callable[[], None]]:
+    """
+    Returns the client for one model call and a function to call once the
+    response has been consumed: the shared client, or a cancellable client
+    of its own for an attempt of a hedged call (see hedging.current_call).
+    """
+    call = current_call()
+    if call is None:
+        return get_client(), lambda: None
+    attempt_client = _AttemptClient(call)
+    return attempt_client.client, attempt_client.close
+
+def reset_clients():
+    """
+    Drops the shared client and rate limiter so the next call re-reads the
+    environment.
+    """
+    global _client
+    with _lock:
+        _client = None
+    reset_limiter()
+
+def chat_completion(stage: str, messages: List[Dict], temperature: float = 0.7,
+                    response_format: Optional[Dict] = None,
+                    validate: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Runs a chat completion with the stage's model and timeout, going through
+    the response cache when one is configured (see response_cache), the
+    shared rate limiter, and hedging when it is on.
+
+    Args:
+        validate: Whether a content is usable; when a call is hedged, the
+            first usable response wins.
+
+    Returns:
+        The content of the first choice.
+    """
+    params = {"model": model_for(stage), "messages": messages, "temperature": temperature}
+    if response_format:
+        params["response_format"] = response_format
+
+    def attempt(model):
+        client, close = _open_client()
+        try:
+            response, release = _call_limited(
+                model, estimate_tokens(messages),
+                lambda: client.chat.completions.create(**{**params, "model": model}, timeout=timeout_for(stage)))
+            release()
+        finally:
+            close()
+        _record_usage(getattr(response, "usage", None), model)
+        return {"content": response.choices[0].message.content, "model": model}
+
+    def valid(result):
+        return bool(result["content"]) and (validate is None or validate(result["content"]))
+
+    def call():
+        return _hedged(stage, attempt, params["model"], valid)
+
+    cache = get_response_cache()
+    if cache is None:
+        return call()["content"]
+    return cache.fetch(request_key("chat", **params), call, lambda result: _cacheable(result, params["model"], valid))["content"]
+
+def chat_completion_stream(stage: str, messages: List[Dict], temperature: float = 0.7) -> Iterator[str]:
+    """
+    Streaming counterpart of chat_completion(): yields the content as it
+    arrives. A cached response (same key as the non-streaming request) is
+    yielded in one piece. With hedging on, a stream whose first token takes
+    longer than the stage's first-token budget is hedged; the stream that
+    produces text first is the one yielded and the other is cancelled. The
+    full text is stored in the cache only once the stream completes, so
+    closing the generator early aborts the request without recording a
+    partial response.
+
+    Yields:
+        Successive pieces of the completion text.
+    """
+    params = {"model": model_for(stage), "messages": messages, "temperature": temperature}
+    cache = get_response_cache()
+    key = request_key("chat", **params)
+    if cache is not None:
+        cached = cache.lookup(key)
+        if cached is not None:
+            yield cached["content"]
+            return
+
+    def attempt(model):
+        # Opens the stream and reads up to its first text, so that a hedge
+        # races the primary on time to first token. The limiter slot is held,
+        # and the client until the stream is closed.
+        client, close_client = _open_client()
+        try:
+            stream, release = _call_limited(
+                model, estimate_tokens(messages),
+                lambda: client.chat.completions.create(**{**params, "model": model}, stream=True,
+                                                       stream_options={"include_usage": True},
+                                                       timeout=timeout_for(stage)))
+        except BaseException:
+            close_client()
+            raise
+        opened = {"stream": stream, "chunks": iter(stream), "release": release, "close_client": close_client,
+                  "model": model, "first": None}
+        try:
+            for text in _stream_text(opened):
+                opened["first"] = text
+                break
+        except BaseException:
+            _close_stream(opened)
+            raise
+        return opened
+
+    hedger = get_hedger()
+    if hedger is None:
+        opened = attempt(params["model"])
+    else:
+        opened = hedger.run(stage, first_token_slo_for(stage), attempt, params["model"],
+                            fallback_model_for(stage), validate=lambda o: o["first"] is not None,
+                            discard=_close_stream)
+    parts = []
+    try:
+        if opened["first"] is not None:
+            parts.append(opened["first"])
+            yield opened["first"]
+            for text in _stream_text(opened):
+                parts.append(text)
+                yield text
+    finally:
+        _close_stream(opened)
+
+    if cache is not None and parts and opened["model"] == params["model"]:
+        cache.store(key, {"content": "".join(parts), "model": opened["model"]})
+
+def _stream_text(opened: Dict) -> Iterator[str]:
+    for chunk in opened["chunks"]:
+        if not chunk.choices:
+            # The final chunk carries the token usage and no choices.
+            _record_usage(getattr(chunk, "usage", None), opened["model"])
+            continue
+        text = chunk.choices[0].delta.content
+        if text:
+            yield text
+
+def _close_stream(opened: Dict):
+    try:
+        close = getattr(opened["stream"], "close", None)
+        if close:
+            close()
+    finally:
+        opened["release"]()
+        opened["close_client"]()
+
+def image_generation(prompt: str, size: str, quality: str, stage: str = "image",
+                     response_format: str = "url") -> str:
+    """
+    Generates one image with the stage's model and timeout, going through the
+    response cache when one is configured, the shared rate limiter, and
+    hedging when it is on.
+
+    Args:
+        response_format: "url" for a hosted URL, or "b64_json" to receive the
+            image itself and skip downloading it again.
+
+    Returns:
+        The URL of the generated image, or its base64-encoded bytes.
+    """
+    params = {"model": model_for(stage), "prompt": prompt, "size": size, "quality": quality, "n": 1}
+    if response_format != "url":
+        params["response_format"] = response_format
+    field = "b64_json" if response_format == "b64_json" else "url"
+
+    def attempt(model):
+        client, close = _open_client()
+        try:
+            response, release = _call_limited(
+                model, 0, lambda: client.images.generate(**{**params, "model": model}, timeout=timeout_for(stage)))
+            release()
+        finally:
+            close()
+        telemetry.record_image(model, size, quality)
+        return {field: getattr(response.data[0], field), "model": model}
+
+    def valid(result):
+        return bool(result[field])
+
+    def call():
+        return _hedged(stage, attempt, params["model"], valid)
+
+    cache = get_response_cache()
+    if cache is None:
+        return call()[field]
+    return cache.fetch(request_key("image", **params), call, lambda result: _cacheable(result, params["model"], valid))[field]
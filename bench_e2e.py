@@ -0,0 +1,434 @@
+import argparse
+import base64
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from personalities import PERSONALITIES
+
+# Stages shown in the report, in pipeline order.
+REPORT_STAGES = ("feed", "analyze", "search", "generate", "image", "upload", "publish")
+
+WORDS = ("council budget river storm vaccine election rocket harvest tariff museum glacier startup court "
+         "festival drought satellite union bridge reactor library wildfire merger lottery orchestra telescope "
+         "pension airport vineyard stadium pipeline volcano parliament bakery robot ferry clinic summit "
+         "reef mayor archive harbor treaty").split()
+
+class Stub(ThreadingHTTPServer):
+    """
+    A local stand-in for one external service, with a fixed latency (plus
+    up to jitter seconds) and a failure rate. Counts the requests it served.
+    """
+    daemon_threads = True
+
+    def __init__(self, handler, latency: float = 0.0, error_rate: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name: str):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def delay_and_fail(self, latency: Optional[float] = None) -> bool:
+        """
+        Sleeps for the simulated latency (the stub's, unless given). Returns
+        True if this request should fail.
+        """
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        time.sleep((self.latency if latency is None else latency) + jitter)
+        return failed
+
+    def start(self) -> "Stub":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    return data
+                data += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def json_body(self) -> Dict:
+        data = self.body()
+        return json.loads(data) if data else {}
+
+    def send(self, status: int, payload=None, content_type: str = "application/json", raw: bytes = None):
+        data = raw if raw is not None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def story_text(personality: str, number: int, words: int) -> str:
+    # Distinct word choices keep the stub stories from looking like near-duplicates.
+    rng = random.Random(f"{personality}-{number}-{words}")
+    return " ".join(rng.sample(WORDS, words))
+
+class RSSHandler(StubHandler):
+    """
+    GET /<personality>/<n>.xml: an RSS feed with two items (the scraper
+    reads ENTRIES_PER_FEED items per feed).
+    """
+
+    def do_GET(self):
+        self.server.count("feed")
+        if self.server.delay_and_fail():
+            return self.send(503, {"error": "stub failure"})
+        personality, name = self.path.strip("/").split("/")
+        number = int(name.split(".")[0])
+        items = "".join(
+            f"<item><title>{story_text(personality, n, 6).capitalize()} ({personality} {n})</title><link>https://news.example/{personality}/{n}</link>"
+            f"<guid>https://news.example/{personality}/{n}</guid><pubDate>Mon, 05 Jan 2026 10:00:00 GMT</pubDate>"
+            f"<description>{story_text(personality, n, 30).capitalize()}.</description></item>"
+            for n in (number * 2, number * 2 + 1)
+        )
+        feed = f"<?xml version='1.0'?><rss version='2.0'><channel><title>Bench</title>{items}</channel></rss>"
+        self.send(200, raw=feed.encode(), content_type="application/rss+xml")
+
+class SearchHandler(StubHandler):
+    """
+    GET /search?q=...&n=...: search results in the DDGS text() shape.
+    """
+
+    def do_GET(self):
+        self.server.count("search")
+        if self.server.delay_and_fail():
+            return self.send(500, {"error": "stub failure"})
+        query = parse_qs(urlsplit(self.path).query)
+        q = query.get("q", [""])[0]
+        n = int(query.get("n", ["2"])[0])
+        self.send(200, [{"title": f"{q} result {i}", "href": f"https://search.example/{i}?q={len(q)}",
+                         "body": f"Findings about {q}. " + " ".join(WORDS[i:i + 40])} for i in range(n)])
+
+class OpenAIHandler(StubHandler):
+    """
+    OpenAI-compatible /v1/chat/completions (plain and streamed) and
+    /v1/images/generations. JSON-mode requests get one object with every key
+    the analysis, outline and fused prompts ask for.
+    """
+
+    def do_POST(self):
+        request = self.json_body()
+        path = urlsplit(self.path).path
+        if path.endswith("/chat/completions"):
+            self.server.count("chat")
+            if self.server.delay_and_fail():
+                return self.send(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            return self.chat(request)
+        if path.endswith("/images/generations"):
+            self.server.count("image")
+            if self.server.delay_and_fail(self.server.image_latency):
+                return self.send(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            image = self.server.image
+            if request.get("response_format") == "b64_json":
+                data = {"b64_json": base64.b64encode(image).decode()}
+            else:
+                data = {"url": f"{self.server.url}/files/image.png"}
+            return self.send(200, {"created": int(time.time()), "data": [data]})
+        self.send(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        self.send(200, raw=self.server.image, content_type="image/png")
+
+    def chat(self, request: Dict):
+        prompt = "\n".join(str(message.get("content")) for message in request.get("messages", []))
+        paragraph = "<p>" + " ".join(WORDS) + "</p>"
+        if request.get("response_format"):
+            content = json.dumps({
+                "thesis": "A stub thesis.",
+                # Per-headline queries, so the search cache does not hide the search stage.
+                "queries": [f"stub query {zlib.crc32(prompt.encode())} {i}" for i in range(2)],
+                "title": "Stub title",
+                "sections": [{"heading": f"Part {i}", "points": "the key points"} for i in range(3)],
+                "content": f"<h2>Stub</h2>{paragraph * 6}",
+            })
+        elif "Write ONLY section" in prompt:
+            content = paragraph * 3
+        else:
+            content = f"TITLE: Stub title\nCONTENT: <h2>Stub</h2>{paragraph * 8}"
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": request.get("model")}
+
+        if not request.get("stream"):
+            return self.send(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]))
+
+        events = [dict(base, object="chat.completion.chunk", choices=[
+            {"index": 0, "finish_reason": None, "delta": {"content": content[i:i + 40]}}])
+            for i in range(0, len(content), 40)]
+        events.append(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+        stream = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        self.send(200, raw=stream.encode(), content_type="text/event-stream")
+
+class WordPressHandler(StubHandler):
+    """
+    The WordPress REST routes the publisher uses: media upload and lookup,
+    post create and lookup, and /batch/v1.
+    """
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.server.count("wp_get")
+        if self.server.delay_and_fail():
+            return self.send(503, {"code": "stub_failure"})
+        if path.startswith("/wp-json/wp/v2/media/"):
+            return self.send(200, {"id": int(path.rsplit("/", 1)[1])})
+        self.send(200, [])
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.body()
+        if self.server.delay_and_fail():
+            return self.send(503, {"code": "stub_failure"})
+        if path == "/wp-json/wp/v2/media":
+            self.server.count("media")
+            return self.send(201, {"id": self.server.next_id()})
+        if path == "/wp-json/wp/v2/posts":
+            self.server.count("post")
+            return self.send(201, self.post())
+        if path == "/wp-json/batch/v1":
+            requests = json.loads(body).get("requests", [])
+            for _ in requests:
+                self.server.count("post")
+            return self.send(207, {"responses": [{"status": 201, "body": self.post()} for _ in requests]})
+        self.send(404, {"code": "rest_no_route"})
+
+    def post(self) -> Dict:
+        post_id = self.server.next_id()
+        return {"id": post_id, "link": f"{self.server.url}/?p={post_id}"}
+
+class WordPressStub(Stub):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(WordPressHandler, *args, **kwargs)
+        self._ids = 0
+
+    def next_id(self) -> int:
+        with self.lock:
+            self._ids += 1
+            return self._ids
+
+class FakeDDGS:
+    """
+    Drop-in for ddgs.DDGS that queries the local search stub.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query: str, max_results: int = 2) -> List[Dict]:
+        import requests
+        response = requests.get(f"{os.environ['BENCH_SEARCH_URL']}/search",
+                                params={"q": query, "n": max_results}, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+def child(main_args: List[str]):
+    """
+    Runs main.main() in this process against the stubs described by the
+    BENCH_* environment, then prints the peak RSS as JSON.
+    """
+    import main
+    import researcher
+
+    feeds = json.loads(os.environ["BENCH_FEEDS"])
+    researcher.DDGS = FakeDDGS
+    for name, urls in feeds.items():
+        PERSONALITIES[name] = dict(PERSONALITIES[name], rss_feeds=urls)
+
+    sys.argv = ["main.py"] + main_args
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            main.main()
+        finally:
+            sys.stdout = stdout
+    print(json.dumps({"peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+def run_scenario(stubs: Dict[str, Stub], headlines: int, personalities: int, concurrency: int,
+                 extra_args: List[str], env: Dict[str, str]) -> Dict:
+    """
+    Runs one end-to-end invocation of main.py in a fresh process and working
+    directory, so every cache, history and client starts cold.
+
+    Returns:
+        The scenario's measurements.
+    """
+    names = list(PERSONALITIES)[:personalities]
+    feeds_per_personality = (headlines + 1) // 2
+    feeds = {name: [f"{stubs['rss'].url}/{name}/{n}.xml" for n in range(feeds_per_personality)] for name in names}
+    for stub in stubs.values():
+        stub.counts = {}
+
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as workdir:
+        telemetry_file = os.path.join(workdir, "telemetry.jsonl")
+        child_env = dict(os.environ, **env)
+        child_env.update({
+            "BENCH_FEEDS": json.dumps(feeds),
+            "HISTORY_DB": os.path.join(workdir, "history.db"),
+        })
+        for name in names:
+            child_env[PERSONALITIES[name]["env_user_key"]] = f"bench-{name}"
+            child_env[PERSONALITIES[name]["env_pass_key"]] = "bench"
+        main_args = ["--personality", ",".join(names), "--concurrency", str(concurrency),
+                     "--telemetry", telemetry_file] + extra_args
+
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--"] + main_args,
+                                cwd=workdir, env=child_env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"main.py failed ({headlines} headlines, {personalities} personalities):\n{result.stderr[-2000:]}")
+
+        run = {}
+        with open(telemetry_file) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("type") == "run":
+                    run = record
+
+    articles = stubs["wordpress"].counts.get("post", 0)
+    return {
+        "headlines": headlines,
+        "personalities": personalities,
+        "articles": articles,
+        "seconds": round(elapsed, 3),
+        "articles_per_min": round(articles / elapsed * 60, 2),
+        "peak_rss_mb": round(json.loads(result.stdout.strip().splitlines()[-1])["peak_rss_kb"] / 1024, 1),
+        "stages": run.get("stages", {}),
+    }
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Lists the scenarios that got slower or bigger than the baseline by more
+    than the tolerance.
+    """
+    previous = {(r["headlines"], r["personalities"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["headlines"], r["personalities"]))
+        if not old:
+            continue
+        label = f"{r['headlines']} headlines x {r['personalities']} personalities"
+        if r["articles_per_min"] < old["articles_per_min"] * (1 - tolerance):
+            regressions.append(f"{label}: {r['articles_per_min']} articles/min (baseline {old['articles_per_min']})")
+        if r["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{label}: peak RSS {r['peak_rss_mb']} MB (baseline {old['peak_rss_mb']})")
+    return regressions
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main():
+    if "--child" in sys.argv:
+        return child(sys.argv[sys.argv.index("--") + 1:])
+
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmark of main.py against local RSS, search, OpenAI and WordPress stubs. "
+                    "Unrecognized arguments are passed to main.py (e.g. --sections, --batch-publish).")
+    parser.add_argument("--headlines", type=int_list, default=[1, 10, 50], help="Comma-separated headlines per personality (default: 1,10,50).")
+    parser.add_argument("--personalities", type=int_list, default=[1, 3], help=f"Comma-separated personality counts, 1-{len(PERSONALITIES)} (default: 1,3).")
+    parser.add_argument("--concurrency", type=int, default=4, help="--concurrency passed to main.py.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per chat completion.")
+    parser.add_argument("--image-latency", type=float, default=0.3, help="Seconds per image generation.")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per search.")
+    parser.add_argument("--wp-latency", type=float, default=0.02, help="Seconds per WordPress request.")
+    parser.add_argument("--rss-latency", type=float, default=0.02, help="Seconds per feed request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds, on every request.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests each stub fails (5xx).")
+    parser.add_argument("--image-kb", type=int, default=300, help="Size of the generated images.")
+    parser.add_argument("--search-rate", type=float, default=50, help="SEARCH_RATE_PER_SEC for the run (the real default is 1).")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as JSON.")
+    parser.add_argument("--compare", metavar="PATH", help="Exit with an error if a scenario regressed against these saved results.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression for --compare (default: 0.2 = 20%%).")
+    args, extra_args = parser.parse_known_args()
+
+    stubs = {
+        "rss": Stub(RSSHandler, args.rss_latency, args.error_rate, args.jitter, seed=1),
+        "search": Stub(SearchHandler, args.search_latency, args.error_rate, args.jitter, seed=2),
+        "openai": Stub(OpenAIHandler, args.llm_latency, args.error_rate, args.jitter, seed=3),
+        "wordpress": WordPressStub(args.wp_latency, args.error_rate, args.jitter, seed=4),
+    }
+    # The OpenAI stub serves both chat and images, with separate latencies.
+    stubs["openai"].image = b"\x89PNG\r\n\x1a\n" + os.urandom(args.image_kb * 1024)
+    stubs["openai"].image_latency = args.image_latency
+    for stub in stubs.values():
+        stub.start()
+    env = {
+        "AI_API_KEY": "bench",
+        "AI_BASE_URL": f"{stubs['openai'].url}/v1",
+        "WP_URL": stubs["wordpress"].url,
+        "BENCH_SEARCH_URL": stubs["search"].url,
+        "SEARCH_RATE_PER_SEC": str(args.search_rate),
+        "SEARCH_BURST": str(max(3, args.search_rate)),
+    }
+
+    results = []
+    header = f"{'headlines':>9} {'pers':>4} {'articles':>8} {'seconds':>8} {'art/min':>8} {'peak MB':>8}  p50/p95 seconds per stage"
+    print(header)
+    for personalities in args.personalities:
+        for headlines in args.headlines:
+            r = run_scenario(stubs, headlines, min(personalities, len(PERSONALITIES)), args.concurrency, extra_args, env)
+            results.append(r)
+            stages = "  ".join(f"{stage} {s['p50']:.2f}/{s['p95']:.2f}" for stage, s in
+                               ((stage, r["stages"][stage]) for stage in REPORT_STAGES if stage in r["stages"]))
+            print(f"{r['headlines']:>9} {r['personalities']:>4} {r['articles']:>8} {r['seconds']:>8.1f} "
+                  f"{r['articles_per_min']:>8.1f} {r['peak_rss_mb']:>8.1f}  {stages}")
+
+    for stub in stubs.values():
+        stub.shutdown()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
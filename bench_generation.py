@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from generator import generate_story, generate_sectioned_story
+from researcher import format_citations, works_cited
+
+RESEARCH = [
+    {"title": f"Source {i}", "url": f"https://news.example/{i}", "snippet": " ".join(["finding"] * 40)}
+    for i in range(6)
+]
+
+def tokens(text: str) -> int:
+    # Rough English average; good enough to compare the two paths.
+    return max(1, len(text) // 4)
+
+class StubModel:
+    """
+    Stand-in for the OpenAI client. Each call sleeps for a fixed latency plus
+    the time to "decode" its output at a fixed token rate, and the token
+    counts of every prompt and completion are recorded.
+    """
+
+    def __init__(self, latency: float, tokens_per_sec: float, scale: float, sections: int, words: int):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.scale = scale
+        self.sections = sections
+        self.words = words
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature=None, response_format=None, timeout=None):
+        prompt = "\n".join(message["content"] for message in messages)
+        if response_format:
+            content = json.dumps({"title": "Planned title", "sections": [
+                {"heading": f"Section {i}", "points": "the key points of this part"} for i in range(self.sections)]})
+        elif "Write ONLY section" in prompt:
+            content = self._paragraphs(self.words // self.sections)
+        else:
+            content = "TITLE: Single call title\nCONTENT: " + self._paragraphs(self.words) + "\n" + works_cited(RESEARCH)
+
+        completion = tokens(content)
+        time.sleep((self.latency + completion / self.tokens_per_sec) * self.scale)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += tokens(prompt)
+            self.completion_tokens += completion
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    @staticmethod
+    def _paragraphs(words: int) -> str:
+        return "\n".join(f"<p>{' '.join(['word'] * 50)}</p>" for _ in range(max(1, words // 50)))
+
+def run(path: str, model: StubModel):
+    research_data = format_citations(RESEARCH)
+    with patch("ai_client.get_client", return_value=model), \
+         patch("ai_client.get_response_cache", return_value=None), \
+         patch.dict(os.environ, {"AI_API_KEY": "bench"}):
+        start = time.perf_counter()
+        if path == "single":
+            generate_story("Headline", "Be precise.", "Thesis", research_data)
+        else:
+            generate_sectioned_story("Headline", "Be precise.", "Thesis", research_data,
+                                     works_cited=works_cited(RESEARCH))
+        return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark story generation with a stubbed model: one call vs outline + parallel sections.")
+    parser.add_argument("--latency", type=float, default=0.8, help="Simulated per-call latency in seconds.")
+    parser.add_argument("--tokens-per-sec", type=float, default=60, help="Simulated decode speed.")
+    parser.add_argument("--scale", type=float, default=0.02, help="Fraction of simulated time actually slept.")
+    parser.add_argument("--words", type=int, default=800, help="Article length in words.")
+    args = parser.parse_args()
+
+    print(f"{'path':>9} {'sections':>8} {'calls':>5} {'latency s':>9} {'prompt tok':>10} {'output tok':>10}")
+    for sections in (3, 4, 6):
+        for path in ("single", "sections"):
+            if path == "single" and sections != 3:
+                continue
+            model = StubModel(args.latency, args.tokens_per_sec, args.scale, sections, args.words)
+            elapsed = run(path, model) / args.scale
+            label = sections if path == "sections" else "-"
+            print(f"{path:>9} {label:>8} {model.calls:>5} {elapsed:>9.1f} {model.prompt_tokens:>10} {model.completion_tokens:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+import tracemalloc
+import feedparser
+from feed_reader import entry_from_feedparser, iter_entries
+from scraper import CHUNK_SIZE, ENTRIES_PER_FEED
+
+def build_feed(items: int, description_words: int) -> bytes:
+    """
+    Builds a synthetic RSS 2.0 feed with long HTML descriptions.
+    """
+    description = ("&lt;p&gt;" + " ".join(["lorem"] * description_words) + "&lt;/p&gt;")
+    body = "".join(
+        f"<item><title>Headline {i}</title><link>https://news.example/{i}</link>"
+        f"<guid>https://news.example/{i}</guid><pubDate>Mon, 05 Jan 2026 10:00:00 GMT</pubDate>"
+        f"<description>{description}</description></item>"
+        for i in range(items)
+    )
+    return f"<?xml version='1.0'?><rss version='2.0'><channel><title>Bench</title>{body}</channel></rss>".encode()
+
+def feedparser_path(body: bytes):
+    feed = feedparser.parse(body)
+    return [entry_from_feedparser(entry) for entry in feed.entries[:ENTRIES_PER_FEED]]
+
+def streaming_path(body: bytes):
+    chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    return list(iter_entries(chunks, ENTRIES_PER_FEED))
+
+def measure(fn, body: bytes, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark feed parsing: feedparser vs the streaming reader.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions per case.")
+    args = parser.parse_args()
+
+    print(f"{'items':>6} {'size KB':>8} {'path':>11} {'ms/feed':>9} {'peak KB':>9}")
+    for items in (20, 50, 100):
+        body = build_feed(items, description_words=150)
+        for name, fn in (("feedparser", feedparser_path), ("streaming", streaming_path)):
+            elapsed, peak = measure(fn, body, args.repeat)
+            print(f"{items:>6} {len(body) / 1024:>8.1f} {name:>11} {elapsed * 1000:>9.2f} {peak / 1024:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from history_store import HISTORY_DB, headline_key
+
+# Checkpoints older than this are ignored and purged; the run they belong to is long gone.
+DEFAULT_CHECKPOINT_TTL_HOURS = 24
+
+# Stage names, in pipeline order.
+STAGES = ("analysis", "research", "story", "image", "media")
+
+class CheckpointStore:
+    """
+    Per-headline, per-personality results of each finished pipeline stage,
+    kept in the history database. A run that dies part way through an
+    article resumes at the first stage without a checkpoint instead of
+    repeating the model, search and image calls before it.
+
+    Values are stored as JSON, except image bytes, which go in a BLOB column.
+    The checkpoints of an article are cleared once it is recorded as
+    processed, and expire after ttl_seconds.
+    """
+
+    def __init__(self, path: Optional[str] = HISTORY_DB, ttl_seconds: float = DEFAULT_CHECKPOINT_TTL_HOURS * 3600):
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"resumed": 0, "saved": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    key TEXT NOT NULL,
+                    personality TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    value TEXT,
+                    data BLOB,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (key, personality, stage)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_created_idx ON checkpoints (created_at)")
+
+    def get(self, personality: str, headline: str, stage: str) -> Any:
+        """
+        Returns the checkpointed result of a stage, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, data FROM checkpoints WHERE key = ? AND personality = ? AND stage = ? AND created_at >= ?",
+                (headline_key(headline), personality, stage, time.time() - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                return None
+            self.stats["resumed"] += 1
+        value, data = row
+        return data if data is not None else json.loads(value)
+
+    def put(self, personality: str, headline: str, stage: str, value: Any):
+        """
+        Records the result of a finished stage. bytes are stored as-is; any
+        other value must be JSON serializable.
+        """
+        if isinstance(value, bytes):
+            text, data = None, value
+        else:
+            text, data = json.dumps(value), None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, personality, stage, value, data, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (headline_key(headline), personality, stage, text, data, time.time()),
+            )
+            self.stats["saved"] += 1
+
+    def clear(self, personality: str, headline: str):
+        """
+        Drops every checkpoint of one article.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE key = ? AND personality = ?",
+                               (headline_key(headline), personality))
+
+    def clear_all(self) -> int:
+        """
+        Drops every checkpoint (e.g. --fresh). Returns the number removed.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM checkpoints").rowcount
+
+    def purge(self) -> int:
+        """
+        Deletes expired checkpoints. Returns the number removed.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM checkpoints WHERE created_at < ?",
+                                      (time.time() - self.ttl_seconds,)).rowcount
+
+    def pending(self) -> int:
+        """
+        Number of articles with checkpoints, i.e. left unfinished by earlier runs.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT key, personality FROM checkpoints)").fetchone()[0]
+
+    def summary(self) -> str:
+        return f"Checkpoints: {self.stats['resumed']} stages resumed, {self.stats['saved']} saved"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_checkpoint_store(path: Optional[str], ttl_hours: Optional[float] = None) -> CheckpointStore:
+    """
+    Opens the checkpoint store next to the history and purges expired entries.
+
+    Args:
+        path: The history database path (None for an in-memory store).
+        ttl_hours: Checkpoint lifetime. Defaults to CHECKPOINT_TTL_HOURS or
+            DEFAULT_CHECKPOINT_TTL_HOURS.
+
+    Returns:
+        The opened CheckpointStore.
+    """
+    if ttl_hours is None:
+        ttl_hours = float(os.getenv("CHECKPOINT_TTL_HOURS", DEFAULT_CHECKPOINT_TTL_HOURS))
+    store = CheckpointStore(path, ttl_seconds=ttl_hours * 3600)
+    purge_checkpoints(store)
+    return store
+
+def purge_checkpoints(store: CheckpointStore) -> int:
+    """
+    Purges the expired checkpoints of a store. Returns the number removed.
+    """
+    purged = store.purge()
+    if purged:
+        print(f"Purged {purged} checkpoints older than {store.ttl_seconds / 3600:g} hours.")
+    return purged
@@ -0,0 +1,321 @@
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from feed_reader import FeedEntry
+from pipeline import StoryPipeline, log
+from scraper import FeedCache, fetch_sources
+import telemetry
+
+DEFAULT_STATUS_FILE = "daemon_status.json"
+
+# Poll interval bounds in seconds, and the interval for a feed whose cadence
+# is not known yet.
+MIN_POLL_INTERVAL = 120
+MAX_POLL_INTERVAL = 3600
+DEFAULT_POLL_INTERVAL = 900
+
+# A feed is polled at this fraction of its mean gap between entries, so a
+# new entry waits half a gap on average.
+POLL_FRACTION = 0.5
+# Weight of the latest gap in the running mean.
+GAP_ALPHA = 0.3
+# Interval growth after a poll that found nothing new.
+POLL_BACKOFF = 1.5
+# How often expired history entries, checkpoints and published outbox items
+# are purged while the daemon runs, in seconds.
+PURGE_INTERVAL = 3600
+# Entry keys remembered per feed to tell new entries from old ones.
+SEEN_LIMIT = 500
+
+def entry_key(entry: FeedEntry) -> str:
+    return entry.guid or entry.link or entry.title
+
+def published_at(entry: FeedEntry) -> Optional[float]:
+    if not entry.published:
+        return None
+    try:
+        moment = datetime.fromisoformat(entry.published)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+class FeedSchedule:
+    """
+    Polling schedule for one feed, adapted to how often it publishes. The
+    mean gap between entries is learned from their publish dates (or, for
+    feeds without dates, from when new entries were first seen) and the
+    feed is polled at POLL_FRACTION of it. Polls that find nothing new back
+    off by POLL_BACKOFF, up to max_interval.
+    """
+
+    def __init__(self, url: str, min_interval: float = MIN_POLL_INTERVAL, max_interval: float = MAX_POLL_INTERVAL,
+                 interval: float = DEFAULT_POLL_INTERVAL):
+        self.url = url
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = self._clamp(interval)
+        self.next_poll = 0.0
+        self.mean_gap = None
+        self.polls = 0
+        self.last_poll = None
+        self.last_new = None
+        self.new_entries = 0
+        self._latest = None  # newest publish date (or arrival time) seen
+        self._seen = {}
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _learn(self, gap: float):
+        if gap > 0:
+            self.mean_gap = gap if self.mean_gap is None else self.mean_gap + GAP_ALPHA * (gap - self.mean_gap)
+
+    def observe(self, entries: List[FeedEntry], now: float) -> List[FeedEntry]:
+        """
+        Records a poll's entries, updates the cadence estimate and schedules
+        the next poll.
+
+        Returns:
+            The entries not seen in earlier polls (every entry on the first poll).
+        """
+        new = [entry for entry in entries if entry_key(entry) not in self._seen]
+        for entry in new:
+            self._seen[entry_key(entry)] = None
+        while len(self._seen) > SEEN_LIMIT:
+            del self._seen[next(iter(self._seen))]
+
+        stamps = sorted(t for t in (published_at(entry) for entry in new) if t is not None)
+        if self.polls == 0:
+            # Seed the cadence from the gaps between the entries the feed shows.
+            for earlier, later in zip(stamps, stamps[1:]):
+                self._learn(later - earlier)
+            self._latest = stamps[-1] if stamps else now
+        elif new:
+            if not stamps:
+                # No dates: the entries arrived somewhere since the last one we saw.
+                stamps = [now] * len(new)
+            for stamp in stamps:
+                if self._latest is not None and stamp > self._latest:
+                    self._learn(stamp - self._latest)
+                    self._latest = stamp
+            self.last_new = now
+            self.new_entries += len(new)
+
+        if self.polls and not new:
+            self.interval = self._clamp(self.interval * POLL_BACKOFF)
+        elif self.mean_gap is not None:
+            self.interval = self._clamp(self.mean_gap * POLL_FRACTION)
+
+        self.polls += 1
+        self.last_poll = now
+        self.next_poll = now + self.interval
+        return new
+
+    def forget(self, entry: FeedEntry):
+        """
+        Treats an entry as unseen again, so the next poll hands it out anew
+        (used when its story failed).
+        """
+        self._seen.pop(entry_key(entry), None)
+
+    def status(self) -> Dict:
+        return {
+            "interval": round(self.interval, 1),
+            "mean_gap": round(self.mean_gap, 1) if self.mean_gap is not None else None,
+            "polls": self.polls,
+            "new_entries": self.new_entries,
+            "last_poll": self.last_poll,
+            "last_new": self.last_new,
+            "next_poll": self.next_poll,
+        }
+
+class Daemon:
+    """
+    Long-running mode: keeps one process (and its model, search and
+    WordPress clients, history and caches) alive, polls each feed on its
+    own adaptive schedule and runs new entries through the personalities
+    that subscribe to the feed.
+
+    SIGTERM or SIGINT stops it gracefully: no new work is started, the
+    stories in flight are finished and the status file is marked stopped.
+    A second signal exits immediately.
+    """
+
+    def __init__(self, pipelines: List[StoryPipeline], subscriptions: Dict[str, List[str]],
+                 status_path: Optional[str] = DEFAULT_STATUS_FILE, min_interval: float = MIN_POLL_INTERVAL,
+                 max_interval: float = MAX_POLL_INTERVAL, cache: Optional[FeedCache] = None):
+        self.pipelines = {pipeline.personality: pipeline for pipeline in pipelines}
+        self.subscribers = {}
+        for personality, urls in subscriptions.items():
+            for url in urls:
+                self.subscribers.setdefault(url, []).append(personality)
+        self.schedules = {url: FeedSchedule(url, min_interval, max_interval) for url in self.subscribers}
+        self.status_path = status_path
+        self.cache = cache if cache is not None else FeedCache()
+        self.state = "starting"
+        self.started_at = time.time()
+        self.stats = {"cycles": 0, "polls": 0, "new_entries": 0, "stories": 0, "errors": 0}
+        self._stop = threading.Event()
+        self._signal = None
+        self._report_lock = threading.Lock()
+        self._purged_at = time.time()
+
+    def stop(self):
+        if self.state != "stopped":
+            self.state = "stopping"
+        self._stop.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def _handle_signal(self, signum, frame):
+        # Nothing is printed here: the interrupted code may be writing to
+        # stdout or hold the log lock. run() reports the signal.
+        signal.signal(signum, signal.SIG_DFL)
+        self._signal = signum
+        self.stop()
+
+    def _watch_signals(self):
+        # Reports a signal as soon as it has stopped the daemon.
+        self._stop.wait()
+        self._report_signal()
+
+    def _report_signal(self):
+        with self._report_lock:
+            signum, self._signal = self._signal, None
+        if signum is not None:
+            log("", f"Received {signal.Signals(signum).name}; finishing the stories in flight before exiting "
+                    f"(send it again to exit now).")
+
+    def purge_expired(self, now: Optional[float] = None):
+        """
+        Purges expired history entries, checkpoints and published outbox
+        items, as a run does at startup. Runs every PURGE_INTERVAL from the
+        polling loop, so the daemon's long-lived state stays bounded.
+        """
+        states = {id(pipeline.shared): pipeline.shared for pipeline in self.pipelines.values()}
+        for shared in states.values():
+            shared.purge_expired()
+        self._purged_at = time.time() if now is None else now
+
+    def run(self) -> int:
+        """
+        Polls and processes until stop() is called or a signal arrives.
+
+        Returns:
+            The number of new stories handled.
+        """
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, self._handle_signal)
+            threading.Thread(target=self._watch_signals, daemon=True, name="daemon-signals").start()
+        log("", f"Daemon started: watching {len(self.schedules)} feeds for {', '.join(self.pipelines)}.")
+        self.state = "running"
+        while not self.stopping:
+            try:
+                self.run_once()
+                if time.time() - self._purged_at >= PURGE_INTERVAL:
+                    self.purge_expired()
+            except Exception as e:
+                # Keep the daemon alive; the failed feeds are retried on their next poll.
+                self.stats["errors"] += 1
+                log("", f"Error in polling cycle: {e}")
+            self.write_status()
+            if self.stopping:
+                break
+            wait = min(schedule.next_poll for schedule in self.schedules.values()) - time.time()
+            self._stop.wait(max(1.0, wait))
+        self._report_signal()
+        self.state = "stopped"
+        self.write_status()
+        log("", f"Daemon stopped after {self.stats['cycles']} cycles, {self.stats['stories']} new stories.")
+        return self.stats["stories"]
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        """
+        Polls the feeds that are due and processes their new entries.
+
+        Returns:
+            The number of new stories handled.
+        """
+        now = time.time() if now is None else now
+        due = [url for url, schedule in self.schedules.items() if schedule.next_poll <= now]
+        if not due:
+            return 0
+        self.stats["cycles"] += 1
+        self.stats["polls"] += len(due)
+        entries_by_feed = fetch_sources(due, self.cache)
+
+        new_by_personality = {}
+        polled_at = time.time()
+        for url in due:
+            new = self.schedules[url].observe(entries_by_feed.get(url, []), polled_at)
+            self.stats["new_entries"] += len(new)
+            for personality in self.subscribers[url]:
+                new_by_personality.setdefault(personality, []).extend(new)
+        new_by_personality = {personality: entries for personality, entries in new_by_personality.items() if entries}
+        if not new_by_personality:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=len(new_by_personality)) as executor:
+            counts = list(executor.map(lambda item: self._process(*item), new_by_personality.items()))
+        self.stats["stories"] += sum(counts)
+        return sum(counts)
+
+    def _process(self, personality: str, entries: List[FeedEntry]) -> int:
+        """
+        Runs a personality's new entries in chunks of its concurrency, so a
+        shutdown request waits for at most one chunk. Entries whose story
+        failed are forgotten by the personality's feeds, so they are retried
+        on the next poll, as a cron run would.
+        """
+        pipeline = self.pipelines[personality]
+        feeds = [self.schedules[url] for url, personalities in self.subscribers.items() if personality in personalities]
+        handled = 0
+        for start in range(0, len(entries), pipeline.concurrency):
+            if self.stopping:
+                break
+            handled += pipeline.run(entries[start:start + pipeline.concurrency])
+            for entry in pipeline.failed:
+                for schedule in feeds:
+                    schedule.forget(entry)
+        return handled
+
+    def status(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "state": self.state,
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            **self.stats,
+            "feeds": {url: schedule.status() for url, schedule in self.schedules.items()},
+        }
+
+    def write_status(self):
+        """
+        Writes the health/status file (atomically), and refreshes the
+        Prometheus textfile when telemetry exports one.
+        """
+        if self.status_path:
+            tmp_path = f"{self.status_path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.status(), f, indent=2)
+                os.replace(tmp_path, self.status_path)
+            except OSError as e:
+                log("", f"Warning: Could not write status file {self.status_path}: {e}")
+        active = telemetry.get_telemetry()
+        if active is not None and active.prometheus_path:
+            try:
+                active.write_prometheus()
+            except OSError as e:
+                log("", f"Warning: Could not write {active.prometheus_path}: {e}")
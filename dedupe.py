@@ -0,0 +1,234 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from history_store import HISTORY_DB, normalize_headline
+
+# MinHash signature length and LSH banding. 32 bands of 2 rows catch pairs
+# with a Jaccard similarity of roughly 0.2 and up as candidates; the
+# threshold check on the estimated similarity then decides.
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+# Reworded coverage of one event scores about 0.7; distinct stories that
+# share most of a headline's words ("holds rates" / "raises rates") can
+# reach 0.5.
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_WINDOW_HOURS = 48
+# How often entries older than the window are dropped, in seconds.
+PRUNE_INTERVAL = 3600
+
+# Only the start of the feed summary is used; later sentences drift between outlets.
+SUMMARY_WORDS = 40
+
+# Letters and digits of any script. Chinese and Japanese are written without
+# spaces, so each of their characters is a word of its own (and the bigrams
+# become character bigrams).
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_WORD_RE = re.compile(rf"[{_CJK}]|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or over says said
+than that the their this to under up was were will with after amid into new
+""".split())
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > 4 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+def shingles(text: str) -> set:
+    """
+    Returns the word unigrams and bigrams of a text, ignoring stopwords and
+    crudely stemming plurals and verb endings.
+    """
+    words = [_stem(w) for w in _WORD_RE.findall(normalize_headline(text))
+             if (len(w) > 1 or _CJK_RE.match(w)) and w not in STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def minhash(tokens: set) -> Optional[Tuple[int, ...]]:
+    """
+    Computes a MinHash signature. Each token is hashed once with SHAKE-128
+    into NUM_PERM 32-bit values, one per permutation.
+
+    Returns:
+        The signature, or None for an empty token set: a text with nothing
+        to compare (only stopwords, say) is never a near-duplicate.
+    """
+    if not tokens:
+        return None
+    rows = [array("I", hashlib.shake_128(token.encode("utf-8")).digest(4 * NUM_PERM)) for token in tokens]
+    return tuple(min(column) for column in zip(*rows))
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """
+    Estimates the Jaccard similarity of two signatures.
+    """
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+def entry_text(title: str, summary: str = "") -> str:
+    return f"{title} {' '.join((summary or '').split()[:SUMMARY_WORDS])}"
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over recent headlines and feed summaries, scoped per
+    personality. Finds stories that cover the same event under a different
+    headline before any model call is made.
+
+    Only processed stories are indexed (see record()), so a story that fails
+    never blocks its own retry. Stories in flight are held separately (see
+    hold()) so entries of the same run are still compared with each other.
+    Signatures are persisted in the history database so the index survives
+    restarts; only entries inside the time window are loaded.
+    """
+
+    def __init__(self, path: Optional[str] = HISTORY_DB, threshold: float = DEFAULT_THRESHOLD,
+                 window_hours: float = DEFAULT_WINDOW_HOURS):
+        self.threshold = threshold
+        self.window = window_hours * 3600
+        self._lock = threading.Lock()
+        self._entries: List[Tuple[str, str, float, Tuple[int, ...]]] = []
+        self._buckets: Dict[Tuple, List[int]] = {}
+        self._held: Dict[Tuple[str, str], Tuple[float, Tuple[int, ...]]] = {}  # (personality, headline) -> (held at, signature)
+        self._pruned_at = time.time()
+        self._conn = None
+
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._conn:
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS signatures (
+                        personality TEXT NOT NULL,
+                        headline TEXT NOT NULL,
+                        seen_at REAL NOT NULL,
+                        signature BLOB NOT NULL
+                    )
+                """)
+                self._conn.execute("CREATE INDEX IF NOT EXISTS signatures_seen_idx ON signatures (seen_at)")
+                self._conn.execute("DELETE FROM signatures WHERE seen_at < ?", (time.time() - self.window,))
+            for personality, headline, seen_at, blob in self._conn.execute(
+                    "SELECT personality, headline, seen_at, signature FROM signatures"):
+                self._insert(personality, headline, seen_at, tuple(array("I", blob)))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _insert(self, personality: str, headline: str, seen_at: float, signature: Tuple[int, ...]):
+        index = len(self._entries)
+        self._entries.append((personality, headline, seen_at, signature))
+        for band in range(BANDS):
+            key = (personality, band, signature[band * ROWS:(band + 1) * ROWS])
+            self._buckets.setdefault(key, []).append(index)
+
+    def prune(self, now: Optional[float] = None):
+        """
+        Drops the entries (and held stories) older than the window, in memory
+        and on disk. Runs
+        on its own every PRUNE_INTERVAL as stories are added, so a
+        long-running process keeps only the window in memory.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.window
+        with self._lock:
+            entries = [entry for entry in self._entries if entry[2] >= cutoff]
+            self._entries, self._buckets = [], {}
+            for entry in entries:
+                self._insert(*entry)
+            self._held = {key: held for key, held in self._held.items() if held[0] >= cutoff}
+            self._pruned_at = now
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM signatures WHERE seen_at < ?", (cutoff,))
+
+    def _maybe_prune(self):
+        if time.time() - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def find(self, title: str, summary: str, personality: str) -> Optional[Tuple[str, float]]:
+        """
+        Looks for a recent story by the same personality about the same event.
+
+        Returns:
+            A tuple of (matching_headline, similarity), or None.
+        """
+        signature = minhash(shingles(entry_text(title, summary)))
+        if signature is None:
+            return None
+        return self._find(signature, personality)
+
+    def _find(self, signature: Tuple[int, ...], personality: str,
+              include_held: bool = False) -> Optional[Tuple[str, float]]:
+        cutoff = time.time() - self.window
+        best = None
+        with self._lock:
+            if include_held:
+                for (owner, headline), (_, other) in self._held.items():
+                    score = similarity(signature, other)
+                    if owner == personality and score >= self.threshold and (best is None or score > best[1]):
+                        best = (headline, score)
+            candidates = set()
+            for band in range(BANDS):
+                candidates.update(self._buckets.get((personality, band, signature[band * ROWS:(band + 1) * ROWS]), ()))
+            for index in candidates:
+                _, headline, seen_at, other = self._entries[index]
+                if seen_at < cutoff:
+                    continue
+                score = similarity(signature, other)
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (headline, score)
+        return best
+
+    def hold(self, title: str, summary: str, personality: str) -> Optional[Tuple[str, float]]:
+        """
+        Looks up a story among the indexed and held ones and, if it is not a
+        near-duplicate, holds it until record() or release() so later
+        entries of the same run are compared with it.
+
+        Returns:
+            A tuple of (matching_headline, similarity), or None.
+        """
+        self._maybe_prune()
+        signature = minhash(shingles(entry_text(title, summary)))
+        if signature is None:
+            return None
+        match = self._find(signature, personality, include_held=True)
+        if match is None:
+            with self._lock:
+                self._held[(personality, title)] = (time.time(), signature)
+        return match
+
+    def release(self, title: str, personality: str):
+        """
+        Drops a held story whose processing failed.
+        """
+        with self._lock:
+            self._held.pop((personality, title), None)
+
+    def record(self, title: str, summary: str, personality: str):
+        """
+        Indexes a processed story and persists its signature.
+        """
+        self._maybe_prune()
+        signature = minhash(shingles(entry_text(title, summary)))
+        seen_at = time.time()
+        with self._lock:
+            self._held.pop((personality, title), None)
+            if signature is None:
+                return
+            self._insert(personality, title, seen_at, signature)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("INSERT INTO signatures VALUES (?, ?, ?, ?)",
+                                       (personality, title, seen_at, array("I", signature).tobytes()))
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
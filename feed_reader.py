@@ -0,0 +1,172 @@
+import calendar
+import html
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+# Summaries are only used as prompt context, so keep them short.
+MAX_SUMMARY_CHARS = 1000
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+@dataclass
+class FeedEntry:
+    """
+    A single feed item.
+    """
+    title: str
+    link: str = ""
+    published: Optional[str] = None  # ISO 8601, UTC when the feed gives a zone
+    summary: str = ""
+    guid: str = ""
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FeedEntry":
+        return cls(**{key: data.get(key) for key in ("title", "link", "published", "summary", "guid")})
+
+class UnsupportedFeed(ValueError):
+    """
+    Raised when a document is not RSS 2.0 or Atom and needs the feedparser fallback.
+    """
+
+def clean_text(value: Optional[str], limit: int = None) -> str:
+    """
+    Strips markup and collapses whitespace in a feed text field.
+    """
+    if not value:
+        return ""
+    text = _SPACE_RE.sub(" ", html.unescape(_TAG_RE.sub(" ", value))).strip()
+    if limit and len(text) > limit:
+        text = text[:limit].rsplit(" ", 1)[0] + "..."
+    return text
+
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)  # RSS (RFC 822)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))  # Atom (RFC 3339)
+        except ValueError:
+            return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.isoformat()
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _rss_entry(item: ET.Element) -> FeedEntry:
+    fields = {}
+    for child in item:
+        # Plain RSS elements win over namespaced extensions such as atom:link.
+        if child.tag.startswith("{"):
+            fields.setdefault(_local(child.tag), child.text or "")
+        else:
+            fields[child.tag] = child.text or ""
+    link = fields.get("link", "").strip()
+    return FeedEntry(
+        title=clean_text(fields.get("title")),
+        link=link,
+        published=_iso_date(fields.get("pubDate") or fields.get("date")),
+        summary=clean_text(fields.get("description") or fields.get("encoded"), MAX_SUMMARY_CHARS),
+        guid=fields.get("guid", "").strip() or link,
+    )
+
+def _atom_entry(entry: ET.Element) -> FeedEntry:
+    link = ""
+    for el in entry.findall(f"{ATOM_NS}link"):
+        if el.get("rel", "alternate") == "alternate":
+            link = el.get("href", "")
+            break
+
+    def text(name):
+        el = entry.find(f"{ATOM_NS}{name}")
+        return el.text if el is not None else None
+
+    return FeedEntry(
+        title=clean_text(text("title")),
+        link=link,
+        published=_iso_date(text("published") or text("updated")),
+        summary=clean_text(text("summary") or text("content"), MAX_SUMMARY_CHARS),
+        guid=(text("id") or link).strip(),
+    )
+
+def iter_entries(chunks: Iterable[bytes], limit: int = None) -> Iterator[FeedEntry]:
+    """
+    Incrementally parses an RSS 2.0 or Atom document, yielding entries as soon
+    as each one is complete. Stops pulling chunks once `limit` entries have been
+    yielded, so the rest of the document is never read or parsed.
+
+    Args:
+        chunks: The document as an iterable of byte chunks (e.g. a streamed response).
+        limit: Maximum number of entries to yield, or None for all.
+
+    Raises:
+        UnsupportedFeed: If the root element is not <rss> or an Atom <feed>.
+        xml.etree.ElementTree.ParseError: If the document is not well-formed XML.
+    """
+    if limit is not None and limit <= 0:
+        return
+
+    parser = ET.XMLPullParser(events=("start", "end"))
+    kind = None
+    count = 0
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                if kind is None:
+                    if elem.tag == "rss":
+                        kind = "rss"
+                    elif elem.tag == f"{ATOM_NS}feed":
+                        kind = "atom"
+                    else:
+                        raise UnsupportedFeed(f"Unsupported feed root element <{_local(elem.tag)}>")
+                continue
+
+            if kind == "rss" and elem.tag == "item":
+                yield _rss_entry(elem)
+            elif kind == "atom" and elem.tag == f"{ATOM_NS}entry":
+                yield _atom_entry(elem)
+            else:
+                continue
+
+            # Drop the parsed subtree so memory stays flat for long feeds.
+            elem.clear()
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+    parser.close()
+    if kind is None:
+        raise UnsupportedFeed("Empty feed document")
+
+def entry_from_feedparser(entry) -> FeedEntry:
+    """
+    Converts a feedparser entry into a FeedEntry.
+    """
+    published = None
+    parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+    if parsed:
+        published = datetime.fromtimestamp(calendar.timegm(parsed), tz=timezone.utc).isoformat()
+    link = entry.get("link", "")
+    return FeedEntry(
+        title=clean_text(entry.title),
+        link=link,
+        published=published,
+        summary=clean_text(entry.get("summary"), MAX_SUMMARY_CHARS),
+        guid=entry.get("id") or link,
+    )
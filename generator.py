@@ -1,8 +1,125 @@
+import contextvars
+import json
 import os
-from openai import OpenAI
-from typing import Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from response_cache import is_replay
+from ai_client import chat_completion, chat_completion_stream
+from typing import Callable, Dict, List, Optional, Tuple
+from telemetry import traced
 
-def generate_story(headline: str, personality_context: str, thesis: str = "", research_data: str = "") -> Tuple[str, str]:
+# Sectioned generation: outline size and per-section retries.
+MAX_SECTIONS = 6
+SECTION_WORKERS = 4
+SECTION_RETRIES = 2
+
+TITLE_MARKER = "TITLE:"
+CONTENT_MARKER = "CONTENT:"
+
+class MalformedStory(ValueError):
+    """
+    Raised when a streamed story clearly does not follow the TITLE/CONTENT format.
+    """
+
+class StoryStreamParser:
+    """
+    Incremental parser for the TITLE:/CONTENT: story format. Feed it the
+    completion text as it streams in; it calls on_title as soon as the title
+    line is complete and buffers the content after the CONTENT: marker.
+
+    Output that is clearly malformed raises MalformedStory as soon as it is
+    detected (no TITLE: near the start, a runaway title, or no CONTENT: soon
+    after the title), so the caller can abort the request instead of paying
+    for the rest of it. on_title may also return False to reject the title.
+    """
+
+    def __init__(self, on_title: Optional[Callable[[str], Optional[bool]]] = None,
+                 max_preamble: int = 200, max_title: int = 300, max_gap: int = 200):
+        self.on_title = on_title
+        self.max_preamble = max_preamble
+        self.max_title = max_title
+        self.max_gap = max_gap
+        self.title = None
+        self._head = ""
+        self._content = None
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.title_at = None
+
+    def feed(self, text: str):
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        if self._content is not None:
+            self._content.append(text)
+            return
+        self._head += text
+        self._parse_head()
+
+    def _parse_head(self):
+        start = self._head.find(TITLE_MARKER)
+        if start < 0:
+            if len(self._head) > self.max_preamble:
+                raise MalformedStory(f"no {TITLE_MARKER} line in the first {self.max_preamble} characters")
+            return
+
+        body = self._head[start + len(TITLE_MARKER):]
+        content_at = body.find(CONTENT_MARKER)
+        if self.title is None:
+            line = (body if content_at < 0 else body[:content_at]).lstrip()
+            if "\n" in line:
+                self._set_title(line.split("\n", 1)[0].strip())
+            elif content_at >= 0:
+                self._set_title(line.strip())
+            elif len(line) > self.max_title:
+                raise MalformedStory(f"title line longer than {self.max_title} characters")
+            else:
+                return
+
+        if content_at >= 0:
+            self._content = [body[content_at + len(CONTENT_MARKER):]]
+        elif len(body) - len(self.title) > self.max_gap + len(CONTENT_MARKER):
+            raise MalformedStory(f"no {CONTENT_MARKER} after the title")
+
+    def _set_title(self, title: str):
+        self.title = title
+        self.title_at = time.monotonic()
+        if title and self.on_title and self.on_title(title) is False:
+            raise MalformedStory(f"title rejected: {title[:80]}")
+
+    def close(self) -> Tuple[str, str]:
+        """
+        Finishes parsing once the stream has ended.
+
+        Returns:
+            A tuple of (title, content); title is empty if the model left it blank.
+        """
+        if self._content is None:
+            raise MalformedStory(f"response ended before {CONTENT_MARKER}")
+        content = "".join(self._content).strip()
+        if not content:
+            raise MalformedStory("response has no content")
+        return self.title or "", content
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """
+        Seconds from the start of the request to the first token, to the
+        complete title and to now. Unreached milestones are None.
+        """
+        def since(moment):
+            return moment - self.started_at if moment is not None else None
+        return {
+            "ttft": since(self.first_token_at),
+            "time_to_title": since(self.title_at),
+            "total": since(time.monotonic()),
+        }
+
+@traced("generate", failed=lambda result: result[0] == "Error")
+def generate_story(headline: str, personality_context: str, thesis: str = "", research_data: str = "",
+                   stream: bool = False, on_title: Optional[Callable[[str], Optional[bool]]] = None,
+                   metrics: Optional[Dict] = None) -> Tuple[str, str]:
     """
     Generates a story based on a single headline, personality context, and research data.
     
@@ -11,19 +128,20 @@ def generate_story(headline: str, personality_context: str, thesis: str = "", re
         personality_context: The specific instructions for the personality.
         thesis: The derived thesis statement.
         research_data: Formatted research findings and citations.
+        stream: Stream the completion through StoryStreamParser instead of
+            waiting for the whole response.
+        on_title: Streaming only. Called with the title as soon as it is
+            complete; returning False aborts the request.
+        metrics: Streaming only. Filled with the parser's timing metrics
+            (ttft, time_to_title, total).
         
     Returns:
         A tuple containing (title, content).
     """
     
-    api_key = os.getenv("AI_API_KEY")
-    base_url = os.getenv("AI_BASE_URL", "https://api.openai.com/v1") # Default to OpenAI, but allow override
-    
-    if not api_key:
+    if not os.getenv("AI_API_KEY") and not is_replay():
         raise ValueError("AI_API_KEY environment variable is not set.")
         
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
     system_prompt = "You are a creative journalist and storyteller. You write detailed, well-researched articles."
     
     user_prompt = f"""
@@ -60,17 +178,17 @@ def generate_story(headline: str, personality_context: str, thesis: str = "", re
     CONTENT: [Your story content here, including Works Cited]
     """
     
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    if stream:
+        return _stream_story(headline, messages, on_title, metrics)
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-5.1", # Or a configurable model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-        )
-        
-        full_text = response.choices[0].message.content
+        full_text = chat_completion("generate", messages=messages, temperature=0.7,
+                                    validate=lambda text: TITLE_MARKER in text and "CONTENT:" in text)
         
         # Parse title and content
         title = headline # Default fallback
@@ -90,3 +208,240 @@ def generate_story(headline: str, personality_context: str, thesis: str = "", re
         
     except Exception as e:
         return "Error", f"Error generating story: {e}"
+
+def _stream_story(headline: str, messages, on_title, metrics: Optional[Dict]) -> Tuple[str, str]:
+    parser = StoryStreamParser(on_title)
+    try:
+        chunks = chat_completion_stream("generate", messages=messages, temperature=0.7)
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+        finally:
+            # Closing the generator early also closes the HTTP stream.
+            chunks.close()
+        title, content = parser.close()
+        return title or headline, content
+    except MalformedStory as e:
+        return "Error", f"Aborted malformed story: {e}"
+    except Exception as e:
+        return "Error", f"Error generating story: {e}"
+    finally:
+        if metrics is not None:
+            metrics.update(parser.metrics())
+
+def generate_outline(headline: str, personality_context: str, thesis: str = "", research_data: str = "") -> Tuple[str, List[Dict]]:
+    """
+    Plans a sectioned article with one fast model call.
+
+    Returns:
+        A tuple of (title, sections), where each section is a dict with a
+        'heading' and the 'points' it should cover.
+
+    Raises:
+        ValueError: If the model does not return a usable outline.
+    """
+    system_prompt = "You are an editor planning a detailed, well-researched article. Respond in JSON."
+    user_prompt = f"""
+    Headline: "{headline}"
+
+    Thesis Statement:
+    {thesis}
+
+    Research Data:
+    {research_data}
+
+    Personality/Style Instructions:
+    {personality_context}
+
+    Plan an engaging, cohesive 800-word article that supports the thesis with the research.
+    REWRITE the title to match the personality. Do NOT use the original headline.
+    Split the article into 3 to {MAX_SECTIONS} sections, each with a heading and the points it covers.
+    Do not include a Works Cited section; it is added separately.
+
+    Return JSON of the form:
+    {{"title": "...", "sections": [{{"heading": "...", "points": "..."}}]}}
+    """
+    raw = chat_completion(
+        "outline",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.7,
+    )
+    outline = json.loads(raw)
+    sections = [
+        {"heading": str(section.get("heading", "")).strip(), "points": str(section.get("points", "")).strip()}
+        for section in outline.get("sections") or []
+        if isinstance(section, dict) and section.get("heading")
+    ][:MAX_SECTIONS]
+    if not sections:
+        raise ValueError("outline has no sections")
+    return str(outline.get("title") or "").strip(), sections
+
+def generate_section(headline: str, personality_context: str, thesis: str, research_data: str,
+                     title: str, sections: List[Dict], index: int) -> str:
+    """
+    Writes the body of one outlined section as HTML paragraphs.
+
+    Raises:
+        ValueError: If the model returns an empty section.
+    """
+    section = sections[index]
+    plan = "\n".join(f"    {i}. {s['heading']}: {s['points']}" for i, s in enumerate(sections, 1))
+    system_prompt = "You are a creative journalist and storyteller. You write detailed, well-researched articles."
+    user_prompt = f"""
+    You are writing one section of the article "{title}", based on the news headline "{headline}".
+
+    Thesis Statement:
+    {thesis}
+
+    Research Data:
+    {research_data}
+
+    Personality/Style Instructions:
+    {personality_context}
+
+    Article outline:
+{plan}
+
+    Write ONLY section {index + 1}, "{section['heading']}", covering: {section['points']}
+    Requirements:
+    - Write 3-4 substantial paragraphs using <p> tags, ready for a WordPress HTML editor.
+    - Cite your sources in the text using MLA format (Author/Title).
+    - Do NOT repeat the section heading, do NOT cover other sections, and do NOT add a Works Cited section.
+    - DO NOT use Markdown formatting.
+    """
+    body = chat_completion(
+        "generate",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.7,
+    ).strip()
+    if not body:
+        raise ValueError(f"empty section '{section['heading']}'")
+    return body
+
+@traced("generate", failed=lambda result: result[0] == "Error")
+def generate_sectioned_story(headline: str, personality_context: str, thesis: str = "", research_data: str = "",
+                             works_cited: str = "", limit=None, max_workers: int = SECTION_WORKERS,
+                             retries: int = SECTION_RETRIES) -> Tuple[str, str]:
+    """
+    Generates a story as an outline followed by its sections written in
+    parallel, then stitches them together with a shared Works Cited section.
+    A failed section is retried on its own instead of regenerating the whole
+    article. Falls back to generate_story() if the outline cannot be made.
+
+    Args:
+        headline: A single news headline.
+        personality_context: The specific instructions for the personality.
+        thesis: The derived thesis statement.
+        research_data: Formatted research findings and citations.
+        works_cited: HTML Works Cited section appended to the article.
+        limit: Optional semaphore held around each model call, so the
+            sections respect the pipeline's LLM concurrency limit.
+        max_workers: Maximum sections written at the same time.
+        retries: Extra attempts per failed section.
+
+    Returns:
+        A tuple containing (title, content).
+    """
+    if not os.getenv("AI_API_KEY") and not is_replay():
+        raise ValueError("AI_API_KEY environment variable is not set.")
+    limit = limit or nullcontext()
+
+    try:
+        with limit:
+            title, sections = generate_outline(headline, personality_context, thesis, research_data)
+    except Exception as e:
+        print(f"Warning: Could not outline story, generating it in one call: {e}")
+        with limit:
+            return generate_story(headline, personality_context, thesis, research_data)
+
+    def write(index: int) -> str:
+        for attempt in range(retries + 1):
+            try:
+                with limit:
+                    return generate_section(headline, personality_context, thesis, research_data,
+                                            title or headline, sections, index)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                print(f"Warning: Retrying section '{sections[index]['heading']}': {e}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sections)))) as executor:
+            # Each section runs in a copy of this context so usage metering sees it.
+            futures = [executor.submit(contextvars.copy_context().run, write, i) for i in range(len(sections))]
+            bodies = [future.result() for future in futures]
+    except Exception as e:
+        return "Error", f"Error generating story: {e}"
+
+    parts = [f"<h2>{section['heading']}</h2>\n{body}" for section, body in zip(sections, bodies)]
+    if works_cited:
+        parts.append(works_cited)
+    return title or headline, "\n\n".join(parts)
+
+@traced("generate", failed=lambda result: result[1] == "Error")
+def generate_fused_story(headline: str, personality_context: str, summary: str = "") -> Tuple[str, str, str]:
+    """
+    Derives the thesis and writes the story in one structured call, using the
+    feed entry's summary as context instead of web research. This saves the
+    analyze round trip and the searches for feeds where research adds little.
+
+    Args:
+        headline: A single news headline.
+        personality_context: The specific instructions for the personality.
+        summary: The feed entry's summary, used as the only source.
+
+    Returns:
+        A tuple containing (thesis, title, content); title is "Error" on failure.
+    """
+    if not os.getenv("AI_API_KEY") and not is_replay():
+        raise ValueError("AI_API_KEY environment variable is not set.")
+
+    system_prompt = "You are a creative journalist and storyteller. You write detailed, engaging articles. Respond in JSON."
+    user_prompt = f"""
+    Here is a news headline: "{headline}"
+
+    Summary from the news feed:
+    {summary or "No summary available."}
+
+    Personality/Style Instructions:
+    {personality_context}
+
+    Task:
+    1. Derive a thesis statement about this headline that aligns with the personality.
+    2. Write an engaging, cohesive 800-word story that supports the thesis.
+
+    Requirements:
+    - Base the facts on the headline and summary; do not invent sources or citations.
+    - Structure the article with multiple sections using <h2> headings.
+    - Each section MUST contain multiple paragraphs (aim for 3-4 paragraphs per section).
+    - Use HTML tags, not Markdown; the output should be ready to paste into a WordPress HTML editor.
+    - REWRITE the title to match the personality. Do NOT use the original headline.
+
+    Output Format (JSON):
+    {{"thesis": "...", "title": "...", "content": "..."}}
+    """
+
+    try:
+        raw = chat_completion(
+            "generate",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.7,
+        )
+        data = json.loads(raw)
+        content = str(data.get("content") or "").strip()
+        if not content:
+            raise ValueError("response has no content")
+        return str(data.get("thesis") or "").strip(), str(data.get("title") or "").strip() or headline, content
+    except Exception as e:
+        return "", "Error", f"Error generating story: {e}"
@@ -0,0 +1,247 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# At most this fraction of a stage's calls (plus one) may be hedged, so a
+# model that is slow across the board is not sent twice the traffic.
+HEDGE_MAX_FRACTION = 0.2
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.fallback_wins = 0
+        # Losing calls that were cancelled mid-flight, and how long they had
+        # been running when they were cut short; losing calls that answered
+        # before the cancellation took effect (and were billed in full).
+        self.cut_short = 0
+        self.cut_short_seconds = 0.0
+        self.finished_losers = 0
+
+class Call:
+    """
+    One attempt of a hedged call. The hedger cancels the attempts that lost;
+    the code making the request registers, with on_cancel(), how to abort it
+    (see current_call()).
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """
+        Runs callback() when the attempt is cancelled, or at once if it
+        already was.
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+_current_call = contextvars.ContextVar("hedged_call", default=None)
+
+def current_call() -> Optional[Call]:
+    """
+    Returns the hedged attempt running in this context, or None outside of
+    hedged calls.
+    """
+    return _current_call.get()
+
+def _start(attempt: Callable[[str], T], model: str) -> Tuple[Future, Call]:
+    """
+    Runs attempt(model) on a daemon thread, in a copy of the caller's context
+    (telemetry and usage metering follow the call) where current_call() is
+    the returned Call. Daemon threads do not hold up the process exit the
+    way a ThreadPoolExecutor's workers would.
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    call = Call()
+    context = contextvars.copy_context()
+
+    def run():
+        _current_call.set(call)
+        return attempt(model)
+
+    def target():
+        try:
+            future.set_result(context.run(run))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True, name=f"hedge-{model}").start()
+    return future, call
+
+class Hedger:
+    """
+    Hedged requests for model calls with a latency budget. When the primary
+    call has not answered within its stage's budget (its p95 SLO), a second
+    call goes out, to the stage's fallback model when one is configured or
+    as a duplicate otherwise. The first valid response wins and the other
+    call is cancelled. run() returns once the loser has ended, so a caller
+    holding a concurrency slot keeps it for as long as either call is in
+    flight.
+    """
+
+    def __init__(self, max_fraction: float = HEDGE_MAX_FRACTION):
+        self.max_fraction = max_fraction
+        self.stats: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, stage: str) -> StageStats:
+        with self._lock:
+            return self.stats.setdefault(stage, StageStats())
+
+    def run(self, stage: str, budget: Optional[float], attempt: Callable[[str], T], model: str,
+            fallback: Optional[str] = None, validate: Optional[Callable[[T], bool]] = None,
+            discard: Optional[Callable[[T], None]] = None) -> T:
+        """
+        Calls attempt(model), hedging it after `budget` seconds.
+
+        Args:
+            budget: Seconds to wait for the primary call before hedging; None
+                runs the call without hedging.
+            fallback: Model for the hedge; None sends a duplicate to `model`.
+            validate: Whether a result is usable. An invalid result is only
+                returned when no other call is left to wait for.
+            discard: Called with each result that is not returned (e.g. to
+                close a stream the loser opened).
+
+        Returns:
+            The first valid result (or the primary's, if none is valid).
+
+        Raises:
+            The primary call's exception, if every call failed.
+        """
+        stats = self._stats(stage)
+        with self._lock:
+            stats.calls += 1
+        if budget is None:
+            return attempt(model)
+
+        primary, primary_call = _start(attempt, model)
+        done, _ = wait([primary], timeout=budget)
+        with self._lock:
+            allowed = stats.hedged < self.max_fraction * stats.calls + 1
+            if not done and allowed:
+                stats.hedged += 1
+        if done or not allowed:
+            return primary.result()
+
+        hedge, hedge_call = _start(attempt, fallback or model)
+        calls = {primary: primary_call, hedge: hedge_call}
+        pending = set(calls)
+        invalid = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                result = future.result()
+                if validate is None or validate(result):
+                    if future is hedge:
+                        with self._lock:
+                            stats.hedge_wins += 1
+                            stats.fallback_wins += fallback is not None
+                    self._end_losers(stats, calls, future, discard)
+                    return result
+                if invalid is None or future is primary:
+                    invalid = future
+        winner = invalid or primary
+        self._end_losers(stats, calls, winner, discard)
+        return winner.result()
+
+    def _end_losers(self, stats: StageStats, calls: Dict[Future, Call], winner: Future,
+                    discard: Optional[Callable[[T], None]]):
+        # Cancels the calls still running and waits for them to end.
+        running = {}
+        for future, call in calls.items():
+            if future is not winner and not future.done():
+                running[future] = time.monotonic() - call.started
+                call.cancel()
+        wait(running)
+        with self._lock:
+            for future, seconds in running.items():
+                if future.exception() is None:
+                    stats.finished_losers += 1
+                else:
+                    stats.cut_short += 1
+                    stats.cut_short_seconds += seconds
+        if discard is not None:
+            for future in calls:
+                if future is not winner and future.exception() is None:
+                    discard(future.result())
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for stage, s in sorted(self.stats.items()):
+                if not s.hedged:
+                    continue
+                line = (f"Hedging ({stage}): {s.hedged} of {s.calls} calls hedged, {s.hedge_wins} won by the hedge"
+                        f" ({s.fallback_wins} by the fallback model), {s.cut_short} losing calls cut short"
+                        f" after {s.cut_short_seconds:.1f}s in flight")
+                if s.finished_losers:
+                    line += f", {s.finished_losers} answered before they could be cancelled"
+                lines.append(line)
+        return lines
+
+_hedger = None
+_hedger_lock = threading.Lock()
+_enabled_override = None
+
+def configure(enabled: bool):
+    """
+    Turns hedging on or off for the rest of the process (e.g. from --hedge),
+    overriding AI_HEDGE.
+    """
+    global _enabled_override
+    _enabled_override = enabled
+
+def get_hedger() -> Optional[Hedger]:
+    """
+    Returns the process-wide Hedger, or None when hedging is off (the
+    default; enable it with AI_HEDGE=on or --hedge).
+    """
+    global _hedger
+    enabled = _enabled_override
+    if enabled is None:
+        enabled = os.getenv("AI_HEDGE", "off").lower() in ("on", "1", "true")
+    if not enabled:
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger()
+        return _hedger
+
+def reset():
+    """
+    Drops the shared Hedger and its statistics.
+    """
+    global _hedger, _enabled_override
+    with _hedger_lock:
+        _hedger = None
+        _enabled_override = None
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+
+HISTORY_DB = "history.db"
+LEGACY_HISTORY_FILE = "history.json"
+
+# Processed headlines older than this are forgotten.
+DEFAULT_TTL_DAYS = 30
+
+# Entries imported from history.json match every personality.
+ANY_PERSONALITY = "*"
+
+_SPACE_RE = re.compile(r"\s+")
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+
+def normalize_headline(headline: str) -> str:
+    """
+    Normalizes a headline so trivial differences (case, quote style,
+    whitespace) map to the same history key.
+    """
+    text = unicodedata.normalize("NFKC", headline).translate(_QUOTES).casefold()
+    return _SPACE_RE.sub(" ", text).strip()
+
+def headline_key(headline: str) -> str:
+    return hashlib.sha256(normalize_headline(headline).encode("utf-8")).hexdigest()
+
+class HistoryStore(ABC):
+    """
+    Interface for the processed-headline store. Entries are keyed by the
+    normalized headline hash plus the personality that wrote the story.
+    """
+
+    # Database file for stores that persist to disk, so related indexes can share it.
+    path = None
+
+    @abstractmethod
+    def contains(self, headline: str, personality: str) -> bool:
+        pass
+
+    @abstractmethod
+    def add(self, headline: str, personality: str):
+        pass
+
+    @abstractmethod
+    def evict(self, ttl_seconds: float) -> int:
+        """
+        Removes entries older than ttl_seconds and returns how many were removed.
+        """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def close(self):
+        pass
+
+class MemoryHistoryStore(HistoryStore):
+    """
+    In-memory store, for tests and one-off runs.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def contains(self, headline: str, personality: str) -> bool:
+        key = headline_key(headline)
+        with self._lock:
+            return (key, personality) in self._entries or (key, ANY_PERSONALITY) in self._entries
+
+    def add(self, headline: str, personality: str):
+        with self._lock:
+            self._entries.setdefault((headline_key(headline), personality), time.time())
+
+    def evict(self, ttl_seconds: float) -> int:
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            expired = [key for key, processed_at in self._entries.items() if processed_at < cutoff]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    SQLite-backed store. Lookups use the primary key index and every add is
+    committed on its own, so a crash loses at most the story in flight. WAL
+    mode and a busy timeout let several processes write to the same file.
+    """
+
+    def __init__(self, path: str = HISTORY_DB, legacy_file: str = LEGACY_HISTORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS processed (
+                    key TEXT NOT NULL,
+                    personality TEXT NOT NULL,
+                    headline TEXT NOT NULL,
+                    processed_at REAL NOT NULL,
+                    PRIMARY KEY (key, personality)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS processed_at_idx ON processed (processed_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        if legacy_file:
+            self._import_legacy(legacy_file)
+
+    def _import_legacy(self, legacy_file: str):
+        """
+        One-time import of the old history.json list. The file is left in place.
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE name = 'legacy_imported'").fetchone():
+                return
+        if os.path.exists(legacy_file):
+            try:
+                with open(legacy_file, 'r') as f:
+                    headlines = json.load(f)
+            except (OSError, ValueError) as e:
+                # Leave the import pending rather than silently dropping history.
+                print(f"Warning: Could not import {legacy_file}: {e}")
+                return
+            now = time.time()
+            rows = [(headline_key(h), ANY_PERSONALITY, h, now) for h in headlines if isinstance(h, str)]
+            print(f"Imported {len(rows)} headlines from {legacy_file}.")
+        else:
+            rows = []
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO processed VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('legacy_imported', ?)", (str(time.time()),))
+
+    def contains(self, headline: str, personality: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM processed WHERE key = ? AND personality IN (?, ?) LIMIT 1",
+                (headline_key(headline), personality, ANY_PERSONALITY),
+            ).fetchone()
+        return row is not None
+
+    def add(self, headline: str, personality: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO processed VALUES (?, ?, ?, ?)",
+                (headline_key(headline), personality, headline, time.time()),
+            )
+
+    def evict(self, ttl_seconds: float) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM processed WHERE processed_at < ?", (time.time() - ttl_seconds,))
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_history_store(path: str = None, ttl_days: float = None) -> HistoryStore:
+    """
+    Opens the configured history store and evicts expired entries.
+
+    Args:
+        path: SQLite file path, or ':memory:' for a throwaway in-memory store.
+            Defaults to HISTORY_DB (or the HISTORY_DB environment variable).
+        ttl_days: Retention in days. Defaults to HISTORY_TTL_DAYS or DEFAULT_TTL_DAYS.
+            Zero or less keeps entries forever.
+
+    Returns:
+        The opened HistoryStore.
+    """
+    path = path or os.getenv("HISTORY_DB", HISTORY_DB)
+    store = MemoryHistoryStore() if path == ":memory:" else SQLiteHistoryStore(path)
+    evict_expired(store, ttl_days)
+    return store
+
+def evict_expired(store: HistoryStore, ttl_days: float = None) -> int:
+    """
+    Evicts the entries older than the retention from a history store.
+
+    Args:
+        ttl_days: Retention in days. Defaults to HISTORY_TTL_DAYS or DEFAULT_TTL_DAYS.
+            Zero or less keeps entries forever.
+
+    Returns:
+        The number of entries removed.
+    """
+    if ttl_days is None:
+        ttl_days = float(os.getenv("HISTORY_TTL_DAYS", DEFAULT_TTL_DAYS))
+    if ttl_days <= 0:
+        return 0
+    evicted = store.evict(ttl_days * 86400)
+    if evicted:
+        print(f"Evicted {evicted} history entries older than {ttl_days:g} days.")
+    return evicted
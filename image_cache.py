@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from history_store import normalize_headline
+from image_generator import image_format
+
+IMAGE_CACHE_DIR = os.path.join(".cache", "images")
+DEFAULT_MAX_MB = 500
+
+class ImageCache:
+    """
+    Persistent cache of generated featured images, keyed by the normalized
+    image prompt plus the personality style. Each entry keeps the image file
+    and the WordPress media IDs it was uploaded as (per site and user), so a
+    retried run can reuse both instead of generating and uploading again.
+    The least recently used entries are evicted once the images exceed
+    max_bytes.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "reused_media": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    key TEXT PRIMARY KEY,
+                    file TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    media TEXT NOT NULL DEFAULT '{}',
+                    used_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS used_at_idx ON images (used_at)")
+
+    @staticmethod
+    def key(prompt: str, style: str) -> str:
+        return hashlib.sha256(json.dumps([normalize_headline(prompt), style]).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def site(wp_url: str, wp_user: str) -> str:
+        """
+        Identifies the WordPress site and account a media ID belongs to.
+        """
+        return f"{(wp_url or '').rstrip('/')}|{wp_user}"
+
+    def get(self, prompt: str, style: str) -> Optional[Tuple[bytes, Dict[str, int]]]:
+        """
+        Returns (image bytes, media IDs by site) for a cached image, or None.
+        """
+        key = self.key(prompt, style)
+        with self._lock:
+            row = self._conn.execute("SELECT file, media FROM images WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        try:
+            with open(os.path.join(self.directory, row[0]), 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._forget(key)
+            self._count("misses")
+            return None
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE images SET used_at = ? WHERE key = ?", (time.time(), key))
+        self._count("hits")
+        return data, json.loads(row[1])
+
+    def put(self, prompt: str, style: str, data: bytes):
+        """
+        Stores a generated image, then evicts old entries if over budget.
+        """
+        key = self.key(prompt, style)
+        name = f"{key}.{image_format(data) or 'png'}"
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (key, file, size, media, used_at) VALUES (?, ?, ?, '{}', ?)",
+                (key, name, len(data), time.time()),
+            )
+        self._evict()
+
+    def set_media(self, prompt: str, style: str, site: str, media_id: Optional[int]):
+        """
+        Records (or, with None, forgets) the media ID an image was uploaded as on a site.
+        """
+        key = self.key(prompt, style)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT media FROM images WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            media = json.loads(row[0])
+            if media_id is None:
+                media.pop(site, None)
+            else:
+                media[site] = media_id
+            self._conn.execute("UPDATE images SET media = ? WHERE key = ?", (json.dumps(media), key))
+
+    def mark_reused(self):
+        """
+        Counts an upload skipped because a cached media ID was still valid.
+        """
+        self._count("reused_media")
+
+    def _forget(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+
+    def _evict(self):
+        with self._lock, self._conn:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, name, size in self._conn.execute("SELECT key, file, size FROM images ORDER BY used_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+                total -= size
+                self.stats["evicted"] += 1
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"Image cache: {s['hits']} hits, {s['misses']} misses, {s['reused_media']} uploads reused, "
+                f"{s['evicted']} evicted")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_default_cache = None
+_default_lock = threading.Lock()
+_enabled = True
+
+def disable():
+    """
+    Bypasses the image cache for the rest of the process (e.g. --no-image-cache).
+    """
+    global _enabled
+    _enabled = False
+
+def get_image_cache() -> Optional[ImageCache]:
+    """
+    Returns the process-wide image cache, configured from IMAGE_CACHE_DIR and
+    IMAGE_CACHE_MAX_MB, or None when the cache is bypassed (disable() or
+    IMAGE_CACHE=off).
+    """
+    global _default_cache
+    if not _enabled or os.getenv("IMAGE_CACHE", "on").lower() in ("off", "0", "false"):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ImageCache(
+                os.getenv("IMAGE_CACHE_DIR", IMAGE_CACHE_DIR),
+                max_bytes=int(float(os.getenv("IMAGE_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+            )
+        return _default_cache
@@ -1,36 +1,99 @@
+import base64
+import io
 import os
-from openai import OpenAI
+from typing import Optional, Tuple, Union
+from response_cache import is_replay
+from ai_client import image_generation
+from telemetry import traced
 
-def generate_image(prompt: str) -> str:
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it images are uploaded as PNG.
+    Image = None
+
+# Upload formats: "png" keeps the generated image as is; "webp" and "jpeg"
+# transcode it locally (requires Pillow) to cut the upload size.
+IMAGE_FORMATS = ("png", "webp", "jpeg")
+DEFAULT_IMAGE_QUALITY = 82
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+
+@traced("image", failed=lambda result: result is None)
+def generate_image(prompt: str, as_bytes: bool = False) -> Optional[Union[str, bytes]]:
     """
-    Generates an image using OpenAI's DALL-E 3 model.
+    Generates an image using OpenAI's DALL-E 3 model (or AI_MODEL_IMAGE).
     
     Args:
         prompt: The text prompt for the image.
+        as_bytes: Return the image bytes (sent inline as base64) instead of a
+            hosted URL, so the upload does not have to download it first.
         
     Returns:
-        The URL of the generated image, or None if failed.
+        The URL or bytes of the generated image, or None if failed.
     """
-    api_key = os.getenv("AI_API_KEY")
-    base_url = os.getenv("AI_BASE_URL", "https://api.openai.com/v1")
-    
-    if not api_key:
+    if not os.getenv("AI_API_KEY") and not is_replay():
         print("Error: AI_API_KEY not set.")
         return None
         
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
     try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
+        result = image_generation(
+            prompt,
             size="1792x1024", # Wide format
             quality="standard",
-            n=1,
+            response_format="b64_json" if as_bytes else "url",
         )
-        
-        return response.data[0].url
+        return base64.b64decode(result) if as_bytes else result
         
     except Exception as e:
         print(f"Error generating image: {e}")
         return None
+
+def image_format(data: bytes) -> Optional[str]:
+    """
+    Identifies an image from its magic bytes: 'png', 'jpeg', 'webp', 'gif' or None.
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+def transcode_image(data: bytes, target: str = None, quality: int = None) -> Tuple[bytes, str]:
+    """
+    Re-encodes an image for upload.
+
+    Args:
+        data: The original image bytes.
+        target: One of IMAGE_FORMATS. Defaults to IMAGE_FORMAT or "png".
+        quality: Lossy quality (1-100). Defaults to IMAGE_QUALITY or DEFAULT_IMAGE_QUALITY.
+
+    Returns:
+        A tuple of (bytes, format). The original bytes are returned when no
+        transcoding is needed, Pillow is missing, or the result is not smaller.
+    """
+    target = (target or os.getenv("IMAGE_FORMAT", "png")).lower()
+    if target == "jpg":
+        target = "jpeg"
+    if target not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{target}' (choose from {', '.join(IMAGE_FORMATS)})")
+    source = image_format(data) or "png"
+    if target == source or target == "png":
+        return data, source
+    if Image is None:
+        print(f"Warning: Pillow is not installed; uploading {source.upper()} instead of {target.upper()}.")
+        return data, source
+
+    quality = quality or int(os.getenv("IMAGE_QUALITY", DEFAULT_IMAGE_QUALITY))
+    with Image.open(io.BytesIO(data)) as image:
+        output = io.BytesIO()
+        # JPEG has no alpha channel; WebP keeps it.
+        image = image.convert("RGB") if target == "jpeg" else image
+        image.save(output, format=target.upper(), quality=quality, optimize=True)
+    encoded = output.getvalue()
+    if len(encoded) >= len(data):
+        return data, source
+    return encoded, target
@@ -1,135 +1,212 @@
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from dotenv import load_dotenv
-from scraper import fetch_headlines
-from generator import generate_story
-from publisher import publish_to_wordpress, upload_media
-from researcher import analyze_headline, perform_research, format_citations
-from image_generator import generate_image
-
-import json
-
-HISTORY_FILE = "history.json"
-
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r') as f:
-                return set(json.load(f))
-        except:
-            return set()
-    return set()
-
-def save_history(history):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(list(history), f)
+from scraper import fetch_entries_for, DEFAULT_SOURCES
+from pipeline import StoryPipeline, SharedState, DEFAULT_STAGE_LIMITS
+from history_store import open_history_store
+from dedupe import NearDuplicateIndex, DEFAULT_THRESHOLD, DEFAULT_WINDOW_HOURS
+from image_generator import IMAGE_FORMATS
+from outbox import open_outbox, drain
+from checkpoints import open_checkpoint_store
+from daemon import Daemon, DEFAULT_STATUS_FILE, MIN_POLL_INTERVAL, MAX_POLL_INTERVAL
+import search_cache
+import image_cache
+import response_cache
+import rate_limit
+import hedging
+import telemetry
 
 from personalities import PERSONALITIES
 
+def parse_personalities(value: str) -> List[str]:
+    """
+    Parses the --personality argument: a single name, a comma-separated list
+    of names, or 'all'.
+    """
+    if value == 'all':
+        return list(PERSONALITIES.keys())
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in PERSONALITIES]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(
+            f"invalid personality {', '.join(unknown) or repr(value)} (choose from all, {', '.join(PERSONALITIES)})")
+    return names
+
 def main():
     load_dotenv()
     
     parser = argparse.ArgumentParser(description="Gravity Storybuilder: Scrape news, generate stories, and publish.")
-    parser.add_argument("--personality", type=str, choices=list(PERSONALITIES.keys()), default='alice', help="The personality to use for generation and publishing.")
+    parser.add_argument("--personality", type=parse_personalities, default=['alice'], help=f"The personality to use for generation and publishing: one of {', '.join(PERSONALITIES)}, a comma-separated list, or 'all'.")
     parser.add_argument("--dry-run", action="store_true", help="Generate story but do not publish to WordPress.")
+    parser.add_argument("--batch-publish", action="store_true", help="Create each personality's drafts in one WordPress /batch/v1 request at the end of the run.")
+    parser.add_argument("--drain-outbox", action="store_true", help="Only publish stories left pending in the outbox by earlier runs, without scraping or calling any model.")
+    parser.add_argument("--daemon", action="store_true", help="Keep running: poll each feed on an interval learned from how often it publishes and process new entries as they arrive. Stop with SIGTERM or Ctrl-C.")
+    parser.add_argument("--status-file", default=DEFAULT_STATUS_FILE, help=f"Health/status file written by --daemon after every polling cycle (default: {DEFAULT_STATUS_FILE}).")
+    parser.add_argument("--poll-min", type=float, default=MIN_POLL_INTERVAL, help=f"Shortest feed poll interval in seconds for --daemon (default: {MIN_POLL_INTERVAL}).")
+    parser.add_argument("--poll-max", type=float, default=MAX_POLL_INTERVAL, help=f"Longest feed poll interval in seconds for --daemon (default: {MAX_POLL_INTERVAL}).")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of headlines to process at the same time (per personality).")
+    generation = parser.add_mutually_exclusive_group()
+    generation.add_argument("--stream", action="store_true", help="Stream story generation, reporting time to first token and title and aborting malformed responses early.")
+    generation.add_argument("--sections", action="store_true", help="Generate an outline first, then write its sections in parallel (lower latency per article).")
+    resume = parser.add_mutually_exclusive_group()
+    resume.add_argument("--resume", dest="resume", action="store_true", default=True, help="Resume unfinished stories from their last completed stage (default).")
+    resume.add_argument("--fresh", dest="resume", action="store_false", help="Discard stage checkpoints from earlier runs and start every story from scratch.")
+    parser.add_argument("--hedge", action="store_true", help="Hedge analysis, story and image calls that exceed their stage's latency budget (AI_SLO_<STAGE>) with a second request, to AI_FALLBACK_MODEL_<STAGE> if set; the first valid response wins. With --stream, story generation is hedged on its first token (AI_FIRST_TOKEN_SLO_GENERATE) (default: AI_HEDGE or off).")
+    parser.add_argument("--research-budget", type=int, default=None, help="Estimated token budget for research in the story prompt; 0 disables trimming (default: RESEARCH_TOKEN_BUDGET or 800).")
+    parser.add_argument("--image-format", choices=IMAGE_FORMATS, default=None, help="Upload format for featured images; webp and jpeg are transcoded locally and need Pillow (default: IMAGE_FORMAT or png).")
+    parser.add_argument("--no-search-cache", action="store_true", help="Always run fresh web searches instead of using cached results.")
+    parser.add_argument("--no-image-cache", action="store_true", help="Always generate and upload new images instead of reusing cached ones.")
+    parser.add_argument("--ai-cache", choices=response_cache.MODES, default=None, help="Model response cache: read-through, record, replay (offline, cache only) or off (default: AI_CACHE_MODE or off).")
+    parser.add_argument("--ai-cache-clear", action="store_true", help="Delete all cached model responses before running.")
+    parser.add_argument("--telemetry", metavar="PATH", default=os.getenv("TELEMETRY_FILE"), help="Append per-article stage timings, token usage and cost estimates, plus a run summary, to this JSONL file (default: TELEMETRY_FILE).")
+    parser.add_argument("--prometheus-file", metavar="PATH", default=os.getenv("PROMETHEUS_TEXTFILE"), help="Write run metrics to this Prometheus textfile, e.g. for the node exporter (default: PROMETHEUS_TEXTFILE).")
+    parser.add_argument("--near-duplicates", choices=["skip", "flag", "off"], default="skip", help="What to do with headlines that look like a story already covered (default: skip).")
+    parser.add_argument("--near-duplicate-threshold", type=float, default=DEFAULT_THRESHOLD, help=f"Estimated similarity (0-1) at which a headline counts as a near-duplicate (default: {DEFAULT_THRESHOLD}).")
+    parser.add_argument("--near-duplicate-window", type=float, default=DEFAULT_WINDOW_HOURS, help=f"Hours of past stories to compare against (default: {DEFAULT_WINDOW_HOURS:g}).")
+    for stage, limit in DEFAULT_STAGE_LIMITS.items():
+        parser.add_argument(f"--{stage}-limit", type=int, default=limit, help=f"Maximum concurrent {stage} calls (default: {limit}).")
     
     args = parser.parse_args()
     
-    personality_config = PERSONALITIES[args.personality]
+    if args.no_search_cache:
+        search_cache.disable()
+    if args.no_image_cache:
+        image_cache.disable()
+    if args.ai_cache:
+        response_cache.configure(args.ai_cache)
+    if args.hedge:
+        hedging.configure(True)
+    if args.ai_cache_clear:
+        cleared = response_cache.ResponseCache(os.getenv("AI_CACHE_DIR", response_cache.RESPONSE_CACHE_DIR)).clear()
+        print(f"Cleared {cleared} cached model responses.")
     
-    print(f"--- Starting Gravity Storybuilder (Personality: {args.personality.capitalize()}) ---")
+    names = ", ".join(name.capitalize() for name in args.personality)
+    print(f"--- Starting Gravity Storybuilder (Personality: {names}) ---")
     
-    # Load credentials for this personality
-    wp_user = os.getenv(personality_config['env_user_key'])
-    wp_pass = os.getenv(personality_config['env_pass_key'])
-    
-    if not args.dry_run and not (wp_user and wp_pass):
-        print(f"Error: Credentials for {args.personality} not found in environment variables.")
-        print(f"Expected {personality_config['env_user_key']} and {personality_config['env_pass_key']}.")
+    # Load credentials for each personality
+    credentials = {}
+    for personality in args.personality:
+        personality_config = PERSONALITIES[personality]
+        wp_user = os.getenv(personality_config['env_user_key'])
+        wp_pass = os.getenv(personality_config['env_pass_key'])
+        
+        if not args.dry_run and not (wp_user and wp_pass):
+            print(f"Error: Credentials for {personality} not found in environment variables.")
+            print(f"Expected {personality_config['env_user_key']} and {personality_config['env_pass_key']}.")
+            continue
+        credentials[personality] = (wp_user, wp_pass)
+        
+    if not credentials:
         return
 
+    if args.telemetry or args.prometheus_file:
+        telemetry.configure(args.telemetry, args.prometheus_file)
+
     # Load history
-    history = load_history()
+    history = open_history_store()
     print(f"Loaded {len(history)} previously processed headlines.")
-    
-    # 1. Scrape
-    print("Step 1: Scraping headlines...")
-    rss_feeds = personality_config.get('rss_feeds')
-    headlines = fetch_headlines(rss_feeds)
-    if not headlines:
-        print("No headlines found. Exiting.")
+    outbox = open_outbox(history.path)
+
+    if args.drain_outbox:
+        if args.dry_run:
+            print("Error: --drain-outbox publishes to WordPress and cannot be combined with --dry-run.")
+        else:
+            published, failed = drain(outbox, credentials, batch=args.batch_publish)
+            print(f"\nDone. Published {published} stories from the outbox, {failed} still pending.")
+        for line in telemetry.finish():
+            print(line)
+        outbox.close()
+        history.close()
         return
-    print(f"Found {len(headlines)} headlines.")
-    
-    # 2. Generate and Publish
-    print(f"Step 2: Generating and Publishing stories...")
-    
-    new_stories_count = 0
+
+    pending = outbox.counts()["pending"]
+    if pending:
+        print(f"Note: {pending} finished stories are waiting in the outbox; run with --drain-outbox to publish them.")
+
+    checkpoints = open_checkpoint_store(history.path)
+    if not args.resume:
+        cleared = checkpoints.clear_all()
+        if cleared:
+            print(f"Discarded {cleared} stage checkpoints (--fresh).")
+    else:
+        unfinished = checkpoints.pending()
+        if unfinished:
+            print(f"Resuming {unfinished} unfinished stories from checkpoints.")
     
-    for i, headline in enumerate(headlines, 1):
-        if headline in history:
-            print(f"Skipping duplicate: {headline[:50]}...")
-            continue
-            
-        print(f"\n--- Processing Headline {i}/{len(headlines)}: {headline[:50]}... ---")
-        
-        # 1.1 Analyze and Research
-        print(f"  - Analyzing headline for {args.personality}...")
-        thesis, queries = analyze_headline(headline, personality_config['prompt_modifier'])
-        print(f"  - Thesis: {thesis}")
-        print(f"  - Research Queries: {queries}")
-        
-        research_results = []
-        if queries:
-            print(f"  - Performing research...")
-            research_results = perform_research(queries)
-            
-        research_data = format_citations(research_results)
-        
-        # Pass the personality's prompt modifier and research data
-        title, content = generate_story(headline, personality_config['prompt_modifier'], thesis, research_data)
-        
-        if title == "Error":
-            print(f"Error generating story: {content}")
-            continue
-            
-        print(f"Generated Title: {title}")
-        print(f"Generated story length: {len(content)} chars")
-        
-        # 2.1 Generate Image
-        print(f"  - Generating image for {args.personality}...")
-        image_prompt = f"A wide cinematic image representing: {title}. Style: {personality_config['style']}. High quality, detailed."
-        image_url = generate_image(image_prompt)
-        
-        featured_media_id = None
-        if image_url:
-            print(f"  - Image generated: {image_url}")
-            if not args.dry_run:
-                print(f"  - Uploading image to WordPress...")
-                featured_media_id = upload_media(image_url, wp_user, wp_pass)
-                if featured_media_id:
-                    print(f"  - Image uploaded. Media ID: {featured_media_id}")
-                else:
-                    print(f"  - Failed to upload image.")
-        else:
-            print(f"  - Failed to generate image.")
+    stage_limits = {stage: getattr(args, f"{stage}_limit") for stage in DEFAULT_STAGE_LIMITS}
+    near_duplicates = None
+    if args.near_duplicates != "off":
+        near_duplicates = NearDuplicateIndex(
+            history.path,
+            threshold=args.near_duplicate_threshold,
+            window_hours=args.near_duplicate_window,
+        )
+    shared = SharedState(history, stage_limits=stage_limits,
+                         near_duplicates=near_duplicates, near_duplicate_mode=args.near_duplicates,
+                         image_cache=image_cache.get_image_cache(),
+                         outbox=None if args.dry_run else outbox, checkpoints=checkpoints)
+    multiple = len(credentials) > 1
+    pipelines = [
+        StoryPipeline(
+            personality, PERSONALITIES[personality], wp_user, wp_pass, shared,
+            dry_run=args.dry_run,
+            concurrency=args.concurrency,
+            tag=personality if multiple else "",
+            stream=args.stream,
+            sections=args.sections,
+            research_budget=args.research_budget,
+            image_format=args.image_format,
+            batch_publish=args.batch_publish,
+        )
+        for personality, (wp_user, wp_pass) in credentials.items()
+    ]
+    subscriptions = {personality: PERSONALITIES[personality].get('rss_feeds') or DEFAULT_SOURCES
+                     for personality in credentials}
 
-        # 3. Publish
-        if args.dry_run:
-            print("Dry run enabled. Skipping publication.")
-            print(f"Content Preview: {content[:200]}...")
-            if image_url:
-                print(f"Image URL: {image_url}")
+    if args.daemon:
+        daemon = Daemon(pipelines, subscriptions, status_path=args.status_file,
+                        min_interval=args.poll_min, max_interval=args.poll_max)
+        new_stories_count = daemon.run()
+    else:
+        # 1. Scrape (each unique feed once, shared by all personalities)
+        print("Step 1: Scraping headlines...")
+        headlines_by_personality = fetch_entries_for(subscriptions)
+        for personality, headlines in headlines_by_personality.items():
+            print(f"Found {len(headlines)} headlines for {personality}.")
+
+        new_stories_count = 0
+        if not any(headlines_by_personality.values()):
+            print("No headlines found.")
         else:
-            print(f"Publishing to WordPress as {args.personality}...")
-            result = publish_to_wordpress(title, content, wp_user, wp_pass, status='draft', featured_media_id=featured_media_id)
-            print(result)
-            
-            # Add to history only if published successfully (or attempted)
-            history.add(headline)
-            save_history(history)
-            new_stories_count += 1
+            # 2. Generate and Publish
+            print(f"Step 2: Generating and Publishing stories...")
+            with ThreadPoolExecutor(max_workers=len(pipelines)) as executor:
+                counts = list(executor.map(lambda pipeline: pipeline.run(headlines_by_personality[pipeline.personality]), pipelines))
+            new_stories_count = sum(counts)
+    checkpoints.close()
+    outbox.close()
+    history.close()
+    if near_duplicates is not None:
+        near_duplicates.close()
             
+    for line in shared.draft_summary():
+        print(line)
+    for cache in (search_cache.get_search_cache(), image_cache.get_image_cache(), response_cache.get_response_cache()):
+        if cache:
+            print(cache.summary())
+    print(checkpoints.summary())
+    limiter = rate_limit.get_limiter()
+    if limiter is not None:
+        for line in limiter.summary_lines():
+            print(line)
+    hedger = hedging.get_hedger()
+    if hedger is not None:
+        for line in hedger.summary_lines() or ["Hedging: no call exceeded its latency budget."]:
+            print(line)
+    for line in telemetry.finish():
+        print(line)
     print(f"\nDone. Processed {new_stories_count} new stories.")
 
 if __name__ == "__main__":
@@ -0,0 +1,297 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from history_store import DEFAULT_TTL_DAYS, HISTORY_DB, headline_key
+from publisher import get_wordpress_client, post_data, upload_media
+from telemetry import traced
+
+# Items that failed this many publish attempts are left for a human to look at.
+MAX_ATTEMPTS = 10
+
+# Published items are kept this long, as long as the history remembers the
+# headline, and then purged.
+DEFAULT_RETENTION_DAYS = DEFAULT_TTL_DAYS
+
+@dataclass
+class OutboxItem:
+    """
+    A finished article waiting to be published.
+    """
+    id: int
+    key: str
+    personality: str
+    headline: str
+    title: str
+    content: str
+    featured_media_id: Optional[int]
+    image: Optional[bytes]
+    attempts: int
+    created_at: float
+
+def idempotency_key(personality: str, headline: str) -> str:
+    """
+    Identifies one personality's story about one headline, so an article is
+    queued (and published) at most once.
+    """
+    return hashlib.sha256(f"{personality}\n{headline_key(headline)}".encode("utf-8")).hexdigest()
+
+class Outbox:
+    """
+    Durable queue of finished articles in the history database. Articles are
+    stored before publishing, so a WordPress failure never means generating
+    the story again: drain() publishes whatever is still pending, without
+    calling any model.
+    """
+
+    def __init__(self, path: Optional[str] = HISTORY_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT NOT NULL UNIQUE,
+                    personality TEXT NOT NULL,
+                    headline TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    featured_media_id INTEGER,
+                    image BLOB,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    link TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_status_idx ON outbox (status, personality)")
+
+    def add(self, personality: str, headline: str, title: str, content: str,
+            featured_media_id: Optional[int] = None, image: Optional[bytes] = None) -> int:
+        """
+        Stores a finished article. The image bytes are only kept when the
+        image has not been uploaded yet. Adding the same personality and
+        headline again returns the existing item.
+
+        Returns:
+            The outbox item ID.
+        """
+        key = idempotency_key(personality, headline)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (key, personality, headline, title, content, featured_media_id, image,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, personality, headline, title, content, featured_media_id,
+                 None if featured_media_id else image, now, now),
+            )
+            return self._conn.execute("SELECT id FROM outbox WHERE key = ?", (key,)).fetchone()[0]
+
+    def get(self, item_id: int) -> Optional[OutboxItem]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM outbox WHERE id = ?", (item_id,)).fetchone()
+        return OutboxItem(*row) if row else None
+
+    def pending(self, personality: Optional[str] = None) -> List[OutboxItem]:
+        """
+        Returns the items still waiting to be published, oldest first.
+        """
+        query = f"SELECT {_COLUMNS} FROM outbox WHERE status = 'pending' AND attempts < ?"
+        params = [MAX_ATTEMPTS]
+        if personality:
+            query += " AND personality = ?"
+            params.append(personality)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [OutboxItem(*row) for row in rows]
+
+    def begin_attempt(self, item_id: int) -> int:
+        """
+        Counts a publish attempt before it is made, so a crash mid-publish is
+        remembered. Returns the number of earlier attempts.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outbox SET attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                               (time.time(), item_id))
+            return self._conn.execute("SELECT attempts FROM outbox WHERE id = ?", (item_id,)).fetchone()[0] - 1
+
+    def set_media(self, item_id: int, media_id: int):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outbox SET featured_media_id = ?, image = NULL, updated_at = ? WHERE id = ?",
+                               (media_id, time.time(), item_id))
+
+    def mark_published(self, item_id: int, link: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'published', link = ?, image = NULL, last_error = NULL, updated_at = ?"
+                " WHERE id = ?", (link, time.time(), item_id))
+
+    def mark_failed(self, item_id: int, error: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outbox SET last_error = ?, updated_at = ? WHERE id = ?",
+                               (error[:1000], time.time(), item_id))
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Number of items per state: pending, published and stuck (pending but
+        out of attempts).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT CASE WHEN status = 'pending' AND attempts >= ? THEN 'stuck' ELSE status END, COUNT(*)"
+                " FROM outbox GROUP BY 1", (MAX_ATTEMPTS,)).fetchall()
+        counts = {"pending": 0, "published": 0, "stuck": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def purge(self, retention_seconds: float) -> int:
+        """
+        Deletes published items last updated more than retention_seconds ago.
+        Pending and stuck items are kept. Returns the number removed.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM outbox WHERE status = 'published' AND updated_at < ?",
+                                      (time.time() - retention_seconds,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_outbox(path: Optional[str], retention_days: Optional[float] = None) -> Outbox:
+    """
+    Opens the outbox next to the history and purges old published items.
+
+    Args:
+        path: The history database path (None for an in-memory outbox).
+        retention_days: How long published items are kept. Defaults to
+            OUTBOX_RETENTION_DAYS or DEFAULT_RETENTION_DAYS.
+
+    Returns:
+        The opened Outbox.
+    """
+    outbox = Outbox(path)
+    purge_published(outbox, retention_days)
+    return outbox
+
+def purge_published(outbox: Outbox, retention_days: Optional[float] = None) -> int:
+    """
+    Purges the published items older than the retention from an outbox.
+
+    Args:
+        retention_days: How long published items are kept. Defaults to
+            OUTBOX_RETENTION_DAYS or DEFAULT_RETENTION_DAYS.
+
+    Returns:
+        The number of items removed.
+    """
+    if retention_days is None:
+        retention_days = float(os.getenv("OUTBOX_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    purged = outbox.purge(retention_days * 86400)
+    if purged:
+        print(f"Purged {purged} published outbox items older than {retention_days:g} days.")
+    return purged
+
+_COLUMNS = "id, key, personality, headline, title, content, featured_media_id, image, attempts, created_at"
+
+@traced("publish", failed=lambda result: not result[0])
+def publish_item(outbox: Outbox, item: OutboxItem, wp_user: str, wp_app_password: str) -> Tuple[bool, str]:
+    """
+    Publishes one outbox item as a draft, uploading its image first if that
+    has not happened yet. If an earlier attempt may have created the post,
+    the site is checked for it before posting again.
+
+    Returns:
+        A tuple of (success, message).
+    """
+    earlier_attempts = outbox.begin_attempt(item.id)
+    client = get_wordpress_client(wp_user, wp_app_password)
+    try:
+        media_id = item.featured_media_id
+        if media_id is None and item.image:
+            media_id = upload_media(item.image, wp_user, wp_app_password, filename=item.headline)
+            if media_id:
+                outbox.set_media(item.id, media_id)
+
+        post = None
+        if earlier_attempts:
+            since = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(item.created_at - 60))
+            post = client.find_post(item.title, "draft", since)
+        if post is None:
+            post = client.create_post(post_data(item.title, item.content, 'draft', media_id))
+    except requests.exceptions.RequestException as e:
+        outbox.mark_failed(item.id, str(e))
+        return False, f"Error publishing to WordPress: {e} (kept in the outbox)"
+
+    outbox.mark_published(item.id, post.get('link'))
+    return True, f"Successfully published! Link: {post.get('link')}"
+
+@traced("publish", failed=lambda results: not all(ok for ok, _ in results))
+def publish_items(outbox: Outbox, items: List[OutboxItem], wp_user: str, wp_app_password: str) -> List[Tuple[bool, str]]:
+    """
+    Publishes several items for one credential. Items never attempted before
+    go through one /batch/v1 request; retried items are published one at a
+    time so each can be checked for an earlier, partly successful attempt.
+
+    Returns:
+        For each item, a tuple of (success, message).
+    """
+    results = {}
+    fresh = []
+    for item in items:
+        if item.attempts or (item.featured_media_id is None and item.image):
+            results[item.id] = publish_item(outbox, item, wp_user, wp_app_password)
+        else:
+            fresh.append(item)
+
+    if fresh:
+        for item in fresh:
+            outbox.begin_attempt(item.id)
+        posts = [post_data(item.title, item.content, 'draft', item.featured_media_id) for item in fresh]
+        try:
+            created = get_wordpress_client(wp_user, wp_app_password).create_posts(posts)
+        except requests.exceptions.RequestException as e:
+            created = [e] * len(fresh)
+        for item, result in zip(fresh, created):
+            if isinstance(result, Exception):
+                outbox.mark_failed(item.id, str(result))
+                results[item.id] = (False, f"Error publishing to WordPress: {result} (kept in the outbox)")
+            else:
+                outbox.mark_published(item.id, result.get('link'))
+                results[item.id] = (True, f"Successfully published! Link: {result.get('link')}")
+    return [results[item.id] for item in items]
+
+def drain(outbox: Outbox, credentials: Dict[str, Tuple[str, str]], batch: bool = False) -> Tuple[int, int]:
+    """
+    Publishes every pending item for the given personalities.
+
+    Args:
+        outbox: The outbox to drain.
+        credentials: WordPress (user, password) per personality.
+        batch: Create each personality's fresh items in one /batch/v1 request.
+
+    Returns:
+        A tuple of (published, failed).
+    """
+    published = failed = 0
+    for personality, (wp_user, wp_pass) in credentials.items():
+        items = outbox.pending(personality)
+        if not items:
+            continue
+        print(f"Publishing {len(items)} pending stories for {personality}...")
+        if batch:
+            results = publish_items(outbox, items, wp_user, wp_pass)
+        else:
+            results = [publish_item(outbox, item, wp_user, wp_pass) for item in items]
+        for item, (ok, message) in zip(items, results):
+            print(f"  - {item.title[:50]}: {message}")
+            published += ok
+            failed += not ok
+    return published, failed
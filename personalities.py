@@ -1,6 +1,10 @@
+# "mode" selects how stories are drafted: "research" (analyze, web research,
+# then generate) or "fused" (one call writes the thesis and story from the
+# feed summary, skipping the analyze round trip and the searches).
 PERSONALITIES = {
     "alice": {
         "style": "compassionate",
+        "mode": "research",
         "prompt_modifier": "Add a style of compassion to the story. Focus on the human element, empathy, and emotional connection. Be kind and understanding in the tone.",
         "env_user_key": "WP_USER_ALICE",
         "env_pass_key": "WP_PASS_ALICE",
@@ -12,6 +16,7 @@ PERSONALITIES = {
     },
     "wallace": {
         "style": "analytical",
+        "mode": "research",
         "prompt_modifier": "Add a very detailed analysis to the story. Break down the events, causes, and effects with rigorous logic. Use data-driven language where appropriate and be extremely precise.",
         "env_user_key": "WP_USER_WALLACE",
         "env_pass_key": "WP_PASS_WALLACE",
@@ -23,6 +28,7 @@ PERSONALITIES = {
     },
     "mike": {
         "style": "financial",
+        "mode": "research",
         "prompt_modifier": "Focus heavily on financial implications and markets. Writing for a financial audience. Discuss stocks, bonds, economic indicators, and how this news affects the bottom line for businesses and investors.",
         "env_user_key": "WP_USER_MIKE",
         "env_pass_key": "WP_PASS_MIKE",
@@ -34,6 +40,7 @@ PERSONALITIES = {
     },
     "mindy": {
         "style": "economist",
+        "mode": "research",
         "prompt_modifier": "Adopt the persona of an economist. Write to an audience of economists and financial professionals. Focus on global stability, conflict, and trade. Discuss macroeconomic trends, geopolitical ramifications, and long-term societal impact.",
         "env_user_key": "WP_USER_MINDY",
         "env_pass_key": "WP_PASS_MINDY",
@@ -45,6 +52,7 @@ PERSONALITIES = {
     },
     "derick": {
         "style": "conspiracy",
+        "mode": "research",
         "prompt_modifier": "Add a style of conspiracy and intrigue. Shade the story in dark tones, questioning official narratives and suggesting hidden agendas. Connect events to a grander, more sinister theory.",
         "env_user_key": "WP_USER_DERICK",
         "env_pass_key": "WP_PASS_DERICK",
@@ -0,0 +1,636 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from generator import generate_story, generate_sectioned_story, generate_fused_story
+from publisher import publish_to_wordpress, publish_posts, post_data, upload_media, media_exists
+from researcher import analyze_headline, perform_research, format_citations, works_cited, trim_to_tokens
+from image_generator import generate_image, transcode_image
+from feed_reader import FeedEntry
+from history_store import HistoryStore, evict_expired, headline_key
+from dedupe import NearDuplicateIndex, DEFAULT_WINDOW_HOURS
+from ai_client import UsageMeter, metered
+from image_cache import ImageCache
+from outbox import Outbox, publish_item, publish_items, purge_published
+from checkpoints import CheckpointStore, purge_checkpoints
+import telemetry
+
+# Per-personality drafting modes (the 'mode' key in PERSONALITIES):
+# research: analyze -> web research -> generate (the default)
+# fused:    one call derives the thesis and writes the story from the feed summary
+DRAFT_MODES = ("research", "fused")
+
+# Default number of calls allowed in flight per external service.
+DEFAULT_STAGE_LIMITS = {
+    "llm": 2,
+    "search": 2,
+    "image": 2,
+    "wordpress": 2,
+}
+
+# How often expired claims are dropped, in seconds.
+CLAIM_PRUNE_INTERVAL = 3600
+
+_print_lock = threading.Lock()
+
+def log(prefix: str, message: str):
+    """
+    Prints a message, prefixed with the headline tag when running concurrently.
+    The lock keeps lines from different worker threads from interleaving.
+    """
+    with _print_lock:
+        if prefix:
+            print("\n".join(f"{prefix} {line}" if line else line for line in message.split("\n")))
+        else:
+            print(message)
+
+def build_image_prompt(headline: str, thesis: str, style: str) -> str:
+    """
+    Builds the featured image prompt from the headline and thesis, so the image
+    can be generated before the story (and its rewritten title) exists.
+    """
+    subject = f"{headline}. {thesis}" if thesis else headline
+    return f"A wide cinematic image representing: {subject}. Style: {style}. High quality, detailed."
+
+class SharedState:
+    """
+    State shared by every pipeline in one invocation: the processed-headline
+    history store, the near-duplicate index, the image cache, the publish
+    outbox, the stage checkpoints, the per-stage concurrency limits and the
+    headlines each personality has claimed and not finished yet.
+
+    Running several personalities in one process shares these, so the stage
+    limits apply to the whole process. A claim ends when the story is
+    recorded in the history or fails (see release()); claims older than
+    claim_window_hours are dropped, so a long-running process does not
+    accumulate them.
+    """
+
+    def __init__(self, history: HistoryStore, stage_limits: Optional[Dict[str, int]] = None,
+                 near_duplicates: Optional[NearDuplicateIndex] = None, near_duplicate_mode: str = "skip",
+                 image_cache: Optional[ImageCache] = None, outbox: Optional[Outbox] = None,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 claim_window_hours: float = DEFAULT_WINDOW_HOURS):
+        self.history = history
+        self.image_cache = image_cache
+        self.outbox = outbox
+        self.checkpoints = checkpoints
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_mode = near_duplicate_mode
+
+        limits = dict(DEFAULT_STAGE_LIMITS)
+        limits.update(stage_limits or {})
+        self.limits = {stage: threading.BoundedSemaphore(max(1, n)) for stage, n in limits.items()}
+
+        self._lock = threading.Lock()
+        self._claimed = {}  # (headline key, personality) -> claimed at
+        self._claim_window = claim_window_hours * 3600
+        self._claims_pruned_at = time.time()
+        # (personality, mode) -> [articles, seconds, tokens, calls]
+        self._drafts = {}
+
+    def claim(self, entry: FeedEntry, personality: str) -> Tuple[bool, Optional[str]]:
+        """
+        Reserves a feed entry for processing by a personality.
+
+        Returns:
+            A tuple of (claimed, note). claimed is False if the headline is in
+            the history, already claimed in this run, or a near-duplicate in
+            skip mode; note explains the skip or flag.
+        """
+        key = (headline_key(entry.title), personality)
+        now = time.time()
+        with self._lock:
+            if now - self._claims_pruned_at > CLAIM_PRUNE_INTERVAL:
+                cutoff = now - self._claim_window
+                self._claimed = {k: claimed_at for k, claimed_at in self._claimed.items() if claimed_at >= cutoff}
+                self._claims_pruned_at = now
+            if key in self._claimed or self.history.contains(entry.title, personality):
+                return False, f"Skipping duplicate: {entry.title[:50]}..."
+
+            note = None
+            if self.near_duplicates is not None and self.near_duplicate_mode != "off":
+                match = self.near_duplicates.hold(entry.title, entry.summary, personality)
+                if match:
+                    headline, score = match
+                    note = f"near-duplicate of '{headline[:50]}' (similarity {score:.2f}): {entry.title[:50]}..."
+                    if self.near_duplicate_mode == "skip":
+                        return False, f"Skipping {note}"
+                    note = f"Flagged {note}"
+
+            self._claimed[key] = now
+            return True, note
+
+    def release(self, entry: FeedEntry, personality: str):
+        """
+        Gives up a claim whose story failed, so a later run (or the next
+        daemon poll) can try the headline again.
+        """
+        with self._lock:
+            self._claimed.pop((headline_key(entry.title), personality), None)
+        if self.near_duplicates is not None:
+            self.near_duplicates.release(entry.title, personality)
+
+    def mark_processed(self, entry: FeedEntry, personality: str):
+        """
+        Records a headline in the history and drops its stage checkpoints.
+        The store commits each entry on its own, so stories may finish in any
+        order. From here on the history keeps the headline from being
+        claimed again, so its claim is dropped.
+        """
+        self.history.add(entry.title, personality)
+        if self.near_duplicates is not None:
+            self.near_duplicates.record(entry.title, entry.summary, personality)
+        self.release(entry, personality)
+        if self.checkpoints is not None:
+            self.checkpoints.clear(personality, entry.title)
+
+    def purge_expired(self):
+        """
+        Purges expired history entries, checkpoints and published outbox
+        items, as opening them does (see daemon.Daemon.purge_expired).
+        """
+        evict_expired(self.history)
+        if self.checkpoints is not None:
+            purge_checkpoints(self.checkpoints)
+        if self.outbox is not None:
+            purge_published(self.outbox)
+
+    def record_draft(self, personality: str, mode: str, seconds: float, usage: UsageMeter):
+        """
+        Adds one drafted article (everything up to the finished story) to the
+        per-personality latency and token totals.
+        """
+        with self._lock:
+            totals = self._drafts.setdefault((personality, mode), [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += usage.total_tokens
+            totals[3] += usage.calls
+
+    def draft_summary(self) -> List[str]:
+        """
+        Summary lines comparing drafting latency and billed tokens per article
+        for each personality, and between the modes when both were used.
+        """
+        with self._lock:
+            drafts = dict(self._drafts)
+        if not drafts:
+            return []
+
+        lines = ["Drafting per article (analyze through story):"]
+        by_mode = {}
+        for (personality, mode), (articles, seconds, tokens, calls) in sorted(drafts.items()):
+            lines.append(f"  {personality} ({mode}): {articles} articles, {seconds / articles:.1f}s, "
+                         f"{tokens / articles:,.0f} tokens, {calls / articles:.1f} model calls")
+            mode_totals = by_mode.setdefault(mode, [0, 0.0, 0])
+            mode_totals[0] += articles
+            mode_totals[1] += seconds
+            mode_totals[2] += tokens
+
+        if "fused" in by_mode and "research" in by_mode:
+            (fa, fs, ft), (ra, rs, rt) = by_mode["fused"], by_mode["research"]
+            lines.append(f"  fused saves {rs / ra - fs / fa:.1f}s and {rt / ra - ft / fa:,.0f} tokens per article vs research")
+        return lines
+
+class StoryPipeline:
+    """
+    Runs the analyze -> research -> generate -> image -> publish pipeline for
+    a batch of headlines, optionally processing several headlines at once.
+
+    Each external service (LLM, search, image generation, WordPress) has its own
+    concurrency limit so that raising --concurrency does not flood any one API.
+
+    Within one article the stages form a small dependency graph:
+
+        analyze --+--> research --> generate --+--> publish
+                  |                            |
+                  +--> image ----> upload -----+
+
+    The image branch only needs the thesis, so it runs alongside research and
+    story generation and publish waits for both.
+    """
+
+    def __init__(self, personality: str, personality_config: Dict, wp_user: str, wp_pass: str,
+                 shared: SharedState, dry_run: bool = False, concurrency: int = 1, tag: str = "",
+                 stream: bool = False, sections: bool = False, research_budget: Optional[int] = None,
+                 image_format: Optional[str] = None, batch_publish: bool = False):
+        mode = personality_config.get('mode', "research")
+        if mode not in DRAFT_MODES:
+            raise ValueError(f"Unknown mode '{mode}' for {personality} (choose from {', '.join(DRAFT_MODES)})")
+        self.personality = personality
+        self.config = personality_config
+        self.wp_user = wp_user
+        self.wp_pass = wp_pass
+        self.shared = shared
+        self.limits = shared.limits
+        self.dry_run = dry_run
+        self.concurrency = max(1, concurrency)
+        self.stream = stream
+        self.sections = sections
+        self.research_budget = research_budget
+        self.image_format = image_format
+        # With batch_publish, finished stories are created in one /batch/v1 call at the end of run().
+        self.batch_publish = batch_publish
+        self._pending_posts = []
+        self._pending_lock = threading.Lock()
+        # Entries whose story failed in the last run(); their claims were released.
+        self.failed = []
+        self._branch_executor = None
+        # Log prefix used when several personalities share the console.
+        self.tag = f"[{tag}]" if tag else ""
+
+    def run(self, entries: List[FeedEntry]) -> int:
+        """
+        Processes all feed entries and returns the number of new stories handled.
+        """
+        self.failed = []
+        pending = []
+        for i, entry in enumerate(entries, 1):
+            # Headlines in flight are not in the history yet, so claiming also
+            # skips repeats within this run.
+            claimed, note = self.shared.claim(entry, self.personality)
+            if note:
+                log(self.tag, note)
+            if claimed:
+                pending.append((i, entry))
+
+        total = len(entries)
+        # Image branches get their own pool so they never wait behind headline workers.
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="image") as branch_executor:
+            self._branch_executor = branch_executor
+            try:
+                if self.concurrency == 1:
+                    results = [self.process_headline(i, total, entry) for i, entry in pending]
+                else:
+                    with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                        results = list(executor.map(lambda item: self.process_headline(item[0], total, item[1]), pending))
+            finally:
+                self._branch_executor = None
+
+        return sum(1 for processed in results if processed) + self._publish_pending()
+
+    def _publish_pending(self) -> int:
+        """
+        Publishes the stories queued in batch mode and records the ones that
+        were created.
+
+        Returns:
+            The number of stories published.
+        """
+        with self._pending_lock:
+            pending, self._pending_posts = self._pending_posts, []
+        if not pending:
+            return 0
+
+        log(self.tag, f"Publishing {len(pending)} stories to WordPress as {self.personality} in one batch...")
+        outbox = self.shared.outbox
+        with self.limits["wordpress"]:
+            if outbox is not None:
+                items = [outbox.get(item_id) for _, _, item_id in pending]
+                results = publish_items(outbox, items, self.wp_user, self.wp_pass)
+            else:
+                results = publish_posts([post for _, _, post in pending], self.wp_user, self.wp_pass)
+        published = 0
+        for (prefix, entry, _), (ok, message) in zip(pending, results):
+            log(prefix, message)
+            if ok:
+                # Outbox stories were recorded when they were stored.
+                if outbox is None:
+                    self.shared.mark_processed(entry, self.personality)
+                published += 1
+            elif outbox is None:
+                self._failed(entry)
+        if published < len(pending):
+            kept = "they stay in the outbox for --drain-outbox" if outbox is not None else "they will be retried"
+            log(self.tag, f"{len(pending) - published} of {len(pending)} batched stories for {self.personality} "
+                          f"could not be published; {kept}.")
+        return published
+
+    def _failed(self, entry: FeedEntry):
+        self.shared.release(entry, self.personality)
+        with self._pending_lock:
+            self.failed.append(entry)
+
+    def process_headline(self, index: int, total: int, entry: FeedEntry) -> bool:
+        """
+        Runs the full pipeline for one feed entry.
+
+        Returns:
+            True if the story was counted as processed, False otherwise.
+        """
+        prefix = f"[{index}/{total}]" if self.concurrency > 1 else ""
+        prefix = self.tag + prefix
+        with telemetry.article(self.personality, entry.title):
+            try:
+                return self._process_headline(prefix, index, total, entry)
+            except Exception as e:
+                log(prefix, f"Error processing headline '{entry.title[:50]}': {e}")
+                telemetry.annotate(outcome="error", error=str(e))
+                self._failed(entry)
+                return False
+
+    def _process_headline(self, prefix: str, index: int, total: int, entry: FeedEntry) -> bool:
+        headline = entry.title
+        log(prefix, f"\n--- Processing Headline {index}/{total}: {headline[:50]}... ---")
+
+        mode = self.config.get('mode', "research")
+        started = time.monotonic()
+        with metered() as usage:
+            if mode == "fused":
+                title, content, image_future = self._draft_fused(prefix, entry)
+            else:
+                title, content, image_future = self._draft_researched(prefix, entry)
+        if title != "Error":
+            self.shared.record_draft(self.personality, mode, time.monotonic() - started, usage)
+        telemetry.annotate(mode=mode, title=title)
+
+        image, featured_media_id = image_future.result()
+
+        if title == "Error":
+            log(prefix, f"Error generating story: {content}")
+            telemetry.annotate(outcome="failed", error=content)
+            self._failed(entry)
+            return False
+
+        log(prefix, f"Generated Title: {title}")
+        log(prefix, f"Generated story length: {len(content)} chars")
+
+        # 3. Publish
+        if self.dry_run:
+            log(prefix, "Dry run enabled. Skipping publication.")
+            log(prefix, f"Content Preview: {content[:200]}...")
+            if isinstance(image, str):
+                log(prefix, f"Image URL: {image}")
+            elif image:
+                log(prefix, f"Image: {len(image) / 1024:.0f} KB")
+            telemetry.annotate(outcome="dry_run")
+            return False
+
+        if self.shared.outbox is not None:
+            return self._publish_through_outbox(prefix, entry, title, content, image, featured_media_id)
+
+        if self.batch_publish:
+            with self._pending_lock:
+                self._pending_posts.append((prefix, entry, post_data(title, content, 'draft', featured_media_id)))
+            log(prefix, "Queued for batch publishing.")
+            telemetry.annotate(outcome="queued")
+            return False
+
+        log(prefix, f"Publishing to WordPress as {self.personality}...")
+        with self.limits["wordpress"]:
+            result = publish_to_wordpress(title, content, self.wp_user, self.wp_pass, status='draft', featured_media_id=featured_media_id)
+        log(prefix, result)
+        telemetry.annotate(outcome="published")
+
+        # Add to history only if published successfully (or attempted)
+        self.shared.mark_processed(entry, self.personality)
+        return True
+
+    def _draft_researched(self, prefix: str, entry: FeedEntry) -> Tuple[str, str, Future]:
+        """
+        Analyzes the headline, researches it and writes the story, starting
+        the image branch once the thesis is known.
+
+        Returns:
+            A tuple of (title, content, image_future).
+        """
+        headline = entry.title
+
+        # 1.1 Analyze and Research
+        analysis = self._resume(prefix, headline, "analysis")
+        if analysis:
+            thesis, queries = analysis
+        else:
+            log(prefix, f"  - Analyzing headline for {self.personality}...")
+            with self.limits["llm"]:
+                thesis, queries = analyze_headline(headline, self.config['prompt_modifier'])
+            if thesis:
+                self._checkpoint(headline, "analysis", [thesis, queries])
+        log(prefix, f"  - Thesis: {thesis}")
+        log(prefix, f"  - Research Queries: {queries}")
+
+        # Start the image branch as soon as the thesis is known.
+        image_future = self._submit(self._image_branch, prefix, headline, thesis)
+
+        story = self._resume(prefix, headline, "story")
+        if story:
+            title, content = story
+            return title, content, image_future
+
+        research_results = self._resume(prefix, headline, "research") if queries else []
+        if research_results is None:
+            log(prefix, f"  - Performing research...")
+            with self.limits["search"]:
+                research_results = perform_research(queries)
+            self._checkpoint(headline, "research", research_results)
+
+        compaction = {}
+        research_data = format_citations(research_results, thesis, budget=self.research_budget, stats=compaction)
+        if compaction:
+            log(prefix, f"  - Research context: {compaction['sources_after']}/{compaction['sources_before']} sources, "
+                        f"~{compaction['tokens_after']} tokens (saved ~{compaction['tokens_saved']})")
+
+        # Pass the personality's prompt modifier and research data
+        stream_options = {}
+        metrics = {}
+        if self.stream:
+            stream_options = {
+                "stream": True,
+                "on_title": lambda title: log(prefix, f"  - Title ready: {title}"),
+                "metrics": metrics,
+            }
+        if self.sections:
+            # The outline and each section take the LLM limit per call.
+            title, content = generate_sectioned_story(
+                headline, self.config['prompt_modifier'], thesis, research_data,
+                works_cited=works_cited(research_results), limit=self.limits["llm"])
+        else:
+            with self.limits["llm"]:
+                title, content = generate_story(headline, self.config['prompt_modifier'], thesis, research_data, **stream_options)
+        if metrics:
+            log(prefix, "  - Generation timing: " + ", ".join(
+                f"{name} {seconds:.1f}s" for name, seconds in metrics.items() if seconds is not None))
+        if title != "Error":
+            self._checkpoint(headline, "story", [title, content])
+        return title, content, image_future
+
+    def _draft_fused(self, prefix: str, entry: FeedEntry) -> Tuple[str, str, Future]:
+        """
+        Writes the thesis and story in one call from the feed summary. There
+        is no thesis to wait for, so the image branch starts right away from
+        the headline and the start of the summary.
+
+        Returns:
+            A tuple of (title, content, image_future).
+        """
+        headline = entry.title
+        image_future = self._submit(self._image_branch, prefix, headline, trim_to_tokens(entry.summary, 40))
+
+        story = self._resume(prefix, headline, "story")
+        if story:
+            title, content = story
+            return title, content, image_future
+
+        log(prefix, f"  - Writing story for {self.personality} from the feed summary (fused mode)...")
+        with self.limits["llm"]:
+            thesis, title, content = generate_fused_story(headline, self.config['prompt_modifier'], entry.summary)
+        if thesis:
+            log(prefix, f"  - Thesis: {thesis}")
+        if title != "Error":
+            self._checkpoint(headline, "story", [title, content])
+        return title, content, image_future
+
+    def _publish_through_outbox(self, prefix: str, entry: FeedEntry, title: str, content: str,
+                                image: Optional[Union[str, bytes]], featured_media_id: Optional[int]) -> bool:
+        """
+        Stores the finished article in the outbox, then publishes it (or
+        queues it for the batch). A failed publish stays in the outbox for
+        --drain-outbox instead of being lost.
+
+        Returns:
+            True if the story was published now.
+        """
+        outbox = self.shared.outbox
+        item_id = outbox.add(self.personality, entry.title, title, content, featured_media_id,
+                             image if isinstance(image, bytes) else None)
+        # The article is safe in the outbox, so the headline never has to be generated again.
+        self.shared.mark_processed(entry, self.personality)
+
+        if self.batch_publish:
+            with self._pending_lock:
+                self._pending_posts.append((prefix, entry, item_id))
+            log(prefix, "Queued for batch publishing.")
+            telemetry.annotate(outcome="queued")
+            return False
+
+        log(prefix, f"Publishing to WordPress as {self.personality}...")
+        with self.limits["wordpress"]:
+            published, message = publish_item(outbox, outbox.get(item_id), self.wp_user, self.wp_pass)
+        log(prefix, message)
+        telemetry.annotate(outcome="published" if published else "pending")
+        return published
+
+    def _resume(self, prefix: str, headline: str, stage: str):
+        """
+        Returns the checkpointed result of a stage left by an earlier run, or
+        None if the stage has to run. Dry runs neither resume nor checkpoint:
+        nothing would clear their checkpoints, and a later real run would
+        publish the dry run's output.
+        """
+        if self.shared.checkpoints is None or self.dry_run:
+            return None
+        value = self.shared.checkpoints.get(self.personality, headline, stage)
+        if value is not None:
+            log(prefix, f"  - Resuming from checkpoint: {stage}")
+        return value
+
+    def _checkpoint(self, headline: str, stage: str, value):
+        if self.shared.checkpoints is not None and not self.dry_run:
+            self.shared.checkpoints.put(self.personality, headline, stage, value)
+
+    def _submit(self, fn, *args) -> Future:
+        """
+        Runs fn on the branch executor, or inline when called outside run().
+        The branch runs in a copy of the caller's context, so its telemetry
+        spans count towards the same article.
+        """
+        if self._branch_executor is not None:
+            return self._branch_executor.submit(contextvars.copy_context().run, fn, *args)
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _image_branch(self, prefix: str, headline: str, thesis: str) -> Tuple[Optional[Union[str, bytes]], Optional[int]]:
+        """
+        Generates the featured image and uploads it to WordPress. The image
+        comes back inline (no download hop) and is optionally transcoded to a
+        smaller format before the upload.
+
+        With an image cache, an image made for the same headline and style is
+        reused instead of generated, and its WordPress media ID is reused
+        instead of uploading again as long as the media item still exists.
+        Checkpoints from an interrupted run take precedence over the cache.
+
+        Returns:
+            A tuple of (image, featured_media_id); either may be None.
+        """
+        style = self.config['style']
+        cache = self.shared.image_cache
+        # The thesis is regenerated on every run, so a retried run would never
+        # match on the full prompt; cache on the headline-only prompt instead.
+        cache_prompt = build_image_prompt(headline, "", style)
+        site = ImageCache.site(os.getenv("WP_URL"), self.wp_user)
+
+        resumed = self._resume(prefix, headline, "image")
+        if resumed is not None:
+            media_id = self._resume(prefix, headline, "media")
+            if media_id:
+                return resumed, media_id
+
+        cached = None
+        if resumed is None and cache:
+            cached = cache.get(cache_prompt, style)
+        if resumed is not None:
+            image = resumed
+        elif cached:
+            image, media = cached
+            log(prefix, f"  - Reusing cached image ({len(image) / 1024:.0f} KB)")
+            media_id = media.get(site)
+            if media_id and not self.dry_run:
+                with self.limits["wordpress"]:
+                    valid = media_exists(media_id, self.wp_user, self.wp_pass)
+                if valid:
+                    cache.mark_reused()
+                    log(prefix, f"  - Reusing uploaded image. Media ID: {media_id}")
+                    self._checkpoint(headline, "image", image)
+                    self._checkpoint(headline, "media", media_id)
+                    return image, media_id
+                cache.set_media(cache_prompt, style, site, None)
+        else:
+            log(prefix, f"  - Generating image for {self.personality}...")
+            image_prompt = build_image_prompt(headline, thesis, style)
+            with self.limits["image"]:
+                image = generate_image(image_prompt, as_bytes=True)
+            if cache and isinstance(image, bytes):
+                try:
+                    cache.put(cache_prompt, style, image)
+                except OSError as e:
+                    log(prefix, f"  - Warning: Could not cache image: {e}")
+        # Image URLs expire quickly, so only image bytes are checkpointed.
+        if isinstance(image, bytes) and resumed is None:
+            self._checkpoint(headline, "image", image)
+
+        featured_media_id = None
+        if image:
+            upload_image = image
+            if isinstance(image, bytes):
+                upload_image, kind = transcode_image(image, self.image_format)
+                if not cached and resumed is None:
+                    log(prefix, f"  - Image generated: {len(image) / 1024:.0f} KB"
+                                + (f", {kind.upper()} {len(upload_image) / 1024:.0f} KB" if upload_image is not image else ""))
+            else:
+                log(prefix, f"  - Image generated: {image}")
+            if not self.dry_run:
+                log(prefix, f"  - Uploading image to WordPress...")
+                upload = {}
+                with self.limits["wordpress"]:
+                    featured_media_id = upload_media(upload_image, self.wp_user, self.wp_pass, filename=headline, stats=upload)
+                if featured_media_id:
+                    detail = f" ({upload['bytes'] / 1024:.0f} KB {upload['mime_type']} in {upload['seconds']:.1f}s)" if upload else ""
+                    log(prefix, f"  - Image uploaded. Media ID: {featured_media_id}{detail}")
+                    self._checkpoint(headline, "media", featured_media_id)
+                    if cache and isinstance(image, bytes):
+                        cache.set_media(cache_prompt, style, site, featured_media_id)
+                else:
+                    log(prefix, f"  - Failed to upload image.")
+        else:
+            log(prefix, f"  - Failed to generate image.")
+
+        return image, featured_media_id
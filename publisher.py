@@ -1,50 +1,396 @@
 import os
+import re
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
 import requests
 import base64
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from image_generator import MIME_TYPES, image_format
+from rate_limit import backoff_delays
+from telemetry import traced
 
-def upload_media(image_url: str, wp_user: str, wp_app_password: str) -> int:
+# Downloads larger than this spill from memory to a temporary file.
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# (connect, read) timeouts in seconds. Override the read timeouts with
+# WP_TIMEOUT and WP_UPLOAD_TIMEOUT.
+WP_TIMEOUT = (5.0, 30.0)
+WP_UPLOAD_TIMEOUT = (5.0, 120.0)
+
+WP_RETRIES = 3
+WP_BACKOFF_BASE = 1.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# WordPress accepts at most 25 requests per /batch/v1 call.
+BATCH_MAX_REQUESTS = 25
+
+class WordPressClient:
     """
-    Uploads an image to WordPress Media Library from a URL.
+    WordPress REST API client for one site and credential. It keeps one
+    keep-alive requests.Session, applies explicit connect/read timeouts and
+    retries 429/5xx responses and connection errors with jittered backoff
+    (honouring Retry-After).
+
+    Creating a post is not idempotent, so after a failure where the post may
+    have been created anyway (a 5xx or a timeout) the retry first looks for a
+    draft with the same title created since the first attempt.
+    """
+
+    def __init__(self, wp_url: str, wp_user: str, wp_app_password: str,
+                 timeout: Tuple[float, float] = WP_TIMEOUT, upload_timeout: Tuple[float, float] = WP_UPLOAD_TIMEOUT,
+                 retries: int = WP_RETRIES):
+        self.base_url = f"{wp_url.rstrip('/')}/wp-json"
+        self.timeout = timeout
+        self.upload_timeout = upload_timeout
+        self.retries = retries
+        self.session = requests.Session()
+        token = base64.b64encode(f"{wp_user}:{wp_app_password}".encode()).decode('utf-8')
+        self.session.headers["Authorization"] = f"Basic {token}"
+
+    def request(self, method: str, path: str, timeout: Tuple[float, float] = None, check=None, **kwargs) -> requests.Response:
+        """
+        Sends a request, retrying failures with jittered backoff.
+
+        429 responses and connect timeouts are always retried. Failures
+        after which the server may have done the work anyway (5xx, other
+        connection errors and timeouts) are retried for GET requests, and for other methods only
+        when `check` is given: it is called before the retry, and a non-None
+        result is returned instead of sending the request again.
+
+        Args:
+            method: The HTTP method.
+            path: Path below /wp-json, e.g. '/wp/v2/posts'.
+            timeout: (connect, read) timeout; defaults to the client's.
+            check: Looks up the result of an earlier attempt, or returns None.
+
+        Returns:
+            The successful response, or check's result wrapped so that
+            .json() returns it.
+
+        Raises:
+            requests.exceptions.RequestException: When the request fails for
+                good (raise_for_status for HTTP errors).
+        """
+        delays = backoff_delays(self.retries, base=WP_BACKOFF_BASE)
+        safe = method.upper() == "GET"
+        body = kwargs.get("data")
+        ambiguous = False
+        while True:
+            if ambiguous and check is not None:
+                found = check()
+                if found is not None:
+                    return _Found(found)
+            if hasattr(body, "seek"):
+                body.seek(0)
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Only a connect timeout guarantees the server never saw the request.
+                failed_early = isinstance(e, requests.exceptions.ConnectTimeout)
+                delay = next(delays, None) if (failed_early or safe or check is not None) else None
+                if delay is None:
+                    raise
+                ambiguous = ambiguous or not failed_early
+                print(f"    WordPress request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            status = response.status_code
+            if status in RETRY_STATUSES and (status == 429 or safe or check is not None):
+                delay = next(delays, None)
+                if delay is not None:
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    ambiguous = ambiguous or status != 429
+                    print(f"    WordPress returned {status}, retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+            response.raise_for_status()
+            return response
+
+    def create_post(self, post: Dict) -> Dict:
+        """
+        Creates a post and returns the created post object.
+        """
+        since = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - 60))
+        return self.request(
+            "POST", "/wp/v2/posts", json=post,
+            check=lambda: self.find_post(post.get("title"), post.get("status", "draft"), since),
+        ).json()
+
+    def find_post(self, title: str, status: str, after: str) -> Optional[Dict]:
+        """
+        Returns a post with exactly this title and status modified after `after`
+        (a GMT ISO timestamp), or None.
+        """
+        response = self.request("GET", "/wp/v2/posts", params={
+            "search": title, "status": status, "modified_after": after,
+            "context": "edit", "_fields": "id,link,title",
+        })
+        for post in response.json():
+            if (post.get("title") or {}).get("raw") == title:
+                return post
+        return None
+
+    def create_posts(self, posts: List[Dict]) -> List[Union[Dict, Exception]]:
+        """
+        Creates several posts through the /batch/v1 endpoint, in chunks of
+        BATCH_MAX_REQUESTS. Falls back to one request per post when the site
+        has no batch endpoint (WordPress before 5.6).
+
+        Returns:
+            For each post, the created post object or the exception for it.
+        """
+        results = []
+        for start in range(0, len(posts), BATCH_MAX_REQUESTS):
+            chunk = posts[start:start + BATCH_MAX_REQUESTS]
+            try:
+                response = self.request("POST", "/batch/v1", json={
+                    "validation": "normal",
+                    "requests": [{"method": "POST", "path": "/wp/v2/posts", "body": post} for post in chunk],
+                })
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    results.extend([e] * len(chunk))
+                    continue
+                results.extend(self._create_each(chunk))
+                continue
+            except requests.exceptions.RequestException as e:
+                # Out of retries: fail this chunk and go on with the next.
+                results.extend([e] * len(chunk))
+                continue
+
+            payload = response.json()
+            responses = payload.get("responses") or []
+            if payload.get("failed") == "validation":
+                # Nothing was created; the per-request errors explain why.
+                results.extend(WordPressBatchError(item.get("body")) for item in responses)
+                continue
+            for item in responses:
+                if 200 <= item.get("status", 0) < 300:
+                    results.append(item.get("body") or {})
+                else:
+                    results.append(WordPressBatchError(item.get("body")))
+        return results
+
+    def _create_each(self, posts: List[Dict]) -> List[Union[Dict, Exception]]:
+        results = []
+        for post in posts:
+            try:
+                results.append(self.create_post(post))
+            except requests.exceptions.RequestException as e:
+                results.append(e)
+        return results
+
+    def upload_media(self, body: Union[bytes, BinaryIO], size: int, filename: str, mime_type: str) -> Dict:
+        """
+        Uploads a file to the Media Library and returns the media object. The
+        filename should be unique: a retry first looks for media whose title
+        (WordPress derives it from the filename) matches.
+        """
+        stem = filename.rsplit(".", 1)[0]
+        return self.request("POST", "/wp/v2/media", timeout=self.upload_timeout, data=body, headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Type": mime_type,
+            "Content-Length": str(size),
+        }, check=lambda: self.find_media(stem)).json()
+
+    def find_media(self, title: str) -> Optional[Dict]:
+        """
+        Returns a media item with exactly this title, or None.
+        """
+        response = self.request("GET", "/wp/v2/media", params={"search": title, "context": "edit", "_fields": "id,title"})
+        for media in response.json():
+            if (media.get("title") or {}).get("raw") == title:
+                return media
+        return None
+
+    def media_exists(self, media_id: int) -> bool:
+        try:
+            self.request("GET", f"/wp/v2/media/{media_id}", params={"_fields": "id"})
+            return True
+        except requests.exceptions.HTTPError:
+            return False
+
+    def close(self):
+        self.session.close()
+
+class _Found:
+    """
+    The result of an earlier attempt, found by a request's check.
+    """
+
+    def __init__(self, value: Dict):
+        self.value = value
+
+    def json(self) -> Dict:
+        return self.value
+
+class WordPressBatchError(Exception):
+    """
+    One failed request inside a /batch/v1 call.
+    """
+
+    def __init__(self, body):
+        body = body or {}
+        super().__init__(body.get("message") or str(body))
+        self.code = body.get("code")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_wordpress_client(wp_user: str, wp_app_password: str, wp_url: str = None) -> WordPressClient:
+    """
+    Returns the shared client for a site and credential (WP_URL by default),
+    so every call with the same credential reuses one connection pool.
+    """
+    wp_url = wp_url or os.getenv("WP_URL")
+    key = (wp_url, wp_user, wp_app_password)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = WordPressClient(
+                wp_url, wp_user, wp_app_password,
+                timeout=(WP_TIMEOUT[0], float(os.getenv("WP_TIMEOUT", WP_TIMEOUT[1]))),
+                upload_timeout=(WP_UPLOAD_TIMEOUT[0], float(os.getenv("WP_UPLOAD_TIMEOUT", WP_UPLOAD_TIMEOUT[1]))),
+            )
+            _clients[key] = client
+        return client
+
+def reset_wordpress_clients():
+    """
+    Closes and drops the shared clients.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+def media_filename(stem: str, data: bytes = None, extension: str = "png") -> str:
+    """
+    Builds a unique upload filename: a slug of the stem plus a content hash
+    (or a random suffix when the bytes are not known up front).
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", (stem or "image").lower()).strip("-")[:50] or "image"
+    suffix = hashlib.sha256(data).hexdigest()[:12] if data is not None else uuid.uuid4().hex[:12]
+    return f"{slug}-{suffix}.{extension}"
+
+@traced("upload", failed=lambda result: result is None)
+def upload_media(image: Union[str, bytes], wp_user: str, wp_app_password: str,
+                 filename: str = None, stats: Optional[Dict] = None) -> int:
+    """
+    Uploads an image to WordPress Media Library, either from bytes in memory
+    or from a URL, which is streamed through a spooled temporary file.
     
     Args:
-        image_url: The URL of the image to upload.
+        image: The image bytes, or the URL of the image to upload.
         wp_user: The WordPress username.
         wp_app_password: The WordPress application password.
+        filename: Stem for the uploaded file name; a unique suffix and the
+            extension matching the image type are added.
+        stats: Optional dict filled with the bytes uploaded, the MIME type and
+            the upload time in seconds.
         
     Returns:
         The ID of the uploaded media, or None if failed.
     """
     wp_url = os.getenv("WP_URL")
-    if not all([wp_url, wp_user, wp_app_password, image_url]):
-        print("Error: Missing credentials or image URL for upload.")
+    if not all([wp_url, wp_user, wp_app_password, image]):
+        print("Error: Missing credentials or image for upload.")
         return None
-        
-    api_url = f"{wp_url.rstrip('/')}/wp-json/wp/v2/media"
-    credentials = f"{wp_user}:{wp_app_password}"
-    token = base64.b64encode(credentials.encode()).decode('utf-8')
-    
-    headers = {
-        "Authorization": f"Basic {token}",
-        "Content-Disposition": "attachment; filename=generated_image.png",
-        "Content-Type": "image/png"
-    }
     
     try:
-        # Download image first
-        img_response = requests.get(image_url)
-        img_response.raise_for_status()
-        image_data = img_response.content
+        client = get_wordpress_client(wp_user, wp_app_password, wp_url)
+        if isinstance(image, bytes):
+            body = image
+            size = len(image)
+            kind = image_format(image) or "png"
+            name = media_filename(filename, image, kind)
+        else:
+            body, size, kind = _download(image, client.upload_timeout)
+            name = media_filename(filename, None, kind)
+        mime_type = MIME_TYPES.get(kind, "application/octet-stream")
         
         # Upload to WordPress
-        response = requests.post(api_url, headers=headers, data=image_data)
-        response.raise_for_status()
+        started = time.monotonic()
+        try:
+            media = client.upload_media(body, size, name, mime_type)
+        finally:
+            if not isinstance(body, bytes):
+                body.close()
         
-        return response.json().get('id')
+        if stats is not None:
+            stats.update({"bytes": size, "mime_type": mime_type, "seconds": time.monotonic() - started})
+        return media.get('id')
         
     except Exception as e:
         print(f"Error uploading media: {e}")
         return None
 
+def media_exists(media_id: int, wp_user: str, wp_app_password: str) -> bool:
+    """
+    Checks that a media item still exists in the WordPress Media Library,
+    e.g. before reusing a cached media ID.
+    
+    Returns:
+        True if the media item could be fetched, False otherwise.
+    """
+    wp_url = os.getenv("WP_URL")
+    if not all([wp_url, wp_user, wp_app_password, media_id]):
+        return False
+    
+    try:
+        return get_wordpress_client(wp_user, wp_app_password, wp_url).media_exists(media_id)
+    except requests.exceptions.RequestException as e:
+        print(f"Error checking media {media_id}: {e}")
+        return False
+
+def _download(image_url: str, timeout: Tuple[float, float] = WP_UPLOAD_TIMEOUT) -> Tuple[BinaryIO, int, str]:
+    """
+    Streams an image into a spooled temporary file, with explicit
+    (connect, read) timeouts so a stalled image host cannot hang the run.
+
+    Returns:
+        A tuple of (file positioned at the start, size in bytes, image format).
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        with requests.get(image_url, stream=True, timeout=timeout) as img_response:
+            img_response.raise_for_status()
+            for chunk in img_response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+            content_type = img_response.headers.get("Content-Type", "").split(";")[0].strip()
+        size = spool.tell()
+        spool.seek(0)
+        kind = image_format(spool.read(16))
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    if kind is None:
+        kind = next((k for k, mime in MIME_TYPES.items() if mime == content_type), "png")
+    return spool, size, kind
+
+def post_data(title: str, content: str, status: str = 'draft', featured_media_id: int = None) -> Dict:
+    """
+    Builds the REST API body for a new post.
+    """
+    data = {
+        "title": title,
+        "content": content,
+        "status": status
+    }
+    
+    if featured_media_id:
+        data["featured_media"] = featured_media_id
+    return data
+
+@traced("publish", failed=lambda result: result.startswith("Error"))
 def publish_to_wordpress(title: str, content: str, wp_user: str, wp_app_password: str, status: str = 'draft', featured_media_id: int = None) -> str:
     """
     Publishes a post to a WordPress site via the REST API.
@@ -65,33 +411,43 @@ def publish_to_wordpress(title: str, content: str, wp_user: str, wp_app_password
     
     if not all([wp_url, wp_user, wp_app_password]):
         return "Error: WordPress credentials (WP_URL, wp_user, wp_app_password) are not fully set."
-        
-    # Ensure URL ends with /wp-json/wp/v2/posts
-    api_url = f"{wp_url.rstrip('/')}/wp-json/wp/v2/posts"
-    
-    credentials = f"{wp_user}:{wp_app_password}"
-    token = base64.b64encode(credentials.encode()).decode('utf-8')
-    
-    headers = {
-        "Authorization": f"Basic {token}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "title": title,
-        "content": content,
-        "status": status
-    }
-    
-    if featured_media_id:
-        data["featured_media"] = featured_media_id
     
     try:
-        response = requests.post(api_url, headers=headers, json=data)
-        response.raise_for_status()
+        post = get_wordpress_client(wp_user, wp_app_password, wp_url).create_post(
+            post_data(title, content, status, featured_media_id))
+        return f"Successfully published! Link: {post.get('link')}"
         
-        post_data = response.json()
-        return f"Successfully published! Link: {post_data.get('link')}"
+    except requests.exceptions.RequestException as e:
+        response = getattr(e, "response", None)
+        return f"Error publishing to WordPress: {e}. Response: {response.text if response is not None else 'None'}"
+
+@traced("publish", failed=lambda results: not all(ok for ok, _ in results))
+def publish_posts(posts: List[Dict], wp_user: str, wp_app_password: str) -> List[Tuple[bool, str]]:
+    """
+    Creates several posts for one credential in as few requests as possible
+    through the /batch/v1 endpoint.
+    
+    Args:
+        posts: Post bodies built with post_data().
+        wp_user: The WordPress username.
+        wp_app_password: The WordPress application password.
         
+    Returns:
+        For each post, a tuple of (success, message) in the style of
+        publish_to_wordpress().
+    """
+    wp_url = os.getenv("WP_URL")
+    if not all([wp_url, wp_user, wp_app_password]):
+        return [(False, "Error: WordPress credentials (WP_URL, wp_user, wp_app_password) are not fully set.")] * len(posts)
+    
+    try:
+        created = get_wordpress_client(wp_user, wp_app_password, wp_url).create_posts(posts)
     except requests.exceptions.RequestException as e:
-        return f"Error publishing to WordPress: {e}. Response: {response.text if 'response' in locals() else 'None'}"
+        created = [e] * len(posts)
+    results = []
+    for result in created:
+        if isinstance(result, Exception):
+            results.append((False, f"Error publishing to WordPress: {result}"))
+        else:
+            results.append((True, f"Successfully published! Link: {result.get('link')}"))
+    return results
@@ -0,0 +1,290 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second
+    up to `capacity`; acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1):
+        """
+        Takes `tokens` from the bucket, sleeping until they are available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+def backoff_delays(retries: int, base: float = 1.0, cap: float = 30.0) -> Iterator[float]:
+    """
+    Yields `retries` exponential backoff delays with full jitter, so parallel
+    workers that were rate limited together do not retry in lockstep.
+    """
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+# Adaptive limits for the model API. The concurrency window per model starts
+# at AI_CONCURRENCY_START, grows by one per window of successful responses
+# (additive increase) and halves on each 429 (multiplicative decrease).
+DEFAULT_START_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 32
+# How long a call may wait in the queue, across 429s, before it fails.
+DEFAULT_MAX_WAIT = 600.0
+# Pause after a 429 that carries no retry-after header.
+DEFAULT_RETRY_AFTER = 1.0
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses the reset durations in rate-limit headers ("20ms", "6m0s", "1.5s")
+    or a plain number of seconds.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _UNITS[unit] for amount, unit in parts)
+
+def retry_after(headers) -> Optional[float]:
+    """
+    Returns the delay in seconds requested by retry-after-ms or retry-after
+    (seconds or an HTTP date), or None when neither is present.
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class _ModelLimits:
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        # Latest budgets reported by the API, less what was sent since.
+        self.remaining = {"requests": None, "tokens": None}
+        self.reset_at = {"requests": 0.0, "tokens": 0.0}
+        self.buckets = {}
+        self.stats = {"calls": 0, "rate_limited": 0, "queued": 0, "waited": 0.0, "peak": 0}
+
+class AdaptiveLimiter:
+    """
+    Process-wide limiter for model API calls, keyed by model. Each model gets
+    an AIMD concurrency window, is paused after a 429 until its retry-after
+    has passed, and is paced by the x-ratelimit-remaining-requests/-tokens
+    budgets of recent responses so calls wait before the quota runs out
+    instead of failing. Fixed requests/tokens per minute ceilings can be set
+    per model as well (see configure()).
+    """
+
+    def __init__(self, start: float = DEFAULT_START_CONCURRENCY, maximum: float = DEFAULT_MAX_CONCURRENCY,
+                 minimum: float = 1, decrease: float = 0.5, max_wait: float = DEFAULT_MAX_WAIT,
+                 quotas: Optional[Dict[str, Dict[str, float]]] = None):
+        self.start = start
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.decrease = decrease
+        self.max_wait = max_wait
+        self.quotas = quotas or {}
+        self._models = {}
+        self._cond = threading.Condition()
+
+    def _state(self, model: str) -> _ModelLimits:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelLimits(min(self.maximum, max(self.minimum, self.start)))
+            quota = self.quotas.get(model, {})
+            for kind, unit in (("requests", "rpm"), ("tokens", "tpm")):
+                if quota.get(unit):
+                    state.buckets[kind] = TokenBucket(quota[unit] / 60.0, capacity=quota[unit])
+        return state
+
+    def _wait_for(self, state: _ModelLimits, tokens: int, now: float) -> Optional[float]:
+        """
+        Returns 0 when a call may start now, the seconds until it may, or
+        None to wait for a running call to finish.
+        """
+        if now < state.blocked_until:
+            return state.blocked_until - now
+        if state.in_flight >= int(state.limit):
+            return None
+        for kind, needed in (("requests", 1), ("tokens", tokens)):
+            remaining = state.remaining[kind]
+            if remaining is not None and needed and remaining < needed and now < state.reset_at[kind]:
+                return state.reset_at[kind] - now
+        return 0
+
+    def acquire(self, model: str, tokens: int = 0):
+        """
+        Blocks until a call to `model` estimated at `tokens` tokens may start,
+        and takes a slot in its window. Pair with release().
+        """
+        with self._cond:
+            state = self._state(model)
+            buckets = list(state.buckets.items())
+        for kind, bucket in buckets:
+            bucket.acquire(min(bucket.capacity, 1 if kind == "requests" else tokens))
+
+        started = time.monotonic()
+        with self._cond:
+            queued = False
+            while True:
+                now = time.monotonic()
+                wait = self._wait_for(state, tokens, now)
+                if wait == 0:
+                    break
+                queued = True
+                self._cond.wait(wait)
+            state.in_flight += 1
+            for kind, needed in (("requests", 1), ("tokens", tokens)):
+                if state.remaining[kind] is not None:
+                    state.remaining[kind] -= needed
+            stats = state.stats
+            stats["calls"] += 1
+            stats["peak"] = max(stats["peak"], state.in_flight)
+            if queued:
+                stats["queued"] += 1
+                stats["waited"] += time.monotonic() - started
+
+    def release(self, model: str):
+        with self._cond:
+            self._state(model).in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model: str, tokens: int = 0) -> Iterator[None]:
+        self.acquire(model, tokens)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def observe(self, model: str, status: int, headers=None):
+        """
+        Feeds back one API response: its rate-limit headers update the
+        remaining budgets, a success widens the window and a 429 halves it
+        and pauses the model until the retry-after has passed.
+        """
+        now = time.monotonic()
+        with self._cond:
+            state = self._state(model)
+            for kind in ("requests", "tokens"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}") if headers else None
+                if remaining is None:
+                    continue
+                try:
+                    state.remaining[kind] = int(float(remaining))
+                except ValueError:
+                    continue
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                state.reset_at[kind] = now + (reset if reset is not None else 60.0)
+            if status == 429:
+                state.stats["rate_limited"] += 1
+                state.limit = max(self.minimum, state.limit * self.decrease)
+                delay = retry_after(headers)
+                state.blocked_until = max(state.blocked_until, now + (DEFAULT_RETRY_AFTER if delay is None else delay))
+            elif 200 <= status < 300:
+                state.limit = min(self.maximum, state.limit + 1 / state.limit)
+            self._cond.notify_all()
+
+    def hold(self, model: str, delay: float):
+        """
+        Pauses new calls to `model` for `delay` seconds (never shortening an
+        earlier pause).
+        """
+        with self._cond:
+            state = self._state(model)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+
+    def limit(self, model: str) -> float:
+        with self._cond:
+            return self._state(model).limit
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        with self._cond:
+            for model, state in sorted(self._models.items()):
+                s = state.stats
+                if not s["calls"]:
+                    continue
+                lines.append(f"Rate limiter ({model}): {s['calls']} calls, window {state.limit:.1f} "
+                             f"(peak {s['peak']} in flight), {s['rate_limited']} rate limited, "
+                             f"{s['queued']} queued for {s['waited']:.1f}s")
+        return lines
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter() -> Optional[AdaptiveLimiter]:
+    """
+    Returns the process-wide model API limiter, or None when AI_RATE_LIMITER
+    is 'off'. Configured from AI_CONCURRENCY_START, AI_CONCURRENCY_MAX,
+    AI_RATE_LIMIT_MAX_WAIT and AI_RATE_LIMITS, a JSON object of fixed
+    per-minute ceilings per model, e.g. {"gpt-5.1": {"rpm": 500, "tpm": 450000}}.
+    """
+    global _limiter
+    if os.getenv("AI_RATE_LIMITER", "on").lower() in ("off", "0", "false"):
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            quotas = os.getenv("AI_RATE_LIMITS")
+            _limiter = AdaptiveLimiter(
+                start=float(os.getenv("AI_CONCURRENCY_START", DEFAULT_START_CONCURRENCY)),
+                maximum=float(os.getenv("AI_CONCURRENCY_MAX", DEFAULT_MAX_CONCURRENCY)),
+                max_wait=float(os.getenv("AI_RATE_LIMIT_MAX_WAIT", DEFAULT_MAX_WAIT)),
+                quotas=json.loads(quotas) if quotas else None,
+            )
+        return _limiter
+
+def reset_limiter():
+    """
+    Drops the shared limiter so the next call re-reads the environment.
+    """
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
@@ -1,9 +1,61 @@
 import os
 import json
-from openai import OpenAI
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor
+from ai_client import chat_completion
 from ddgs import DDGS
-from typing import List, Dict, Tuple
+from ddgs.exceptions import RatelimitException
+from typing import List, Dict, Optional, Tuple
+from search_cache import get_search_cache
+from response_cache import is_replay
+from rate_limit import TokenBucket, backoff_delays
+from dedupe import shingles
+from telemetry import traced
 
+# Get top 2 results per query to keep it focused
+SEARCH_MAX_RESULTS = 2
+
+SEARCH_RETRIES = 3
+SEARCH_BACKOFF_BASE = 2.0
+
+# Estimated token budget for the research section of the story prompt.
+# Override with RESEARCH_TOKEN_BUDGET; zero or less disables trimming.
+DEFAULT_RESEARCH_BUDGET = 800
+# A source is only included if at least this much of its snippet fits.
+MIN_SNIPPET_TOKENS = 30
+
+# Query parameters that only track the click and never change the page.
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref", "cmpid")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+_search_limiter = None
+_search_limiter_lock = threading.Lock()
+
+def get_search_limiter() -> TokenBucket:
+    """
+    Returns the token bucket shared by every search in the process, including
+    other articles in flight. Configured from SEARCH_RATE_PER_SEC (default 1)
+    and SEARCH_BURST (default 3) on first use.
+    """
+    global _search_limiter
+    with _search_limiter_lock:
+        if _search_limiter is None:
+            _search_limiter = TokenBucket(
+                rate=float(os.getenv("SEARCH_RATE_PER_SEC", "1")),
+                capacity=float(os.getenv("SEARCH_BURST", "3")),
+            )
+        return _search_limiter
+
+def _is_analysis(content: str) -> bool:
+    try:
+        return bool(json.loads(content).get("thesis"))
+    except (ValueError, AttributeError):
+        return False
+
+@traced("analyze", failed=lambda result: not result[0])
 def analyze_headline(headline: str, personality_context: str) -> Tuple[str, List[str]]:
     """
     Analyzes a headline to derive a thesis and research points.
@@ -15,11 +67,6 @@ def analyze_headline(headline: str, personality_context: str) -> Tuple[str, List
     Returns:
         A tuple containing (thesis_statement, list_of_search_queries).
     """
-    api_key = os.getenv("AI_API_KEY")
-    base_url = os.getenv("AI_BASE_URL", "https://api.openai.com/v1")
-    
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
     system_prompt = "You are a research assistant. Your goal is to analyze news headlines and plan a research strategy."
     
     user_prompt = f"""
@@ -40,74 +87,274 @@ def analyze_headline(headline: str, personality_context: str) -> Tuple[str, List
     """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        content = chat_completion(
+            "analyze",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             response_format={"type": "json_object"},
             temperature=0.7,
+            validate=_is_analysis,
         )
         
-        data = json.loads(response.choices[0].message.content)
+        data = json.loads(content)
         return data.get("thesis", ""), data.get("queries", [])
         
     except Exception as e:
         print(f"Error analyzing headline: {e}")
         return "", []
 
-def perform_research(queries: List[str]) -> List[Dict]:
+@traced("search")
+def perform_research(queries: List[str], use_cache: bool = True) -> List[Dict]:
     """
-    Performs web searches for the given queries.
+    Performs web searches for the given queries. Results are served from the
+    search cache when the same query was run recently; the remaining queries
+    run in parallel through the shared search rate limiter.
     
     Args:
         queries: List of search query strings.
+        use_cache: Set to False to bypass the search cache.
         
     Returns:
-        List of dictionaries containing source info (title, url, snippet).
+        List of dictionaries containing source info (title, url, snippet),
+        in query order.
     """
+    queries = _query_strings(queries)
+    cache = get_search_cache() if use_cache else None
+    
+    by_query = {}
+    misses = []
+    for query in dict.fromkeys(queries):
+        cached = cache.get(query, SEARCH_MAX_RESULTS) if cache else None
+        if cached is not None:
+            print(f"  - Searching for: {query} (cached)")
+            by_query[query] = cached
+        else:
+            misses.append(query)
+    
+    if misses and is_replay():
+        # Replay runs are offline: only recorded search results are used.
+        for query in misses:
+            print(f"  - Skipping search for: {query} (not cached, replay mode)")
+        misses = []
+    
+    if misses:
+        with ThreadPoolExecutor(max_workers=len(misses)) as executor:
+            for query, search_results in zip(misses, executor.map(_search, misses)):
+                if search_results is None:
+                    continue
+                by_query[query] = search_results
+                if cache:
+                    try:
+                        cache.put(query, SEARCH_MAX_RESULTS, search_results)
+                    except OSError as e:
+                        print(f"    Warning: Could not cache results for '{query}': {e}")
+    
+    # Assemble in the original query order so format_citations output is stable.
     results = []
-    with DDGS() as ddgs:
-        for query in queries:
-            print(f"  - Searching for: {query}")
-            try:
-                # Get top 2 results per query to keep it focused
-                search_results = list(ddgs.text(query, max_results=2))
-                for res in search_results:
-                    results.append({
-                        "query": query,
-                        "title": res.get("title"),
-                        "url": res.get("href"),
-                        "snippet": res.get("body")
-                    })
-            except Exception as e:
-                print(f"    Error searching for '{query}': {e}")
+    for query in queries:
+        for res in by_query.get(query, []):
+            results.append({
+                "query": query,
+                "title": res.get("title"),
+                "url": res.get("href"),
+                "snippet": res.get("body")
+            })
                 
     return results
 
-def format_citations(research_results: List[Dict]) -> str:
+def _query_strings(queries) -> List[str]:
+    """
+    The model's queries as non-empty strings. {"query": ...} objects and
+    nested lists are unpacked; anything else is dropped.
+    """
+    if isinstance(queries, (str, dict)):
+        queries = [queries]
+    strings = []
+    for query in queries or []:
+        if isinstance(query, dict):
+            query = query.get("query")
+        if isinstance(query, (list, tuple)):
+            strings.extend(_query_strings(query))
+        elif isinstance(query, str) and query.strip():
+            strings.append(query.strip())
+    return strings
+
+def _search(query: str) -> Optional[List[Dict]]:
+    """
+    Runs one search through the shared rate limiter, retrying rate-limit
+    errors with jittered exponential backoff.
+    
+    Returns:
+        The raw results (title, href, body), or None if the search failed.
+    """
+    print(f"  - Searching for: {query}")
+    delays = backoff_delays(SEARCH_RETRIES, base=SEARCH_BACKOFF_BASE)
+    while True:
+        get_search_limiter().acquire()
+        try:
+            with DDGS() as ddgs:
+                return [
+                    {"title": res.get("title"), "href": res.get("href"), "body": res.get("body")}
+                    for res in ddgs.text(query, max_results=SEARCH_MAX_RESULTS)
+                ]
+        except RatelimitException as e:
+            delay = next(delays, None)
+            if delay is None:
+                print(f"    Error searching for '{query}': {e}")
+                return None
+            print(f"    Rate limited searching for '{query}', retrying in {delay:.1f}s")
+            time.sleep(delay)
+        except Exception as e:
+            print(f"    Error searching for '{query}': {e}")
+            return None
+
+def canonical_url(url: str) -> str:
+    """
+    Normalizes a URL so the same page found by different queries compares
+    equal: scheme, 'www.', fragment, trailing slash and tracking parameters
+    are ignored.
+    """
+    parts = urlsplit((url or "").strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(_TRACKING_PARAMS)
+    ))
+    return urlunsplit(("", host, parts.path.rstrip("/"), query, ""))
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local estimate of the model token count: one token per word or
+    punctuation mark, plus one for every further 8 characters of long words.
+    """
+    return sum(1 + len(token) // 8 for token in _TOKEN_RE.findall(text or ""))
+
+def dedupe_sources(research_results: List[Dict]) -> List[Dict]:
+    """
+    Drops results whose canonical URL was already seen, keeping the first
+    occurrence but the longest snippet.
+    """
+    by_url = {}
+    for result in research_results:
+        key = canonical_url(result.get("url")) or result.get("title")
+        kept = by_url.get(key)
+        if kept is None:
+            by_url[key] = dict(result)
+        elif len(result.get("snippet") or "") > len(kept.get("snippet") or ""):
+            kept["snippet"] = result.get("snippet")
+    return list(by_url.values())
+
+def rank_sources(research_results: List[Dict], thesis: str) -> List[Dict]:
+    """
+    Orders results by how many thesis terms their title and snippet share,
+    keeping the search order for ties.
+    """
+    terms = shingles(thesis)
+    if not terms:
+        return list(research_results)
+    def overlap(result):
+        return len(terms & shingles(f"{result.get('title') or ''} {result.get('snippet') or ''}"))
+    return sorted(research_results, key=overlap, reverse=True)
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    """
+    Cuts text to about `budget` estimated tokens at a word boundary.
+    """
+    words = (text or "").split()
+    used = 0
+    for i, word in enumerate(words):
+        used += estimate_tokens(word)
+        if used > budget:
+            return " ".join(words[:i]) + " ..." if i else ""
+    return " ".join(words)
+
+def _source_block(number: int, result: Dict, snippet: str, url_line: bool = False) -> str:
+    lines = [f"Source {number}:", f"Title: {result['title']}"]
+    if url_line:
+        lines.append(f"URL: {result['url']}")
+    if snippet:
+        lines.append(f"Snippet: {snippet}")
+    # MLA-ish citation (simplified for the generator to use); it carries the URL.
+    lines.append(f"MLA Citation: {mla_citation(result)}")
+    return "\n".join(lines) + "\n"
+
+def format_citations(research_results: List[Dict], thesis: str = "", budget: Optional[int] = None,
+                     stats: Optional[Dict] = None) -> str:
     """
-    Formats research results into a string with MLA-style citations.
+    Formats research results into a compact string with MLA-style citations.
+    Duplicate URLs are dropped, sources are ordered by relevance to the
+    thesis, and snippets are trimmed so the whole section fits the token budget.
     
     Args:
         research_results: List of research result dictionaries.
+        thesis: The thesis the sources are ranked against.
+        budget: Estimated token budget. Defaults to RESEARCH_TOKEN_BUDGET or
+            DEFAULT_RESEARCH_BUDGET; zero or less keeps every snippet whole.
+        stats: Optional dict filled with the estimated tokens before and after
+            compaction, the tokens saved and the source counts.
         
     Returns:
         A formatted string containing the research summary and citations.
     """
     if not research_results:
         return "No research data available."
-        
-    formatted_text = "RESEARCH DATA:\n\n"
-    
-    # Group by query for readability in the prompt
-    for i, result in enumerate(research_results, 1):
-        formatted_text += f"Source {i}:\n"
-        formatted_text += f"Title: {result['title']}\n"
-        formatted_text += f"URL: {result['url']}\n"
-        formatted_text += f"Snippet: {result['snippet']}\n"
-        # MLA-ish citation (simplified for the generator to use)
-        formatted_text += f"MLA Citation: {result['title']}. <a href='{result['url']}'>{result['url']}</a>. Accessed via Web Search.\n\n"
-        
+    if budget is None:
+        budget = int(os.getenv("RESEARCH_TOKEN_BUDGET", DEFAULT_RESEARCH_BUDGET))
+
+    header = "RESEARCH DATA:\n"
+    sources = rank_sources(dedupe_sources(research_results), thesis)
+
+    blocks = []
+    if budget > 0:
+        # Every kept source costs its title and citation plus room for a
+        # useful snippet; fit as many as the budget allows (at least one),
+        # then share what is left among the snippets.
+        remaining = budget - estimate_tokens(header)
+        kept = []
+        for result in sources:
+            cost = estimate_tokens(_source_block(len(kept) + 1, result, ""))
+            reserve = min(MIN_SNIPPET_TOKENS, estimate_tokens(result.get("snippet")))
+            if kept and cost + reserve > remaining:
+                break
+            kept.append(result)
+            remaining -= cost
+        for i, result in enumerate(kept):
+            snippet = trim_to_tokens(result.get("snippet"), max(0, remaining) // (len(kept) - i))
+            remaining -= estimate_tokens(snippet)
+            blocks.append(_source_block(i + 1, result, snippet))
+    else:
+        blocks = [_source_block(i, result, result.get("snippet")) for i, result in enumerate(sources, 1)]
+
+    formatted_text = "\n".join([header] + blocks)
+
+    if stats is not None:
+        original = "\n".join([header] + [
+            _source_block(i, result, result.get("snippet"), url_line=True)
+            for i, result in enumerate(research_results, 1)
+        ])
+        stats["tokens_before"] = estimate_tokens(original)
+        stats["tokens_after"] = estimate_tokens(formatted_text)
+        stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+        stats["sources_before"] = len(research_results)
+        stats["sources_after"] = len(blocks)
     return formatted_text
+
+def mla_citation(result: Dict) -> str:
+    """
+    Simplified MLA citation for one research result, with a clickable URL.
+    """
+    return f"{result['title']}. <a href='{result['url']}'>{result['url']}</a>. Accessed via Web Search."
+
+def works_cited(research_results: List[Dict]) -> str:
+    """
+    Builds an HTML Works Cited section from the research results (one entry
+    per page), or an empty string when there are none.
+    """
+    if not research_results:
+        return ""
+    items = "\n".join(f"<li>{mla_citation(result)}</li>" for result in dedupe_sources(research_results))
+    return f"<h2>Works Cited</h2>\n<ul>\n{items}\n</ul>"
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from search_cache import evict_lru
+
+RESPONSE_CACHE_DIR = os.path.join(".cache", "ai")
+DEFAULT_MAX_MB = 200
+
+# off:          always call the API, never touch the cache
+# read-through: serve hits from the cache, call the API and store on a miss
+# record:       always call the API and store the response
+# replay:       only serve from the cache; a miss raises CacheMiss (no network)
+MODES = ("off", "read-through", "record", "replay")
+
+class CacheMiss(RuntimeError):
+    """
+    Raised in replay mode when a request has no recorded response.
+    """
+
+def request_key(kind: str, **params) -> str:
+    """
+    Deterministic key for an API request: the hash of its canonical JSON form.
+    """
+    canonical = json.dumps({"kind": kind, **params}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Gzip-compressed on-disk cache of model responses keyed by request_key().
+    The least recently used entries are evicted past max_bytes.
+    """
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, mode: str = "read-through",
+                 max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        if mode not in MODES:
+            raise ValueError(f"Unknown AI cache mode '{mode}' (choose from {', '.join(MODES)})")
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError, EOFError):
+            self._count("misses")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count("hits")
+        return entry["response"]
+
+    def put(self, key: str, response: Dict):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({"created_at": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats["stored"] += 1
+            self.stats["evicted"] += evict_lru(self.directory, self.max_bytes, ".json.gz")
+
+    def invalidate(self, key: str) -> bool:
+        """
+        Removes one entry. Returns True if it existed.
+        """
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def clear(self) -> int:
+        """
+        Removes every entry and returns how many were removed.
+        """
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json.gz"):
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """
+        Returns the cached response if the cache mode allows serving it, or
+        None when the API has to be hit. Raises CacheMiss in replay mode.
+        """
+        if self.mode in ("read-through", "replay"):
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            if self.mode == "replay":
+                raise CacheMiss(f"No recorded response for request {key[:12]} (replay mode)")
+        return None
+
+    def store(self, key: str, response: Dict):
+        """
+        Like put(), but a failed write only prints a warning.
+        """
+        try:
+            self.put(key, response)
+        except OSError as e:
+            print(f"Warning: Could not store AI response in cache: {e}")
+
+    def fetch(self, key: str, call, validate: Optional[Callable[[Dict], bool]] = None) -> Dict:
+        """
+        Returns the response for a request according to the cache mode,
+        invoking call() (which must return a JSON-serializable dict) when the
+        API has to be hit.
+
+        Args:
+            validate: Whether a response may be stored. Responses it rejects
+                (empty or malformed content) are returned but not recorded,
+                so they are not replayed.
+        """
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        response = call()
+        if validate is None or validate(response):
+            self.store(key, response)
+        return response
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"AI cache ({self.mode}): {s['hits']} hits, {s['misses']} misses, {s['stored']} stored, {s['evicted']} evicted"
+
+_default_cache = None
+_default_lock = threading.Lock()
+_mode_override = None
+
+def configure(mode: str):
+    """
+    Sets the cache mode for the rest of the process (e.g. from --ai-cache),
+    overriding AI_CACHE_MODE.
+    """
+    global _mode_override, _default_cache
+    if mode not in MODES:
+        raise ValueError(f"Unknown AI cache mode '{mode}' (choose from {', '.join(MODES)})")
+    with _default_lock:
+        _mode_override = mode
+        _default_cache = None
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the process-wide response cache, or None when the mode is 'off'
+    (the default). Configured from AI_CACHE_MODE, AI_CACHE_DIR and AI_CACHE_MAX_MB.
+    """
+    global _default_cache
+    mode = _mode_override or os.getenv("AI_CACHE_MODE", "off")
+    if mode == "off":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                os.getenv("AI_CACHE_DIR", RESPONSE_CACHE_DIR),
+                mode=mode,
+                max_bytes=int(float(os.getenv("AI_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+            )
+        return _default_cache
+
+def is_replay() -> bool:
+    """
+    True when responses come only from the cache, so no API key is needed.
+    """
+    cache = get_response_cache()
+    return cache is not None and cache.mode == "replay"
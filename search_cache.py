@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from history_store import normalize_headline
+
+SEARCH_CACHE_DIR = os.path.join(".cache", "search")
+DEFAULT_TTL_HOURS = 12
+DEFAULT_MAX_MB = 50
+
+def evict_lru(directory: str, max_bytes: int, suffix: str) -> int:
+    """
+    Deletes the least recently used files ending in `suffix` (by mtime) until
+    the directory holds at most max_bytes of them.
+
+    Returns:
+        The number of files removed.
+    """
+    files = []
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+        total -= size
+    return removed
+
+class SearchCache:
+    """
+    Content-addressed on-disk cache for web search results. Each entry is a
+    JSON file named by the hash of the normalized query and max_results.
+    Entries expire after a TTL, and the least recently used entries are
+    evicted once the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory: str = SEARCH_CACHE_DIR, ttl_seconds: float = DEFAULT_TTL_HOURS * 3600,
+                 max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(query: str, max_results: int) -> str:
+        normalized = normalize_headline(query)
+        return hashlib.sha256(json.dumps([normalized, max_results]).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, query: str, max_results: int) -> Optional[List[Dict]]:
+        """
+        Returns the cached results for a query, or None on a miss.
+        """
+        path = self._path(self.key(query, max_results))
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            self._count("expired")
+            self._count("misses")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        # Touch the file so eviction sees it as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count("hits")
+        return entry["results"]
+
+    def put(self, query: str, max_results: int, results: List[Dict]):
+        """
+        Stores results for a query, then evicts old entries if over budget.
+        """
+        path = self._path(self.key(query, max_results))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"query": query, "max_results": max_results, "created_at": time.time(), "results": results}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            self.stats["evicted"] += evict_lru(self.directory, self.max_bytes, ".json")
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def summary(self) -> str:
+        s = self.stats
+        lookups = s["hits"] + s["misses"]
+        rate = s["hits"] / lookups * 100 if lookups else 0
+        return (f"Search cache: {s['hits']} hits, {s['misses']} misses ({rate:.0f}% hit rate), "
+                f"{s['expired']} expired, {s['evicted']} evicted")
+
+_default_cache = None
+_default_lock = threading.Lock()
+_enabled = True
+
+def disable():
+    """
+    Bypasses the search cache for the rest of the process (e.g. --no-search-cache).
+    """
+    global _enabled
+    _enabled = False
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    Returns the process-wide search cache, configured from SEARCH_CACHE_DIR,
+    SEARCH_CACHE_TTL_HOURS and SEARCH_CACHE_MAX_MB, or None when the cache is
+    bypassed (disable() or SEARCH_CACHE=off).
+    """
+    global _default_cache
+    if not _enabled or os.getenv("SEARCH_CACHE", "on").lower() in ("off", "0", "false"):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SearchCache(
+                os.getenv("SEARCH_CACHE_DIR", SEARCH_CACHE_DIR),
+                ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_HOURS", DEFAULT_TTL_HOURS)) * 3600,
+                max_bytes=int(float(os.getenv("SEARCH_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+            )
+        return _default_cache
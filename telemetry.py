@@ -0,0 +1,444 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# USD per million tokens (prompt, completion). Models are matched by the
+# longest prefix, so dated snapshots (gpt-4o-2024-08-06) use their family price.
+# Override or extend with MODEL_PRICES, e.g. '{"gpt-5.1": [1.25, 10]}'.
+DEFAULT_TOKEN_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-5.1": (1.25, 10.00),
+}
+
+# USD per image by (model, size, quality).
+DEFAULT_IMAGE_PRICES = {
+    ("dall-e-3", "1024x1024", "standard"): 0.040,
+    ("dall-e-3", "1024x1024", "hd"): 0.080,
+    ("dall-e-3", "1792x1024", "standard"): 0.080,
+    ("dall-e-3", "1792x1024", "hd"): 0.120,
+    ("dall-e-3", "1024x1792", "standard"): 0.080,
+    ("dall-e-3", "1024x1792", "hd"): 0.120,
+}
+
+METRIC_PREFIX = "storybuilder"
+
+# Latency samples kept per stage and per personality for the percentiles;
+# a long-running process keeps the most recent ones. Counts and totals
+# cover every sample.
+SAMPLE_LIMIT = 10000
+
+_NOOP = nullcontext()
+_article = contextvars.ContextVar("telemetry_article", default=None)
+_stage = contextvars.ContextVar("telemetry_stage", default=None)
+_telemetry = None
+
+def percentile(values: Iterable[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of a list of values (0 for an empty list).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(fraction * len(ordered)))) - 1]
+
+class ArticleRecord:
+    """
+    Timings, token usage and cost of one article, written as one JSONL record
+    when the article finishes. Extra fields (title, outcome, ...) can be set
+    with set().
+    """
+
+    def __init__(self, personality: str, headline: str):
+        self.personality = personality
+        self.headline = headline
+        self.started_at = time.time()
+        self.spans = {}   # stage -> [count, seconds]
+        self.tokens = {}  # model -> [calls, prompt tokens, completion tokens]
+        self.images = 0
+        self.cost = 0.0
+        self.fields = {}
+        self._lock = threading.Lock()
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def to_dict(self, seconds: float) -> Dict:
+        with self._lock:
+            record = {
+                "type": "article",
+                "personality": self.personality,
+                "headline": self.headline,
+                "started_at": round(self.started_at, 3),
+                "seconds": round(seconds, 3),
+                "stages": {stage: round(total, 3) for stage, (_, total) in self.spans.items()},
+                "tokens": {model: {"calls": calls, "prompt": prompt, "completion": completion}
+                           for model, (calls, prompt, completion) in self.tokens.items()},
+                "images": self.images,
+                "cost_usd": round(self.cost, 6),
+            }
+            record.update(self.fields)
+        return record
+
+class Span:
+    """
+    An open stage span. Set failed for a stage that reports its failure in
+    its return value instead of raising.
+    """
+
+    def __init__(self):
+        self.failed = False
+
+class Telemetry:
+    """
+    Collects stage spans, model token usage and cost estimates for one run.
+    Each finished article is appended to a JSONL file; close() adds a run
+    summary record (p50/p95 latency per stage, tokens and cost per
+    personality) and optionally writes a Prometheus textfile for the node
+    exporter's textfile collector.
+    """
+
+    def __init__(self, path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                 token_prices: Optional[Dict] = None, image_prices: Optional[Dict] = None):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.token_prices = dict(DEFAULT_TOKEN_PRICES)
+        self.token_prices.update(token_prices or {})
+        self.image_prices = dict(DEFAULT_IMAGE_PRICES)
+        self.image_prices.update(image_prices or {})
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stage_seconds = {}  # stage -> recent seconds
+        self._stage_totals = {}   # stage -> [count, seconds]
+        self._stage_errors = {}   # stage -> count
+        self._personalities = {}  # personality -> totals
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator["Span"]:
+        """
+        Times a stage; the duration is added to the current article (if any)
+        and to the run's latency distribution for the stage. The stage counts
+        as failed if it raises or the yielded Span is marked failed.
+        """
+        token = _stage.set(stage)
+        start = time.perf_counter()
+        current = Span()
+        try:
+            yield current
+        except BaseException:
+            current.failed = True
+            raise
+        finally:
+            _stage.reset(token)
+            self._add_span(stage, time.perf_counter() - start, current.failed)
+
+    def _add_span(self, stage: str, seconds: float, failed: bool):
+        record = _article.get()
+        if record is not None:
+            with record._lock:
+                totals = record.spans.setdefault(stage, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+        with self._lock:
+            self._stage_seconds.setdefault(stage, deque(maxlen=SAMPLE_LIMIT)).append(seconds)
+            totals = self._stage_totals.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            if failed:
+                self._stage_errors[stage] = self._stage_errors.get(stage, 0) + 1
+
+    @contextmanager
+    def article(self, personality: str, headline: str) -> Iterator[ArticleRecord]:
+        """
+        Attributes the spans and usage recorded in this context to one
+        article. Worker threads are included when their tasks run in a copy
+        of the caller's context (contextvars.copy_context().run).
+        """
+        record = ArticleRecord(personality, headline)
+        token = _article.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            _article.reset(token)
+            self._finish_article(record, time.perf_counter() - start)
+
+    def _finish_article(self, record: ArticleRecord, seconds: float):
+        data = record.to_dict(seconds)
+        line = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            totals = self._totals(record.personality)
+            totals["articles"] += 1
+            totals["seconds"].append(seconds)
+            outcome = data.get("outcome", "unknown")
+            totals["outcomes"][outcome] = totals["outcomes"].get(outcome, 0) + 1
+            if self._file:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def _totals(self, personality: str) -> Dict:
+        return self._personalities.setdefault(personality, {
+            "articles": 0, "seconds": deque(maxlen=SAMPLE_LIMIT), "outcomes": {}, "tokens": {}, "images": 0, "cost": 0.0})
+
+    def token_price(self, model: str):
+        for name in sorted(self.token_prices, key=len, reverse=True):
+            if model.startswith(name):
+                return self.token_prices[name]
+        return None
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int):
+        """
+        Adds the billed tokens of one chat completion.
+        """
+        price = self.token_price(model)
+        cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6 if price else 0.0
+        record = _article.get()
+        if record is not None:
+            with record._lock:
+                usage = record.tokens.setdefault(model, [0, 0, 0])
+                usage[0] += 1
+                usage[1] += prompt_tokens
+                usage[2] += completion_tokens
+                record.cost += cost
+        with self._lock:
+            totals = self._totals(record.personality if record else "-")
+            usage = totals["tokens"].setdefault(model, [0, 0, 0])
+            usage[0] += 1
+            usage[1] += prompt_tokens
+            usage[2] += completion_tokens
+            totals["cost"] += cost
+
+    def record_image(self, model: str, size: str, quality: str):
+        """
+        Adds one billed image generation.
+        """
+        cost = self.image_prices.get((model, size, quality), 0.0)
+        record = _article.get()
+        if record is not None:
+            with record._lock:
+                record.images += 1
+                record.cost += cost
+        with self._lock:
+            totals = self._totals(record.personality if record else "-")
+            totals["images"] += 1
+            totals["cost"] += cost
+
+    def run_summary(self) -> Dict:
+        """
+        The run summary record: wall time, p50/p95 latency per stage, and
+        articles, tokens and cost per personality.
+        """
+        with self._lock:
+            stages = {stage: {
+                "count": self._stage_totals[stage][0],
+                "errors": self._stage_errors.get(stage, 0),
+                "p50": round(percentile(values, 0.5), 3),
+                "p95": round(percentile(values, 0.95), 3),
+                "total": round(self._stage_totals[stage][1], 3),
+            } for stage, values in sorted(self._stage_seconds.items())}
+            personalities = {personality: {
+                "articles": totals["articles"],
+                "outcomes": dict(totals["outcomes"]),
+                "p50": round(percentile(totals["seconds"], 0.5), 3),
+                "p95": round(percentile(totals["seconds"], 0.95), 3),
+                "prompt_tokens": sum(usage[1] for usage in totals["tokens"].values()),
+                "completion_tokens": sum(usage[2] for usage in totals["tokens"].values()),
+                "images": totals["images"],
+                "cost_usd": round(totals["cost"], 6),
+            } for personality, totals in sorted(self._personalities.items())}
+        return {
+            "type": "run",
+            "started_at": round(self.started_at, 3),
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "stages": stages,
+            "personalities": personalities,
+        }
+
+    def summary_lines(self, summary: Optional[Dict] = None) -> List[str]:
+        summary = summary or self.run_summary()
+        lines = [f"Run telemetry ({summary['seconds']:.1f}s):"]
+        for stage, s in summary["stages"].items():
+            errors = f", {s['errors']} errors" if s["errors"] else ""
+            lines.append(f"  {stage}: {s['count']} calls, p50 {s['p50']:.2f}s, p95 {s['p95']:.2f}s{errors}")
+        for personality, p in summary["personalities"].items():
+            lines.append(f"  {personality}: {p['articles']} articles, p50 {p['p50']:.1f}s, p95 {p['p95']:.1f}s, "
+                         f"{p['prompt_tokens'] + p['completion_tokens']:,} tokens, {p['images']} images, "
+                         f"~${p['cost_usd']:.4f}")
+        return lines
+
+    def write_prometheus(self, summary: Optional[Dict] = None):
+        """
+        Writes the run summary in the Prometheus text format. The file is
+        replaced atomically so the node exporter never reads a partial file.
+        """
+        summary = summary or self.run_summary()
+        name = METRIC_PREFIX
+        lines = [
+            f"# HELP {name}_stage_duration_seconds Stage latency in the last run.",
+            f"# TYPE {name}_stage_duration_seconds summary",
+        ]
+        for stage, s in summary["stages"].items():
+            label = f'stage="{_escape(stage)}"'
+            lines.append(f'{name}_stage_duration_seconds{{{label},quantile="0.5"}} {s["p50"]}')
+            lines.append(f'{name}_stage_duration_seconds{{{label},quantile="0.95"}} {s["p95"]}')
+            lines.append(f"{name}_stage_duration_seconds_sum{{{label}}} {s['total']}")
+            lines.append(f"{name}_stage_duration_seconds_count{{{label}}} {s['count']}")
+        lines += [f"# HELP {name}_stage_errors Failed stage calls in the last run.",
+                  f"# TYPE {name}_stage_errors gauge"]
+        lines += [f'{name}_stage_errors{{stage="{_escape(stage)}"}} {s["errors"]}' for stage, s in summary["stages"].items()]
+
+        lines += [f"# HELP {name}_articles Articles handled in the last run by outcome.",
+                  f"# TYPE {name}_articles gauge"]
+        for personality, p in summary["personalities"].items():
+            for outcome, count in p["outcomes"].items():
+                lines.append(f'{name}_articles{{personality="{_escape(personality)}",outcome="{_escape(outcome)}"}} {count}')
+        lines += [f"# HELP {name}_tokens Model tokens billed in the last run.",
+                  f"# TYPE {name}_tokens gauge"]
+        for personality, p in summary["personalities"].items():
+            for kind in ("prompt", "completion"):
+                lines.append(f'{name}_tokens{{personality="{_escape(personality)}",kind="{kind}"}} {p[kind + "_tokens"]}')
+        lines += [f"# HELP {name}_cost_dollars Estimated model cost of the last run.",
+                  f"# TYPE {name}_cost_dollars gauge"]
+        lines += [f'{name}_cost_dollars{{personality="{_escape(personality)}"}} {p["cost_usd"]}'
+                  for personality, p in summary["personalities"].items()]
+        lines += [f"# HELP {name}_run_duration_seconds Wall time of the last run.",
+                  f"# TYPE {name}_run_duration_seconds gauge",
+                  f"{name}_run_duration_seconds {summary['seconds']}",
+                  f"# HELP {name}_last_run_timestamp_seconds When the last run finished.",
+                  f"# TYPE {name}_last_run_timestamp_seconds gauge",
+                  f"{name}_last_run_timestamp_seconds {time.time():.0f}"]
+
+        tmp_path = f"{self.prometheus_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+    def close(self) -> List[str]:
+        """
+        Writes the run summary record (and the Prometheus textfile) and closes
+        the JSONL file.
+
+        Returns:
+            Human-readable summary lines.
+        """
+        summary = self.run_summary()
+        if self._file:
+            with self._lock:
+                self._file.write(json.dumps(summary) + "\n")
+                self._file.close()
+                self._file = None
+        if self.prometheus_path:
+            try:
+                self.write_prometheus(summary)
+            except OSError as e:
+                print(f"Warning: Could not write {self.prometheus_path}: {e}")
+        return self.summary_lines(summary)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def configure(path: Optional[str] = None, prometheus_path: Optional[str] = None) -> Telemetry:
+    """
+    Turns instrumentation on for the rest of the process. Prices can be
+    overridden with MODEL_PRICES (JSON: model -> [prompt, completion] USD
+    per million tokens).
+    """
+    global _telemetry
+    prices = json.loads(os.getenv("MODEL_PRICES", "{}"))
+    _telemetry = Telemetry(path, prometheus_path, token_prices={model: tuple(p) for model, p in prices.items()})
+    return _telemetry
+
+def get_telemetry() -> Optional[Telemetry]:
+    """
+    Returns the active Telemetry, or None when instrumentation is off.
+    """
+    return _telemetry
+
+def finish() -> List[str]:
+    """
+    Closes the active Telemetry and turns instrumentation off.
+
+    Returns:
+        Summary lines, or an empty list if instrumentation was off.
+    """
+    global _telemetry
+    telemetry, _telemetry = _telemetry, None
+    return telemetry.close() if telemetry else []
+
+def span(stage: str):
+    """
+    Times a stage when instrumentation is on. When it is off this returns a
+    shared no-op context manager. A span nested in a span of the same stage
+    is not counted twice.
+    """
+    telemetry = _telemetry
+    if telemetry is None or _stage.get() == stage:
+        return _NOOP
+    return telemetry.span(stage)
+
+def article(personality: str, headline: str):
+    """
+    Attributes everything recorded in this context to one article. Yields
+    the ArticleRecord, or None when instrumentation is off.
+    """
+    telemetry = _telemetry
+    if telemetry is None:
+        return _NOOP
+    return telemetry.article(personality, headline)
+
+def annotate(**fields):
+    """
+    Adds fields (outcome, title, ...) to the current article record, if any.
+    """
+    record = _article.get()
+    if record is not None:
+        record.set(**fields)
+
+def traced(stage: str, failed: Optional[Callable[[Any], bool]] = None):
+    """
+    Decorator that wraps every call of a stage function in span(stage).
+
+    Args:
+        failed: For functions that return their errors (an "Error" title,
+            None, ...) rather than raise them: whether a result is a failure,
+            so it is counted in the stage errors.
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _telemetry is None:
+                return fn(*args, **kwargs)
+            with span(stage) as current:
+                result = fn(*args, **kwargs)
+                if current is not None and failed is not None and failed(result):
+                    current.failed = True
+                return result
+        return wrapper
+    return decorate
+
+def record_usage(model: str, usage):
+    """
+    Adds the token usage of a completion response when instrumentation is on.
+    """
+    telemetry = _telemetry
+    if telemetry is None or usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0)
+    completion = getattr(usage, "completion_tokens", 0)
+    if isinstance(prompt, int) and isinstance(completion, int):
+        telemetry.record_usage(model, prompt, completion)
+
+def record_image(model: str, size: str, quality: str):
+    telemetry = _telemetry
+    if telemetry is not None:
+        telemetry.record_image(model, size, quality)
@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import patch, MagicMock, ANY
+import ai_client
+from openai import RateLimitError
+from researcher import analyze_headline
+
+class TestAIClient(unittest.TestCase):
+
+    def setUp(self):
+        ai_client.reset_clients()
+        self.addCleanup(ai_client.reset_clients)
+
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key', 'AI_BASE_URL': 'http://local/v1', 'AI_MAX_RETRIES': '5'})
+    def test_client_is_created_once_and_shared(self, mock_openai):
+        first = ai_client.get_client()
+        second = ai_client.get_client()
+
+        self.assertIs(first, second)
+        mock_openai.assert_called_once_with(api_key='key', base_url='http://local/v1', max_retries=5, http_client=ANY)
+
+    @patch.dict('os.environ', {'AI_MODEL_ANALYZE': 'gpt-4o-mini', 'AI_TIMEOUT_GENERATE': '42'})
+    def test_stage_models_and_timeouts_are_configurable(self):
+        self.assertEqual(ai_client.model_for("analyze"), "gpt-4o-mini")
+        self.assertEqual(ai_client.model_for("generate"), "gpt-5.1")
+        self.assertEqual(ai_client.model_for("image"), "dall-e-3")
+        self.assertEqual(ai_client.timeout_for("generate"), 42.0)
+        self.assertEqual(ai_client.timeout_for("analyze"), ai_client.STAGES["analyze"]["timeout"])
+
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_analyze_headline_uses_shared_client(self, mock_openai):
+        create = mock_openai.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = '{"thesis": "T", "queries": ["q"]}'
+
+        analyze_headline("Headline 1", "calm")
+        analyze_headline("Headline 2", "calm")
+
+        mock_openai.assert_called_once()
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(create.call_args[1]['model'], "gpt-4o")
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_metered_counts_billed_tokens(self, mock_openai, _):
+        response = mock_openai.return_value.chat.completions.create.return_value
+        response.choices[0].message.content = "ok"
+        response.usage.prompt_tokens = 100
+        response.usage.completion_tokens = 20
+
+        ai_client.chat_completion("analyze", [{"role": "user", "content": "hi"}])
+        with ai_client.metered() as usage:
+            ai_client.chat_completion("analyze", [{"role": "user", "content": "hi"}])
+            ai_client.chat_completion("generate", [{"role": "user", "content": "hi"}])
+
+        self.assertEqual((usage.calls, usage.prompt_tokens, usage.completion_tokens), (2, 200, 40))
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_rate_limited_calls_are_queued_and_retried(self, mock_openai, _):
+        def rate_limited(code=None):
+            response = MagicMock(status_code=429, headers={"retry-after-ms": "10"})
+            return RateLimitError("Rate limit reached", response=response, body={"code": code})
+
+        generate = mock_openai.return_value.images.generate
+        generate.side_effect = [rate_limited(), rate_limited(), MagicMock(data=[MagicMock(url="http://img")])]
+        self.assertEqual(ai_client.image_generation("A cat", "1024x1024", "standard"), "http://img")
+        self.assertEqual(generate.call_count, 3)
+        self.assertEqual(ai_client.get_limiter().summary_lines()[0].split(",")[0], "Rate limiter (dall-e-3): 3 calls")
+
+        generate.side_effect = [rate_limited("insufficient_quota")]
+        with self.assertRaises(RateLimitError):
+            ai_client.image_generation("A dog", "1024x1024", "standard")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+from unittest.mock import patch
+from checkpoints import CheckpointStore
+from feed_reader import FeedEntry
+from history_store import MemoryHistoryStore
+from pipeline import StoryPipeline, SharedState
+
+CONFIG = {"style": "analytical", "prompt_modifier": "calm"}
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+class TestCheckpointStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = CheckpointStore(None)
+        self.addCleanup(self.store.close)
+
+    def test_values_round_trip_per_personality(self):
+        self.store.put("alice", "Headline", "analysis", ["Thesis", ["q1"]])
+        self.store.put("alice", "Headline", "image", PNG)
+
+        self.assertEqual(self.store.get("alice", " headline ", "analysis"), ["Thesis", ["q1"]])
+        self.assertEqual(self.store.get("alice", "Headline", "image"), PNG)
+        self.assertIsNone(self.store.get("bob", "Headline", "analysis"))
+        self.assertEqual(self.store.pending(), 1)
+
+        self.store.clear("alice", "Headline")
+        self.assertIsNone(self.store.get("alice", "Headline", "analysis"))
+
+    def test_expired_checkpoints_are_ignored_and_purged(self):
+        self.store.put("alice", "Headline", "story", ["Title", "Content"])
+        self.store.ttl_seconds = 60
+
+        with patch('checkpoints.time.time', return_value=time.time() + 120):
+            self.assertIsNone(self.store.get("alice", "Headline", "story"))
+            self.assertEqual(self.store.purge(), 1)
+
+class TestPipelineResume(unittest.TestCase):
+
+    def make_pipeline(self, checkpoints):
+        shared = SharedState(MemoryHistoryStore(), checkpoints=checkpoints)
+        return StoryPipeline("alice", CONFIG, "user", "pass", shared)
+
+    @patch('pipeline.publish_to_wordpress', return_value="ok")
+    @patch('pipeline.perform_research', return_value=[{"title": "T", "url": "https://a.example/", "snippet": "s"}])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", ["query"]))
+    @patch('pipeline.generate_story', return_value=("Title", "Content"))
+    @patch('pipeline.generate_image', return_value=PNG)
+    def test_rerun_resumes_at_the_failed_upload(self, mock_image, mock_story, mock_analyze, mock_research, mock_publish):
+        checkpoints = CheckpointStore(None)
+        self.addCleanup(checkpoints.close)
+        entry = FeedEntry(title="Volcano erupts")
+
+        with patch('pipeline.upload_media', side_effect=RuntimeError("connection reset")):
+            self.assertEqual(self.make_pipeline(checkpoints).run([entry]), 0)
+        self.assertIsNotNone(checkpoints.get("alice", entry.title, "story"))
+
+        with patch('pipeline.upload_media', return_value=7):
+            self.assertEqual(self.make_pipeline(checkpoints).run([entry]), 1)
+
+        for mock in (mock_image, mock_story, mock_analyze, mock_research):
+            mock.assert_called_once()
+        self.assertEqual(mock_publish.call_args[1]["featured_media_id"], 7)
+        self.assertEqual(checkpoints.pending(), 0)
+
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", ["query"]))
+    @patch('pipeline.generate_story', return_value=("Title", "Content"))
+    @patch('pipeline.generate_image', return_value=PNG)
+    def test_dry_runs_leave_no_checkpoints(self, *mocks):
+        checkpoints = CheckpointStore(None)
+        self.addCleanup(checkpoints.close)
+        checkpoints.put("alice", "Volcano erupts", "story", ["Stale", "Old draft"])
+        pipeline = self.make_pipeline(checkpoints)
+        pipeline.dry_run = True
+
+        pipeline.run([FeedEntry(title="Volcano erupts"), FeedEntry(title="Flood warning")])
+
+        self.assertEqual(mocks[1].call_count, 2)
+        self.assertIsNone(checkpoints.get("alice", "Flood warning", "analysis"))
+        self.assertEqual(checkpoints.pending(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import os
+import signal
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from daemon import Daemon, FeedSchedule, POLL_BACKOFF
+from feed_reader import FeedEntry
+
+def entry(n, minute=None):
+    published = f"2026-01-05T10:{minute:02d}:00+00:00" if minute is not None else None
+    return FeedEntry(title=f"Story {n}", guid=f"guid-{n}", published=published)
+
+class TestFeedSchedule(unittest.TestCase):
+
+    def test_interval_follows_the_publish_cadence(self):
+        schedule = FeedSchedule("https://feed.example/", min_interval=60, max_interval=7200)
+
+        first = schedule.observe([entry(2, 20), entry(1, 0)], now=1000)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(schedule.interval, 600)  # half of the 20 minute gap
+        self.assertEqual(schedule.next_poll, 1600)
+
+        new = schedule.observe([entry(3, 40), entry(2, 20)], now=1600)
+        self.assertEqual([e.title for e in new], ["Story 3"])
+        self.assertEqual(schedule.interval, 600)
+
+    def test_quiet_feeds_back_off_up_to_the_maximum(self):
+        schedule = FeedSchedule("https://feed.example/", min_interval=60, max_interval=1000, interval=400)
+        schedule.observe([entry(1)], now=0)
+
+        schedule.observe([entry(1)], now=400)
+        self.assertEqual(schedule.interval, 400 * POLL_BACKOFF)
+        schedule.observe([entry(1)], now=1000)
+        schedule.observe([entry(1)], now=1900)
+        self.assertEqual(schedule.interval, 1000)
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.status_path = os.path.join(self.dir.name, "status.json")
+
+    def make_daemon(self, **pipelines):
+        for name, pipeline in pipelines.items():
+            pipeline.personality = name
+            pipeline.concurrency = 1
+            pipeline.failed = []
+            pipeline.run.side_effect = lambda entries: len(entries)
+        feeds = {"alice": ["https://a.example/"], "bob": ["https://a.example/", "https://b.example/"]}
+        subscriptions = {name: feeds[name] for name in pipelines}
+        return Daemon(list(pipelines.values()), subscriptions, status_path=self.status_path, cache=MagicMock())
+
+    def test_new_entries_go_to_each_subscriber_once(self):
+        alice, bob = MagicMock(), MagicMock()
+        daemon = self.make_daemon(alice=alice, bob=bob)
+        feeds = {"https://a.example/": [entry(1)], "https://b.example/": [entry(2)]}
+
+        with patch('daemon.fetch_sources', side_effect=lambda urls, cache: {url: feeds[url] for url in urls}) as fetch:
+            self.assertEqual(daemon.run_once(now=0), 3)
+            feeds["https://a.example/"] = [entry(3), entry(1)]
+            for schedule in daemon.schedules.values():
+                schedule.next_poll = 0
+            self.assertEqual(daemon.run_once(now=1), 2)
+
+        self.assertEqual(sorted(fetch.call_args_list[0][0][0]), ["https://a.example/", "https://b.example/"])
+        self.assertEqual([c[0][0][0].title for c in alice.run.call_args_list], ["Story 1", "Story 3"])
+        self.assertEqual(bob.run.call_count, 3)
+        self.assertEqual(daemon.run_once(now=2), 0)
+
+    def test_stop_finishes_the_chunk_in_flight_and_writes_status(self):
+        alice = MagicMock()
+        daemon = self.make_daemon(alice=alice)
+        def run(entries):
+            daemon.stop()
+            return len(entries)
+        alice.run.side_effect = run
+
+        with patch('daemon.fetch_sources', return_value={"https://a.example/": [entry(1), entry(2)]}):
+            self.assertEqual(daemon.run(), 1)
+
+        with open(self.status_path) as f:
+            status = json.load(f)
+        self.assertEqual(status["state"], "stopped")
+        self.assertEqual(status["stories"], 1)
+        self.assertIn("https://a.example/", status["feeds"])
+
+    def test_failed_entries_are_retried_on_the_next_poll(self):
+        alice = MagicMock()
+        daemon = self.make_daemon(alice=alice)
+        alice.failed = [entry(1)]
+        alice.run.side_effect = lambda entries: 0
+
+        with patch('daemon.fetch_sources', return_value={"https://a.example/": [entry(1)]}):
+            daemon.run_once(now=0)
+            alice.failed = []
+            daemon.schedules["https://a.example/"].next_poll = 0
+            daemon.run_once(now=1)
+            daemon.schedules["https://a.example/"].next_poll = 0
+            daemon.run_once(now=2)
+
+        self.assertEqual(alice.run.call_count, 2)
+
+    @patch('daemon.PURGE_INTERVAL', 0)
+    def test_expired_state_is_purged_while_running(self):
+        alice = MagicMock()
+        daemon = self.make_daemon(alice=alice)
+        alice.run.side_effect = lambda entries: daemon.stop() or len(entries)
+
+        with patch('daemon.fetch_sources', return_value={"https://a.example/": [entry(1)]}):
+            daemon.run()
+
+        alice.shared.purge_expired.assert_called_once()
+
+    def test_signal_is_reported_outside_the_handler(self):
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        daemon = self.make_daemon(alice=MagicMock())
+
+        with patch('builtins.print') as mock_print, patch('daemon.log') as mock_log:
+            daemon._handle_signal(signal.SIGTERM, None)
+            mock_print.assert_not_called()
+            mock_log.assert_not_called()
+            self.assertTrue(daemon.stopping)
+            daemon._report_signal()
+        self.assertIn("Received SIGTERM", mock_log.call_args[0][1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+import unittest
+from dedupe import NearDuplicateIndex
+
+class TestNearDuplicateIndex(unittest.TestCase):
+
+    def test_reworded_headline_is_a_near_duplicate(self):
+        index = NearDuplicateIndex(path=None)
+        self.assertIsNone(index.hold("Ethiopian volcano erupts for first time in 12,000 years", "", "mindy"))
+
+        match = index.hold("Volcano in Ethiopia erupts for the first time in 12,000 years", "", "mindy")
+        self.assertIsNotNone(match)
+        self.assertEqual(match[0], "Ethiopian volcano erupts for first time in 12,000 years")
+
+    def test_unrelated_headline_and_other_personality_are_not_matched(self):
+        index = NearDuplicateIndex(path=None)
+        index.record("Bank of England holds interest rates at 4%", "", "mike")
+
+        self.assertIsNone(index.find("Federal Reserve cuts interest rates by quarter point", "", "mike"))
+        self.assertIsNone(index.find("Bank of England holds interest rates at 4%", "", "mindy"))
+
+    def test_only_recorded_stories_are_indexed(self):
+        index = NearDuplicateIndex(path=None)
+        index.hold("Ethiopian volcano erupts for first time in 12,000 years", "", "mindy")
+        self.assertEqual(len(index), 0)
+        index.release("Ethiopian volcano erupts for first time in 12,000 years", "mindy")
+        self.assertIsNone(index.hold("Volcano in Ethiopia erupts for the first time in 12,000 years", "", "mindy"))
+
+        index.record("Volcano in Ethiopia erupts for the first time in 12,000 years", "", "mindy")
+        self.assertEqual(len(index), 1)
+        self.assertIsNotNone(index.hold("Ethiopian volcano erupts for first time in 12,000 years", "", "mindy"))
+
+    def test_distinct_events_with_similar_headlines_are_not_matched(self):
+        index = NearDuplicateIndex(path=None)
+        index.record("Bank of England holds interest rates at 4%", "", "mike")
+        self.assertIsNone(index.find("Bank of England raises interest rates at 4%", "", "mike"))
+        index.record("Powerful earthquake hits Japan", "", "mike")
+        self.assertIsNone(index.find("Powerful earthquake hits Turkey", "", "mike"))
+
+    def test_non_latin_headlines_are_compared_by_their_words(self):
+        index = NearDuplicateIndex(path=None)
+        self.assertIsNone(index.hold("Центробанк России повысил ключевую ставку до 21%", "", "mike"))
+        self.assertIsNone(index.hold("日本銀行が金利を引き上げ", "", "mike"))
+        self.assertIsNotNone(index.hold("Центробанк РФ повысил ключевую ставку до 21%", "", "mike"))
+        self.assertIsNotNone(index.hold("日本銀行が政策金利を引き上げ", "", "mike"))
+
+    def test_headlines_without_words_are_never_matched(self):
+        index = NearDuplicateIndex(path=None)
+        self.assertIsNone(index.hold("It is on", "", "mike"))
+        self.assertIsNone(index.hold("As it was", "", "mike"))
+        index.record("It is on", "", "mike")
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.find("As it was", "", "mike"))
+
+    def test_recorded_signatures_persist_within_window(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            index = NearDuplicateIndex(path)
+            index.record("Italian parliament unanimously votes to make femicide a crime", "", "alice")
+            index._conn.execute("INSERT INTO signatures SELECT personality, 'Stale story', ?, signature FROM signatures",
+                                (time.time() - 7 * 86400,))
+            index._conn.commit()
+            index.close()
+
+            index = NearDuplicateIndex(path, window_hours=48)
+            self.assertEqual(len(index), 1)
+            self.assertIsNotNone(index.find("Italian parliament unanimously votes to make femicide a crime", "", "alice"))
+            index.close()
+
+    def test_prune_drops_entries_older_than_the_window(self):
+        index = NearDuplicateIndex(path=None, window_hours=1)
+        index.record("Bank of England holds interest rates at 4%", "", "mike")
+        index.prune(now=time.time() + 7200)
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.find("Bank of England holds interest rates at 4%", "", "mike"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,27 +1,31 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from scraper import fetch_headlines
+import tempfile
+import os
+from scraper import fetch_headlines, FeedCache
+import ai_client
 from generator import generate_story
 from publisher import publish_to_wordpress
 
 class TestGravityStorybuilder(unittest.TestCase):
 
-    @patch('scraper.feedparser.parse')
-    def test_fetch_headlines(self, mock_parse):
-        # Mock feedparser response
-        mock_feed = MagicMock()
-        mock_feed.bozo = 0
-        mock_entry = MagicMock()
-        mock_entry.title = "Test Headline"
-        mock_feed.entries = [mock_entry]
-        mock_parse.return_value = mock_feed
+    @patch('scraper.requests.get')
+    def test_fetch_headlines(self, mock_get):
+        # Mock feed response
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {}
+        mock_get.return_value.iter_content.return_value = [
+            b"<rss version='2.0'><channel><item><title>Test Headline</title></item></channel></rss>"
+        ]
         
-        headlines = fetch_headlines(["http://test.com/rss"])
+        with tempfile.TemporaryDirectory() as tmp:
+            headlines = fetch_headlines(["http://test.com/rss"], cache=FeedCache(os.path.join(tmp, "feeds.json")))
         self.assertEqual(headlines, ["Test Headline"])
         
-    @patch('generator.OpenAI')
+    @patch('ai_client.OpenAI')
     @patch.dict('os.environ', {'AI_API_KEY': 'test_key'})
     def test_generate_story(self, mock_openai):
+        ai_client.reset_clients()
         # Mock OpenAI response
         mock_client = MagicMock()
         mock_response = MagicMock()
@@ -0,0 +1,163 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+import ai_client
+from generator import StoryStreamParser, MalformedStory, generate_story, generate_sectioned_story, generate_fused_story
+
+def stream_chunks(*texts):
+    chunks = []
+    for text in texts:
+        chunk = MagicMock()
+        chunk.choices[0].delta.content = text
+        chunks.append(chunk)
+    return chunks
+
+class TestStoryStreamParser(unittest.TestCase):
+
+    def test_title_event_fires_before_content_arrives(self):
+        titles = []
+        parser = StoryStreamParser(on_title=titles.append)
+
+        for piece in ["TIT", "LE: A New", " Dawn\nCON", "TENT: <h2>One</h2>"]:
+            parser.feed(piece)
+            if piece.startswith(" Dawn"):
+                self.assertEqual(titles, ["A New Dawn"])
+
+        parser.feed(" more text")
+        self.assertEqual(parser.close(), ("A New Dawn", "<h2>One</h2> more text"))
+        metrics = parser.metrics()
+        self.assertLessEqual(metrics["ttft"], metrics["time_to_title"])
+
+    def test_title_and_content_on_one_line(self):
+        parser = StoryStreamParser()
+        parser.feed("TITLE: Short CONTENT: Body")
+        self.assertEqual(parser.close(), ("Short", "Body"))
+
+    def test_malformed_output_is_detected_early(self):
+        parser = StoryStreamParser(max_preamble=20)
+        with self.assertRaises(MalformedStory):
+            parser.feed("Once upon a time, in a land far away")
+
+        parser = StoryStreamParser(max_gap=10)
+        parser.feed("TITLE: Fine\n")
+        with self.assertRaises(MalformedStory):
+            parser.feed("and then the story just started without a marker")
+
+        parser = StoryStreamParser(on_title=lambda title: False)
+        with self.assertRaises(MalformedStory):
+            parser.feed("TITLE: Rejected\n")
+
+    def test_stream_ending_without_content_is_malformed(self):
+        parser = StoryStreamParser()
+        parser.feed("TITLE: Only a title\n")
+        with self.assertRaises(MalformedStory):
+            parser.close()
+
+class TestStreamingGeneration(unittest.TestCase):
+
+    def setUp(self):
+        ai_client.reset_clients()
+        self.addCleanup(ai_client.reset_clients)
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_generate_story_streams(self, mock_openai, _):
+        create = mock_openai.return_value.chat.completions.create
+        create.return_value = stream_chunks("TITLE: Streamed\n", "CONTENT: Part one, ", "part two.")
+        titles, metrics = [], {}
+
+        title, content = generate_story("Headline", "calm", stream=True, on_title=titles.append, metrics=metrics)
+
+        self.assertEqual((title, content), ("Streamed", "Part one, part two."))
+        self.assertEqual(titles, ["Streamed"])
+        self.assertTrue(create.call_args[1]['stream'])
+        self.assertIsNotNone(metrics["time_to_title"])
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_malformed_stream_is_aborted(self, mock_openai, _):
+        stream = MagicMock()
+        consumed = []
+        def chunks():
+            for chunk in stream_chunks("I'm sorry, but " * 20, "never reached"):
+                consumed.append(chunk)
+                yield chunk
+        stream.__iter__.side_effect = chunks
+        mock_openai.return_value.chat.completions.create.return_value = stream
+
+        title, content = generate_story("Headline", "calm", stream=True)
+
+        self.assertEqual(title, "Error")
+        self.assertIn("malformed", content)
+        self.assertEqual(len(consumed), 1)
+        stream.close.assert_called_once()
+
+OUTLINE = json.dumps({"title": "Planned", "sections": [
+    {"heading": "First", "points": "a"}, {"heading": "Second", "points": "b"}, {"heading": "Third", "points": "c"}]})
+
+class TestSectionedGeneration(unittest.TestCase):
+
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_sections_are_stitched_in_order_and_retried_alone(self):
+        attempts = {}
+        def model(stage, messages, **kwargs):
+            prompt = messages[-1]["content"]
+            if stage == "outline":
+                return OUTLINE
+            heading = next(h for h in ("First", "Second", "Third") if f'"{h}", covering' in prompt)
+            attempts[heading] = attempts.get(heading, 0) + 1
+            if heading == "Second" and attempts[heading] == 1:
+                raise TimeoutError("slow section")
+            return f"<p>{heading} body</p>"
+
+        with patch('generator.chat_completion', side_effect=model):
+            title, content = generate_sectioned_story("Headline", "calm", "Thesis", "Research",
+                                                      works_cited="<h2>Works Cited</h2>")
+
+        self.assertEqual(title, "Planned")
+        self.assertEqual(content, "<h2>First</h2>\n<p>First body</p>\n\n<h2>Second</h2>\n<p>Second body</p>\n\n"
+                                  "<h2>Third</h2>\n<p>Third body</p>\n\n<h2>Works Cited</h2>")
+        self.assertEqual(attempts, {"First": 1, "Second": 2, "Third": 1})
+
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_failed_outline_falls_back_to_a_single_call(self):
+        def model(stage, messages, **kwargs):
+            return "not json" if stage == "outline" else "TITLE: Whole\nCONTENT: Body"
+
+        with patch('generator.chat_completion', side_effect=model):
+            self.assertEqual(generate_sectioned_story("Headline", "calm"), ("Whole", "Body"))
+
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_section_that_keeps_failing_errors_the_story(self):
+        def model(stage, messages, **kwargs):
+            if stage == "outline":
+                return OUTLINE
+            raise TimeoutError("down")
+
+        with patch('generator.chat_completion', side_effect=model):
+            title, content = generate_sectioned_story("Headline", "calm", retries=1)
+
+        self.assertEqual(title, "Error")
+        self.assertIn("down", content)
+
+class TestFusedGeneration(unittest.TestCase):
+
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_thesis_and_story_come_from_one_call(self):
+        reply = json.dumps({"thesis": "T", "title": "Fused", "content": "<h2>A</h2><p>B</p>"})
+        with patch('generator.chat_completion', return_value=reply) as mock_chat:
+            result = generate_fused_story("Headline", "calm", "Feed summary text")
+
+        self.assertEqual(result, ("T", "Fused", "<h2>A</h2><p>B</p>"))
+        self.assertEqual(mock_chat.call_count, 1)
+        self.assertIn("Feed summary text", mock_chat.call_args[1]["messages"][1]["content"])
+
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_unusable_reply_is_an_error(self):
+        with patch('generator.chat_completion', return_value='{"title": "No body"}'):
+            self.assertEqual(generate_fused_story("Headline", "calm")[1], "Error")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import json
+import select
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+import ai_client
+import hedging
+from hedging import Hedger
+
+class TestHedger(unittest.TestCase):
+
+    def test_fast_calls_are_not_hedged(self):
+        hedger = Hedger()
+        attempt = MagicMock(return_value="ok")
+        self.assertEqual(hedger.run("analyze", 1.0, attempt, "gpt-4o"), "ok")
+        attempt.assert_called_once_with("gpt-4o")
+        self.assertEqual(hedger.stats["analyze"].hedged, 0)
+        self.assertEqual(hedger.summary_lines(), [])
+
+    def test_slow_call_is_hedged_to_the_fallback_model_and_cancelled(self):
+        hedger = Hedger()
+        release = threading.Event()
+
+        def attempt(model):
+            if model == "gpt-5.1":
+                hedging.current_call().on_cancel(release.set)
+                release.wait(2)
+                raise TimeoutError("cut short")
+            return "fast"
+
+        started = time.monotonic()
+        self.assertEqual(hedger.run("generate", 0.05, attempt, "gpt-5.1", fallback="gpt-4o"), "fast")
+        self.assertLess(time.monotonic() - started, 1)
+        stats = hedger.stats["generate"]
+        self.assertEqual((stats.calls, stats.hedged, stats.hedge_wins, stats.fallback_wins, stats.cut_short),
+                         (1, 1, 1, 1, 1))
+        self.assertGreater(stats.cut_short_seconds, 0.04)
+        self.assertIn("Hedging (generate): 1 of 1 calls hedged, 1 won by the hedge (1 by the fallback model), "
+                      "1 losing calls cut short", hedger.summary_lines()[0])
+
+    def test_invalid_or_failed_responses_do_not_win(self):
+        hedger = Hedger()
+
+        def attempt(model):
+            if model == "primary":
+                time.sleep(0.1)
+                return "valid"
+            raise TimeoutError("hedge failed")
+
+        self.assertEqual(hedger.run("analyze", 0.01, attempt, "primary", fallback="backup"), "valid")
+
+        def invalid(model):
+            time.sleep(0.02 if model == "primary" else 0)
+            return f"{model} junk"
+
+        self.assertEqual(hedger.run("analyze", 0.01, invalid, "primary", fallback="backup",
+                                    validate=lambda result: False), "primary junk")
+
+    def test_hedges_are_capped_to_a_fraction_of_calls(self):
+        hedger = Hedger(max_fraction=0)
+        attempt = MagicMock(side_effect=lambda model: time.sleep(0.02) or model)
+        hedger.run("image", 0.001, attempt, "dall-e-3")
+        hedger.run("image", 0.001, attempt, "dall-e-3")
+        self.assertEqual(hedger.stats["image"].hedged, 1)
+        self.assertEqual(attempt.call_count, 3)
+
+class SlowModelHandler(BaseHTTPRequestHandler):
+    # Answers at once for every model but "slow", which never answers; notes
+    # when the client hangs up on it.
+    disconnected = threading.Event()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if body["model"] == "slow":
+            readable, _, _ = select.select([self.connection], [], [], 5)
+            if readable and not self.connection.recv(1):
+                self.disconnected.set()
+            return
+        reply = json.dumps({"id": "1", "object": "chat.completion", "created": 0, "model": body["model"],
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": body["model"]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+class TestHedgedCompletions(unittest.TestCase):
+
+    def setUp(self):
+        ai_client.reset_clients()
+        self.addCleanup(ai_client.reset_clients)
+        self.addCleanup(hedging.reset)
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key', 'AI_SLO_ANALYZE': '0.05', 'AI_FALLBACK_MODEL_ANALYZE': 'gpt-4o-mini'})
+    def test_chat_completion_falls_back_to_a_faster_model(self, mock_openai, _):
+        def create(model, **kwargs):
+            if model == "gpt-4o":
+                time.sleep(0.3)
+            return MagicMock(choices=[MagicMock(message=MagicMock(content=f'{{"thesis": "{model}"}}'))])
+
+        mock_openai.return_value.chat.completions.create.side_effect = create
+        hedging.configure(True)
+        content = ai_client.chat_completion("analyze", [{"role": "user", "content": "hi"}],
+                                            validate=lambda text: "thesis" in text)
+        self.assertEqual(content, '{"thesis": "gpt-4o-mini"}')
+
+        hedging.configure(False)
+        self.assertEqual(ai_client.chat_completion("analyze", [{"role": "user", "content": "hi"}]),
+                         '{"thesis": "gpt-4o"}')
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key', 'AI_FIRST_TOKEN_SLO_GENERATE': '0.05',
+                               'AI_FALLBACK_MODEL_GENERATE': 'gpt-4o'})
+    def test_stream_is_hedged_before_its_first_token(self, mock_openai, _):
+        streams = {}
+
+        def create(model, **kwargs):
+            stream = MagicMock()
+            def chunks():
+                if model == "gpt-5.1":
+                    time.sleep(0.3)
+                for text in (f"{model} ", "story"):
+                    yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text))])
+            stream.__iter__.side_effect = chunks
+            streams[model] = stream
+            return stream
+
+        mock_openai.return_value.chat.completions.create.side_effect = create
+        hedging.configure(True)
+        text = "".join(ai_client.chat_completion_stream("generate", [{"role": "user", "content": "hi"}]))
+        self.assertEqual(text, "gpt-4o story")
+        streams["gpt-4o"].close.assert_called_once()
+        streams["gpt-5.1"].close.assert_called_once()
+
+    def test_losing_request_is_cancelled_on_the_wire(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SlowModelHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        env = {'AI_API_KEY': 'key', 'AI_BASE_URL': f"http://127.0.0.1:{server.server_port}/v1",
+               'AI_MODEL_ANALYZE': 'slow', 'AI_SLO_ANALYZE': '0.1', 'AI_FALLBACK_MODEL_ANALYZE': 'fast'}
+
+        with patch.dict('os.environ', env), patch('ai_client.get_response_cache', return_value=None):
+            hedging.configure(True)
+            started = time.monotonic()
+            content = ai_client.chat_completion("analyze", [{"role": "user", "content": "hi"}])
+
+        self.assertEqual(content, "fast")
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertTrue(SlowModelHandler.disconnected.wait(1))
+        self.assertEqual(hedging.get_hedger().stats["analyze"].cut_short, 1)
+
+if __name__ == '__main__':
+    unittest.main()
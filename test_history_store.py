@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from history_store import SQLiteHistoryStore, normalize_headline
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "history.db")
+        self.legacy_path = os.path.join(self.tmp.name, "history.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_membership_is_per_personality_and_normalized(self):
+        store = SQLiteHistoryStore(self.db_path, legacy_file=None)
+        store.add("Markets  Rally After ‘Rate Cut’", "mike")
+
+        self.assertTrue(store.contains("markets rally after 'rate cut'", "mike"))
+        self.assertFalse(store.contains("Markets Rally After 'Rate Cut'", "mindy"))
+        self.assertEqual(normalize_headline("  A\tB  "), "a b")
+        store.close()
+
+    def test_entries_survive_reopen_and_expire(self):
+        store = SQLiteHistoryStore(self.db_path, legacy_file=None)
+        store.add("Old story", "alice")
+        store.close()
+
+        store = SQLiteHistoryStore(self.db_path, legacy_file=None)
+        self.assertTrue(store.contains("Old story", "alice"))
+        store._conn.execute("UPDATE processed SET processed_at = ?", (time.time() - 3600,))
+        store.add("New story", "alice")
+
+        self.assertEqual(store.evict(60), 1)
+        self.assertFalse(store.contains("Old story", "alice"))
+        self.assertTrue(store.contains("New story", "alice"))
+        store.close()
+
+    def test_legacy_history_is_imported_for_every_personality(self):
+        with open(self.legacy_path, 'w') as f:
+            json.dump(["Legacy headline"], f)
+
+        store = SQLiteHistoryStore(self.db_path, legacy_file=self.legacy_path)
+        self.assertTrue(store.contains("Legacy headline", "alice"))
+        self.assertTrue(store.contains("Legacy headline", "derick"))
+        store.close()
+
+    def test_corrupt_legacy_history_is_not_marked_imported(self):
+        with open(self.legacy_path, 'w') as f:
+            f.write("[not json")
+
+        store = SQLiteHistoryStore(self.db_path, legacy_file=self.legacy_path)
+        self.assertEqual(len(store), 0)
+        store.close()
+
+        with open(self.legacy_path, 'w') as f:
+            json.dump(["Recovered headline"], f)
+        store = SQLiteHistoryStore(self.db_path, legacy_file=self.legacy_path)
+        self.assertTrue(store.contains("Recovered headline", "mike"))
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from image_cache import ImageCache
+from pipeline import SharedState, StoryPipeline, build_image_prompt
+from history_store import MemoryHistoryStore
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 1000
+CONFIG = {"style": "analytical", "prompt_modifier": "Be precise."}
+SITE = ImageCache.site("https://example.com", "user")
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.tmp.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_round_trip_with_media_ids(self):
+        self.assertIsNone(self.cache.get("A  Prompt", "calm"))
+        self.cache.put("A  Prompt", "calm", PNG)
+        self.cache.set_media("a prompt", "calm", SITE, 42)
+
+        self.assertEqual(self.cache.get("a prompt", "calm"), (PNG, {SITE: 42}))
+        self.assertIsNone(self.cache.get("a prompt", "dark"))
+
+        self.cache.set_media("a prompt", "calm", SITE, None)
+        self.assertEqual(self.cache.get("a prompt", "calm"), (PNG, {}))
+
+    def test_least_recently_used_images_are_evicted(self):
+        for i in range(3):
+            self.cache.put(f"prompt {i}", "calm", PNG)
+            time.sleep(0.01)
+        self.cache.get("prompt 0", "calm")
+
+        self.cache.max_bytes = len(PNG) * 2
+        self.cache.put("prompt 3", "calm", PNG)
+
+        self.assertIsNotNone(self.cache.get("prompt 0", "calm"))
+        self.assertIsNone(self.cache.get("prompt 1", "calm"))
+        self.assertEqual(self.cache.stats["evicted"], 2)
+        self.assertEqual(len([name for name in os.listdir(self.tmp.name) if name.endswith(".png")]), 2)
+
+def build_prompt(headline):
+    return build_image_prompt(headline, "", "analytical")
+
+class TestPipelineImageReuse(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.tmp.name)
+        shared = SharedState(MemoryHistoryStore(), image_cache=self.cache)
+        self.pipeline = StoryPipeline("wallace", CONFIG, "user", "pass", shared)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    @patch.dict('os.environ', {'WP_URL': 'https://example.com'})
+    def test_retry_reuses_image_and_media_id(self):
+        with patch('pipeline.generate_image', return_value=PNG) as mock_image, \
+             patch('pipeline.upload_media', return_value=42) as mock_upload:
+            self.assertEqual(self.pipeline._image_branch("", "Headline", "First thesis"), (PNG, 42))
+            with patch('pipeline.media_exists', return_value=True):
+                self.assertEqual(self.pipeline._image_branch("", "Headline", "Other thesis"), (PNG, 42))
+
+        self.assertEqual(mock_image.call_count, 1)
+        self.assertEqual(mock_upload.call_count, 1)
+        self.assertEqual(self.cache.stats["reused_media"], 1)
+
+    @patch.dict('os.environ', {'WP_URL': 'https://example.com'})
+    def test_deleted_media_is_uploaded_again(self):
+        self.cache.put(build_prompt("Headline"), "analytical", PNG)
+        self.cache.set_media(build_prompt("Headline"), "analytical", SITE, 42)
+
+        with patch('pipeline.generate_image') as mock_image, \
+             patch('pipeline.media_exists', return_value=False), \
+             patch('pipeline.upload_media', return_value=43) as mock_upload:
+            self.assertEqual(self.pipeline._image_branch("", "Headline", "Thesis"), (PNG, 43))
+
+        mock_image.assert_not_called()
+        mock_upload.assert_called_once()
+        self.assertEqual(self.cache.get(build_prompt("Headline"), "analytical")[1], {SITE: 43})
+
+if __name__ == '__main__':
+    unittest.main()
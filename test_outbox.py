@@ -0,0 +1,111 @@
+import time
+import unittest
+from unittest.mock import patch
+import requests
+from feed_reader import FeedEntry
+from history_store import MemoryHistoryStore
+from outbox import Outbox, MAX_ATTEMPTS, drain, publish_item, publish_items
+from pipeline import StoryPipeline, SharedState
+from test_publisher import WordPressTestCase, response, PNG
+
+CONFIG = {"style": "analytical", "prompt_modifier": "calm"}
+
+@patch.dict('os.environ', {'WP_URL': 'https://example.com'})
+class TestOutbox(WordPressTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outbox = Outbox(None)
+        self.addCleanup(self.outbox.close)
+
+    def test_same_story_is_stored_once(self):
+        first = self.outbox.add("alice", "Markets Rally!", "Title", "<p>Body</p>", featured_media_id=3, image=PNG)
+        second = self.outbox.add("alice", "  markets RALLY!", "Other title", "<p>Other</p>")
+
+        self.assertEqual(first, second)
+        self.assertIsNone(self.outbox.get(first).image)
+        self.assertNotEqual(self.outbox.add("bob", "Markets Rally!", "Title", "<p>Body</p>"), first)
+        self.assertEqual(self.outbox.counts()["pending"], 2)
+
+    def test_drain_publishes_pending_items_once(self):
+        self.outbox.add("alice", "Headline", "Title", "<p>Body</p>", image=PNG)
+        self.session.request.side_effect = [response(201, {'id': 9}), response(201, {'link': 'https://example.com/p'})]
+
+        self.assertEqual(drain(self.outbox, {"alice": ("user", "pass")}), (1, 0))
+        self.assertEqual(self.calls(), [("POST", "/wp/v2/media"), ("POST", "/wp/v2/posts")])
+        self.assertEqual(self.session.request.call_args[1]['json']['featured_media'], 9)
+        self.assertEqual(self.outbox.counts(), {"pending": 0, "published": 1, "stuck": 0})
+        self.assertEqual(drain(self.outbox, {"alice": ("user", "pass")}), (0, 0))
+
+    def test_retry_finds_a_post_created_by_an_earlier_attempt(self):
+        item_id = self.outbox.add("alice", "Headline", "Title", "<p>Body</p>", featured_media_id=3)
+        self.session.request.side_effect = requests.exceptions.ReadTimeout("lost")
+
+        ok, message = publish_item(self.outbox, self.outbox.get(item_id), "user", "pass")
+        self.assertFalse(ok)
+        self.assertIn("kept in the outbox", message)
+
+        self.session.request.side_effect = None
+        self.session.request.return_value = response(200, [{'title': {'raw': 'Title'}, 'link': 'https://example.com/p'}])
+        ok, _ = publish_item(self.outbox, self.outbox.get(item_id), "user", "pass")
+
+        self.assertTrue(ok)
+        self.assertEqual(self.calls()[-1], ("GET", "/wp/v2/posts"))
+        self.assertNotIn(("POST", "/wp/v2/posts"), self.calls()[1:])
+
+    def test_fresh_items_share_one_batch_request(self):
+        ids = [self.outbox.add("alice", f"Headline {i}", f"Title {i}", "<p>Body</p>", featured_media_id=i + 1)
+               for i in range(2)]
+        self.session.request.return_value = response(207, {'responses': [
+            {'status': 201, 'body': {'link': 'https://example.com/1'}},
+            {'status': 500, 'body': {'message': 'db error'}},
+        ]})
+
+        results = publish_items(self.outbox, [self.outbox.get(i) for i in ids], "user", "pass")
+
+        self.assertEqual([ok for ok, _ in results], [True, False])
+        self.assertEqual(self.calls(), [("POST", "/batch/v1")])
+        self.assertEqual(self.outbox.counts()["pending"], 1)
+
+    def test_items_out_of_attempts_are_stuck(self):
+        item_id = self.outbox.add("alice", "Headline", "Title", "<p>Body</p>")
+        for _ in range(MAX_ATTEMPTS):
+            self.outbox.begin_attempt(item_id)
+
+        self.assertEqual(self.outbox.pending(), [])
+        self.assertEqual(self.outbox.counts()["stuck"], 1)
+
+    def test_purge_removes_only_old_published_items(self):
+        published = self.outbox.add("alice", "Old", "Title", "<p>Body</p>")
+        self.outbox.mark_published(published, "https://example.com/old")
+        self.outbox.add("alice", "Waiting", "Title", "<p>Body</p>")
+
+        self.assertEqual(self.outbox.purge(3600), 0)
+        with patch('outbox.time.time', return_value=time.time() + 7200):
+            self.assertEqual(self.outbox.purge(3600), 1)
+        self.assertEqual(self.outbox.counts(), {"pending": 1, "published": 0, "stuck": 0})
+
+class TestPipelineOutbox(unittest.TestCase):
+
+    @patch('pipeline.generate_image', return_value=PNG)
+    @patch('pipeline.generate_story', return_value=("Title", "Content"))
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", []))
+    def test_failed_publish_stays_in_the_outbox(self, *mocks):
+        outbox = Outbox(None)
+        self.addCleanup(outbox.close)
+        shared = SharedState(MemoryHistoryStore(), outbox=outbox)
+        pipeline = StoryPipeline("alice", CONFIG, "user", "pass", shared)
+        entry = FeedEntry(title="Volcano erupts")
+
+        with patch('pipeline.upload_media', return_value=None), \
+             patch('pipeline.publish_item', return_value=(False, "Error")) as mock_publish:
+            self.assertEqual(pipeline.run([entry]), 0)
+
+        mock_publish.assert_called_once()
+        self.assertEqual(len(shared.history), 1)
+        [item] = outbox.pending("alice")
+        self.assertEqual((item.title, item.image), ("Title", PNG))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,16 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import ai_client
 from generator import generate_story
-from publisher import publish_to_wordpress
+from publisher import publish_to_wordpress, reset_wordpress_clients
 from personalities import PERSONALITIES
 
 class TestPersonalities(unittest.TestCase):
 
-    @patch('generator.OpenAI')
-    @patch('os.getenv')
-    def test_generate_story_uses_personality_context(self, mock_getenv, mock_openai):
-        mock_getenv.return_value = "fake_key"
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'fake_key'})
+    def test_generate_story_uses_personality_context(self, mock_openai):
+        ai_client.reset_clients()
         
         mock_client = MagicMock()
         mock_openai.return_value = mock_client
@@ -31,13 +32,16 @@ class TestPersonalities(unittest.TestCase):
         self.assertIn(personality_context, user_prompt)
         self.assertIn("REWRITE the title", user_prompt)
 
-    @patch('publisher.requests.post')
-    @patch('os.getenv')
-    def test_publish_to_wordpress_uses_credentials(self, mock_getenv, mock_post):
-        mock_getenv.return_value = "https://example.com" # for WP_URL
+    @patch('publisher.requests.Session')
+    @patch.dict('os.environ', {'WP_URL': 'https://example.com'})
+    def test_publish_to_wordpress_uses_credentials(self, mock_session):
+        reset_wordpress_clients()
+        self.addCleanup(reset_wordpress_clients)
+        session = mock_session.return_value
+        session.headers = {}
         
-        mock_post.return_value.status_code = 201
-        mock_post.return_value.json.return_value = {'link': 'http://example.com/post'}
+        session.request.return_value.status_code = 201
+        session.request.return_value.json.return_value = {'link': 'http://example.com/post'}
         
         title = "Test Title"
         content = "Test Content"
@@ -47,9 +51,7 @@ class TestPersonalities(unittest.TestCase):
         publish_to_wordpress(title, content, wp_user, wp_pass)
         
         # Check if credentials were used in the auth header
-        call_args = mock_post.call_args
-        headers = call_args[1]['headers']
-        auth_header = headers['Authorization']
+        auth_header = session.headers['Authorization']
         
         # Base64 encode "test_user:test_pass" -> "dGVzdF91c2VyOnRlc3RfcGFzcw=="
         expected_token = "dGVzdF91c2VyOnRlc3RfcGFzcw=="
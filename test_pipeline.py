@@ -0,0 +1,169 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from pipeline import SharedState, StoryPipeline
+from feed_reader import FeedEntry
+from history_store import MemoryHistoryStore
+from dedupe import NearDuplicateIndex
+
+CONFIG = {"style": "analytical", "prompt_modifier": "Be precise."}
+
+def entries(*titles):
+    return [FeedEntry(title=title) for title in titles]
+
+class TestStoryPipeline(unittest.TestCase):
+
+    def make_pipeline(self, stage_limits=None, near_duplicates=None, **kwargs):
+        shared = SharedState(MemoryHistoryStore(), stage_limits=stage_limits, near_duplicates=near_duplicates)
+        return StoryPipeline("wallace", CONFIG, "user", "pass", shared, **kwargs)
+
+    @patch('pipeline.publish_to_wordpress', return_value="Successfully published!")
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.generate_image', return_value="http://img/1.png")
+    @patch('pipeline.generate_story', side_effect=lambda headline, *args: (f"Title {headline}", "Content"))
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", ["q1"]))
+    def test_concurrent_run_records_every_headline(self, *mocks):
+        pipeline = self.make_pipeline(concurrency=3)
+        headlines = entries("A", "B", "C", "D", "B")
+
+        count = pipeline.run(headlines)
+
+        self.assertEqual(count, 4)
+        self.assertEqual(len(pipeline.shared.history), 4)
+        for headline in "ABCD":
+            self.assertTrue(pipeline.shared.history.contains(headline, "wallace"))
+
+    @patch('pipeline.publish_to_wordpress', return_value="Successfully published!")
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.generate_image', return_value="http://img/1.png")
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", []))
+    def test_stage_limit_caps_in_flight_calls(self, *mocks):
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow_story(headline, *args):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+            return "Title", "Content"
+
+        pipeline = self.make_pipeline(concurrency=4, stage_limits={"llm": 1})
+        with patch('pipeline.generate_story', side_effect=slow_story):
+            pipeline.run(entries("A", "B", "C", "D"))
+
+        self.assertEqual(state["peak"], 1)
+
+    @patch('pipeline.publish_to_wordpress', return_value="Successfully published!")
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", []))
+    def test_image_branch_overlaps_story_generation(self, mock_analyze, mock_research, mock_upload, mock_publish):
+        image_started = threading.Event()
+
+        def image(prompt, as_bytes=False):
+            image_started.set()
+            return b"\x89PNG\r\n\x1a\n" + b"0" * 64
+
+        def story(headline, *args):
+            # Only completes if the image branch runs while the story is generated.
+            self.assertTrue(image_started.wait(timeout=2))
+            return "Title", "Content"
+
+        pipeline = self.make_pipeline()
+        with patch('pipeline.generate_image', side_effect=image) as mock_image, \
+             patch('pipeline.generate_story', side_effect=story):
+            count = pipeline.run(entries("A headline"))
+
+        self.assertEqual(count, 1)
+        self.assertIn("A headline. Thesis", mock_image.call_args[0][0])
+        self.assertTrue(mock_image.call_args[1]['as_bytes'])
+        self.assertTrue(mock_upload.call_args[0][0].startswith(b"\x89PNG"))
+        self.assertEqual(mock_publish.call_args[1]['featured_media_id'], 7)
+
+    @patch('pipeline.publish_to_wordpress', return_value="Successfully published!")
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.generate_image', return_value="http://img/1.png")
+    @patch('pipeline.perform_research')
+    @patch('pipeline.analyze_headline')
+    def test_fused_mode_skips_analysis_and_research(self, mock_analyze, mock_research, *mocks):
+        shared = SharedState(MemoryHistoryStore())
+        fused = StoryPipeline("alice", dict(CONFIG, mode="fused"), "user", "pass", shared)
+        entry = FeedEntry(title="Volcano erupts", summary="Lava flows near the village.")
+
+        with patch('pipeline.generate_fused_story', return_value=("Thesis", "Title", "Content")) as mock_fused:
+            count = fused.run([entry])
+
+        self.assertEqual(count, 1)
+        mock_fused.assert_called_once_with("Volcano erupts", CONFIG["prompt_modifier"], "Lava flows near the village.")
+        mock_analyze.assert_not_called()
+        mock_research.assert_not_called()
+        self.assertIn("alice (fused): 1 articles", "\n".join(shared.draft_summary()))
+
+    @patch('pipeline.publish_to_wordpress')
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.generate_image', return_value="http://img/1.png")
+    @patch('pipeline.generate_story', side_effect=lambda headline, *args: (f"Title {headline}", "Content"))
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", []))
+    def test_batch_publish_creates_drafts_in_one_call(self, *mocks):
+        mock_publish = mocks[-1]
+        pipeline = self.make_pipeline(concurrency=2, batch_publish=True)
+
+        with patch('pipeline.publish_posts', return_value=[(True, "ok"), (False, "Error"), (True, "ok")]) as mock_batch:
+            count = pipeline.run(entries("A", "B", "C"))
+
+        mock_publish.assert_not_called()
+        mock_batch.assert_called_once()
+        self.assertEqual(len(mock_batch.call_args[0][0]), 3)
+        self.assertEqual(count, 2)
+        self.assertEqual(len(pipeline.shared.history), 2)
+
+    @patch('pipeline.publish_to_wordpress', return_value="Successfully published!")
+    @patch('pipeline.upload_media', return_value=7)
+    @patch('pipeline.generate_image', return_value="http://img/1.png")
+    @patch('pipeline.perform_research', return_value=[])
+    @patch('pipeline.analyze_headline', return_value=("Thesis", []))
+    def test_failed_story_releases_its_claim(self, *mocks):
+        pipeline = self.make_pipeline()
+        with patch('pipeline.generate_story', return_value=("Error", "timeout")):
+            self.assertEqual(pipeline.run(entries("A")), 0)
+        self.assertEqual([entry.title for entry in pipeline.failed], ["A"])
+
+        with patch('pipeline.generate_story', return_value=("Title", "Content")):
+            self.assertEqual(pipeline.run(entries("A")), 1)
+        self.assertEqual(pipeline.failed, [])
+        self.assertEqual(pipeline.shared._claimed, {})
+
+    @patch.dict('os.environ', {'HISTORY_TTL_DAYS': '30', 'OUTBOX_RETENTION_DAYS': '7'})
+    def test_purge_expired_purges_every_store(self):
+        history, outbox, checkpoints = MagicMock(), MagicMock(), MagicMock()
+        history.evict.return_value = outbox.purge.return_value = checkpoints.purge.return_value = 0
+        SharedState(history, outbox=outbox, checkpoints=checkpoints).purge_expired()
+        history.evict.assert_called_once_with(30 * 86400)
+        outbox.purge.assert_called_once_with(7 * 86400)
+        checkpoints.purge.assert_called_once_with()
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            StoryPipeline("alice", dict(CONFIG, mode="magic"), "user", "pass", SharedState(MemoryHistoryStore()))
+
+    def test_near_duplicates_are_skipped_before_any_model_call(self):
+        pipeline = self.make_pipeline(near_duplicates=NearDuplicateIndex(path=None))
+        with patch.object(pipeline, 'process_headline', return_value=True) as mock_process:
+            count = pipeline.run(entries(
+                "Ethiopian volcano erupts for first time in 12,000 years",
+                "Volcano in Ethiopia erupts for the first time in 12,000 years",
+            ))
+
+        self.assertEqual(count, 1)
+        self.assertEqual(mock_process.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
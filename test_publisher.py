@@ -0,0 +1,170 @@
+import base64
+import unittest
+from unittest.mock import patch, MagicMock
+import requests
+from image_generator import generate_image, transcode_image
+from publisher import (upload_media, media_filename, media_exists, publish_to_wordpress, publish_posts, post_data,
+                       get_wordpress_client, reset_wordpress_clients, WP_TIMEOUT, WP_UPLOAD_TIMEOUT)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+
+def response(status=200, body=None, headers=None):
+    mock = MagicMock(status_code=status, headers=headers or {})
+    mock.json.return_value = body if body is not None else {}
+    if status >= 400:
+        mock.raise_for_status.side_effect = requests.exceptions.HTTPError(f"{status}", response=mock)
+    return mock
+
+class WordPressTestCase(unittest.TestCase):
+
+    def setUp(self):
+        reset_wordpress_clients()
+        self.addCleanup(reset_wordpress_clients)
+        patcher = patch('publisher.requests.Session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.session.headers = {}
+        sleep = patch('publisher.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def calls(self):
+        return [(c[0][0], c[0][1].split("/wp-json", 1)[1]) for c in self.session.request.call_args_list]
+
+@patch.dict('os.environ', {'WP_URL': 'https://example.com'})
+class TestMediaUpload(WordPressTestCase):
+
+    def test_bytes_upload_skips_the_download_and_sets_mime_and_name(self):
+        self.session.request.return_value = response(201, {'id': 42})
+        stats = {}
+
+        with patch('publisher.requests.get') as mock_get:
+            media_id = upload_media(JPEG, "user", "pass", filename="Markets Rally!", stats=stats)
+
+        self.assertEqual(media_id, 42)
+        mock_get.assert_not_called()
+        headers = self.session.request.call_args[1]['headers']
+        self.assertEqual(headers['Content-Type'], "image/jpeg")
+        self.assertRegex(headers['Content-Disposition'], r"filename=markets-rally-[0-9a-f]{12}\.jpeg$")
+        self.assertEqual(stats["bytes"], len(JPEG))
+        self.assertIn("seconds", stats)
+
+    @patch('publisher.requests.get')
+    def test_url_upload_streams_the_download(self, mock_get):
+        download = mock_get.return_value.__enter__.return_value
+        download.iter_content.return_value = [PNG[:50], PNG[50:]]
+        download.headers = {"Content-Type": "image/png"}
+        sent = {}
+        def send(method, url, data=None, **kwargs):
+            sent["body"] = data.read()
+            sent["headers"] = kwargs["headers"]
+            return response(201, {"id": 7})
+        self.session.request.side_effect = send
+
+        self.assertEqual(upload_media("http://img/1.png", "user", "pass"), 7)
+        self.assertTrue(mock_get.call_args[1]['stream'])
+        self.assertEqual(mock_get.call_args[1]['timeout'], WP_UPLOAD_TIMEOUT)
+        self.assertEqual(sent["body"], PNG)
+        self.assertEqual(sent["headers"]['Content-Length'], str(len(PNG)))
+
+    def test_filenames_are_unique_per_image(self):
+        self.assertNotEqual(media_filename("Same headline", PNG), media_filename("Same headline", JPEG))
+        self.assertNotEqual(media_filename("Same headline"), media_filename("Same headline"))
+
+    def test_media_exists_checks_the_media_endpoint(self):
+        self.session.request.return_value = response(404)
+        self.assertFalse(media_exists(42, "user", "pass"))
+        self.assertEqual(self.calls()[-1], ("GET", "/wp/v2/media/42"))
+
+        self.session.request.return_value = response(200, {"id": 42})
+        self.assertTrue(media_exists(42, "user", "pass"))
+
+@patch.dict('os.environ', {'WP_URL': 'https://example.com'})
+class TestWordPressClient(WordPressTestCase):
+
+    def test_one_session_per_credential_with_timeouts(self):
+        self.session.request.return_value = response(201, {"link": "http://example.com/p"})
+
+        publish_to_wordpress("A", "Body", "user", "pass")
+        publish_to_wordpress("B", "Body", "user", "pass")
+
+        self.assertIs(get_wordpress_client("user", "pass"), get_wordpress_client("user", "pass"))
+        self.assertIsNot(get_wordpress_client("user", "pass"), get_wordpress_client("other", "pass"))
+        self.assertEqual(self.session.request.call_count, 2)
+        self.assertEqual(self.session.request.call_args[1]['timeout'], WP_TIMEOUT)
+
+    def test_rate_limited_post_is_retried(self):
+        self.session.request.side_effect = [
+            response(429, headers={"Retry-After": "2"}),
+            response(201, {"link": "http://example.com/p"}),
+        ]
+
+        result = publish_to_wordpress("A", "Body", "user", "pass")
+
+        self.assertIn("Successfully published", result)
+        self.assertEqual(self.calls(), [("POST", "/wp/v2/posts"), ("POST", "/wp/v2/posts")])
+        self.assertGreaterEqual(self.sleep.call_args[0][0], 2)
+
+    def test_server_error_checks_for_the_post_before_retrying(self):
+        self.session.request.side_effect = [
+            response(502),
+            response(200, [{"id": 5, "link": "http://example.com/a", "title": {"raw": "A"}}]),
+        ]
+
+        result = publish_to_wordpress("A", "Body", "user", "pass")
+
+        self.assertIn("http://example.com/a", result)
+        self.assertEqual(self.calls(), [("POST", "/wp/v2/posts"), ("GET", "/wp/v2/posts")])
+
+    def test_batch_creates_posts_in_one_request(self):
+        self.session.request.return_value = response(207, {"responses": [
+            {"status": 201, "body": {"link": "http://example.com/a"}},
+            {"status": 400, "body": {"code": "rest_invalid_param", "message": "Invalid title"}},
+        ]})
+
+        results = publish_posts([post_data("A", "Body"), post_data("", "Body")], "user", "pass")
+
+        self.assertEqual(self.calls(), [("POST", "/batch/v1")])
+        sent = self.session.request.call_args[1]['json']["requests"]
+        self.assertEqual([r["path"] for r in sent], ["/wp/v2/posts", "/wp/v2/posts"])
+        self.assertEqual([ok for ok, _ in results], [True, False])
+        self.assertIn("Invalid title", results[1][1])
+
+    def test_batch_falls_back_without_the_endpoint(self):
+        self.session.request.side_effect = [
+            response(404),
+            response(201, {"link": "http://example.com/a"}),
+            response(201, {"link": "http://example.com/b"}),
+        ]
+
+        results = publish_posts([post_data("A", "Body"), post_data("B", "Body")], "user", "pass")
+
+        self.assertEqual([ok for ok, _ in results], [True, True])
+        self.assertEqual(self.calls()[1:], [("POST", "/wp/v2/posts"), ("POST", "/wp/v2/posts")])
+
+    def test_batch_network_failure_fails_the_posts_without_raising(self):
+        self.session.request.side_effect = requests.exceptions.ConnectionError("connection refused")
+
+        results = publish_posts([post_data("A", "Body"), post_data("B", "Body")], "user", "pass")
+
+        self.assertEqual([ok for ok, _ in results], [False, False])
+        self.assertIn("connection refused", results[0][1])
+
+class TestImageBytes(unittest.TestCase):
+
+    @patch('image_generator.image_generation', return_value=base64.b64encode(PNG).decode())
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_generate_image_can_return_bytes(self, mock_generation):
+        self.assertEqual(generate_image("prompt", as_bytes=True), PNG)
+        self.assertEqual(mock_generation.call_args[1]['response_format'], "b64_json")
+
+    def test_transcode_keeps_png_without_pillow(self):
+        self.assertEqual(transcode_image(PNG, "png"), (PNG, "png"))
+        with patch('image_generator.Image', None):
+            self.assertEqual(transcode_image(PNG, "webp"), (PNG, "png"))
+        with self.assertRaises(ValueError):
+            transcode_image(PNG, "tiff")
+
+if __name__ == '__main__':
+    unittest.main()
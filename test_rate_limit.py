@@ -0,0 +1,83 @@
+import time
+import unittest
+import threading
+from rate_limit import AdaptiveLimiter, TokenBucket, backoff_delays, parse_duration, retry_after
+
+class TestRateLimit(unittest.TestCase):
+
+    def test_token_bucket_allows_burst_then_paces(self):
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        # Two tokens from the burst, two more at 20/s.
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 0.5)
+
+    def test_backoff_delays_are_capped_and_jittered(self):
+        delays = list(backoff_delays(5, base=1, cap=4))
+        self.assertEqual(len(delays), 5)
+        for attempt, delay in enumerate(delays):
+            self.assertLessEqual(delay, min(4, 2 ** attempt))
+            self.assertGreaterEqual(delay, 0)
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_window_grows_on_success_and_halves_on_429(self):
+        limiter = AdaptiveLimiter(start=4, maximum=5)
+        for _ in range(4):
+            limiter.observe("gpt-5.1", 200)
+        self.assertAlmostEqual(limiter.limit("gpt-5.1"), 5, delta=0.1)
+        limiter.observe("gpt-5.1", 429, {"retry-after": "0"})
+        self.assertAlmostEqual(limiter.limit("gpt-5.1"), 2.5, delta=0.1)
+        self.assertEqual(limiter.limit("dall-e-3"), 4)
+
+    def test_calls_beyond_the_window_wait_for_a_slot(self):
+        limiter = AdaptiveLimiter(start=1)
+        limiter.acquire("gpt-5.1")
+        started = threading.Event()
+
+        def second():
+            limiter.acquire("gpt-5.1")
+            started.set()
+            limiter.release("gpt-5.1")
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        self.assertFalse(started.wait(0.05))
+        limiter.release("gpt-5.1")
+        self.assertTrue(started.wait(1))
+        thread.join()
+        self.assertIn("1 queued", limiter.summary_lines()[0])
+
+    def test_retry_after_and_exhausted_budgets_pause_the_model(self):
+        limiter = AdaptiveLimiter(start=4)
+        limiter.observe("dall-e-3", 429, {"retry-after-ms": "100"})
+        start = time.monotonic()
+        with limiter.slot("dall-e-3"):
+            pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        limiter.observe("gpt-5.1", 200, {"x-ratelimit-remaining-tokens": "50", "x-ratelimit-reset-tokens": "100ms"})
+        start = time.monotonic()
+        with limiter.slot("gpt-5.1", tokens=10):
+            pass
+        self.assertLess(time.monotonic() - start, 0.05)
+        with limiter.slot("gpt-5.1", tokens=200):
+            pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_header_values(self):
+        self.assertEqual(parse_duration("6m0s"), 360)
+        self.assertEqual(parse_duration("20ms"), 0.02)
+        self.assertEqual(parse_duration("1.5s"), 1.5)
+        self.assertEqual(parse_duration("7"), 7)
+        self.assertIsNone(parse_duration(None))
+        self.assertEqual(retry_after({"retry-after": "3"}), 3)
+        self.assertEqual(retry_after({"retry-after-ms": "250", "retry-after": "3"}), 0.25)
+        self.assertIsNone(retry_after({}))
+
+if __name__ == '__main__':
+    unittest.main()
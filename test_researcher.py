@@ -0,0 +1,44 @@
+import unittest
+from researcher import canonical_url, estimate_tokens, format_citations, works_cited
+
+def result(title, url, snippet):
+    return {"query": "q", "title": title, "url": url, "snippet": snippet}
+
+class TestResearchCompaction(unittest.TestCase):
+
+    def test_canonical_url_ignores_cosmetic_differences(self):
+        self.assertEqual(canonical_url("https://www.bbc.co.uk/news/1/?utm_source=rss#top"),
+                         canonical_url("http://bbc.co.uk/news/1"))
+        self.assertNotEqual(canonical_url("https://bbc.co.uk/news?id=1"), canonical_url("https://bbc.co.uk/news?id=2"))
+
+    def test_duplicate_urls_are_cited_once(self):
+        results = [
+            result("Rates held", "https://www.boe.example/rates?utm_medium=x", "short"),
+            result("Rates held", "https://boe.example/rates/", "a longer snippet about rates"),
+            result("Other", "https://other.example/", "unrelated"),
+        ]
+        stats = {}
+
+        text = format_citations(results, budget=0, stats=stats)
+
+        self.assertEqual(text.count("Source "), 2)
+        self.assertIn("a longer snippet about rates", text)
+        self.assertEqual(works_cited(results).count("<li>"), 2)
+        self.assertEqual((stats["sources_before"], stats["sources_after"]), (3, 2))
+        self.assertGreater(stats["tokens_saved"], 0)
+
+    def test_relevant_sources_come_first_and_budget_is_respected(self):
+        filler = " ".join(["background"] * 200)
+        results = [
+            result("Celebrity news", "https://a.example/", filler),
+            result("Central bank holds interest rates", "https://b.example/", "Interest rates held as inflation cools. " + filler),
+        ]
+
+        text = format_citations(results, thesis="Interest rates and inflation", budget=150)
+
+        self.assertLess(text.index("Central bank"), text.index("Celebrity news") if "Celebrity news" in text else len(text))
+        self.assertLessEqual(estimate_tokens(text), 160)
+        self.assertIn("...", text)
+
+if __name__ == '__main__':
+    unittest.main()
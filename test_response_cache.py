@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+import ai_client
+from response_cache import ResponseCache, CacheMiss, request_key
+from generator import generate_story
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        ai_client.reset_clients()
+        self.addCleanup(ai_client.reset_clients)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_depends_on_every_request_parameter(self):
+        messages = [{"role": "user", "content": "hi"}]
+        base = request_key("chat", model="gpt-4o", messages=messages, temperature=0.7)
+
+        self.assertEqual(base, request_key("chat", temperature=0.7, messages=messages, model="gpt-4o"))
+        self.assertNotEqual(base, request_key("chat", model="gpt-4o", messages=messages, temperature=0.2))
+        self.assertNotEqual(base, request_key("chat", model="gpt-4o", messages=messages, temperature=0.7,
+                                              response_format={"type": "json_object"}))
+
+    def test_modes(self):
+        calls = []
+        def call():
+            calls.append(1)
+            return {"content": f"response {len(calls)}"}
+
+        replay = ResponseCache(self.tmp.name, mode="replay")
+        with self.assertRaises(CacheMiss):
+            replay.fetch("k", call)
+
+        ResponseCache(self.tmp.name, mode="record").fetch("k", call)
+        self.assertEqual(ResponseCache(self.tmp.name, mode="read-through").fetch("k", call), {"content": "response 1"})
+        self.assertEqual(replay.fetch("k", call), {"content": "response 1"})
+        self.assertEqual(ResponseCache(self.tmp.name, mode="record").fetch("k", call), {"content": "response 2"})
+        self.assertEqual(len(calls), 2)
+
+        self.assertTrue(replay.invalidate("k"))
+        with self.assertRaises(CacheMiss):
+            replay.fetch("k", call)
+
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_generate_story_replays_offline(self, mock_openai):
+        create = mock_openai.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "TITLE: Recorded\nCONTENT: Body"
+
+        with patch('ai_client.get_response_cache', return_value=ResponseCache(self.tmp.name, mode="record")):
+            generate_story("Headline", "calm", "Thesis", "Research")
+
+        replay = ResponseCache(self.tmp.name, mode="replay")
+        with patch('ai_client.get_response_cache', return_value=replay), \
+             patch('generator.is_replay', return_value=True), \
+             patch.dict('os.environ', {'AI_API_KEY': ''}):
+            title, content = generate_story("Headline", "calm", "Thesis", "Research")
+
+        self.assertEqual((title, content), ("Recorded", "Body"))
+        self.assertEqual(create.call_count, 1)
+
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_invalid_and_fallback_responses_are_not_recorded(self, mock_openai):
+        create = mock_openai.return_value.chat.completions.create
+        cache = ResponseCache(self.tmp.name, mode="read-through")
+        messages = [{"role": "user", "content": "hi"}]
+
+        with patch('ai_client.get_response_cache', return_value=cache):
+            create.return_value.choices[0].message.content = "not json"
+            ai_client.chat_completion("analyze", messages, validate=lambda text: text.startswith("{"))
+            create.return_value.choices[0].message.content = ""
+            ai_client.chat_completion("analyze", messages)
+            self.assertEqual(cache.stats["stored"], 0)
+
+            with patch('ai_client._hedged', return_value={"content": "{}", "model": "gpt-4o-mini"}):
+                ai_client.chat_completion("analyze", messages)
+            self.assertEqual(cache.stats["stored"], 0)
+
+            create.return_value.choices[0].message.content = "{}"
+            ai_client.chat_completion("analyze", messages)
+            self.assertEqual(cache.stats["stored"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
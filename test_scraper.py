@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from scraper import fetch_headlines, fetch_entries_for, FeedCache
+from feed_reader import iter_entries
+
+def rss(*titles):
+    items = "".join(
+        f"<item><title>{title}</title><link>http://news/{i}</link><guid>id-{i}</guid>"
+        f"<pubDate>Mon, 05 Jan 2026 10:00:00 GMT</pubDate>"
+        f"<description>&lt;p&gt;Summary of {title}&lt;/p&gt;</description></item>"
+        for i, title in enumerate(titles)
+    )
+    return f"<?xml version='1.0'?><rss version='2.0'><channel><title>Feed</title>{items}</channel></rss>".encode()
+
+def make_response(status_code=200, content=b"", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.iter_content.return_value = [content[i:i + 64] for i in range(0, len(content), 64)]
+    return response
+
+class TestScraper(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "feeds.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch('scraper.requests.get')
+    def test_fetch_entries_for_fetches_shared_feeds_once(self, mock_get):
+        mock_get.side_effect = lambda url, **kwargs: make_response(content=rss(f"Headline from {url}"))
+
+        result = fetch_entries_for({
+            "mindy": ["http://world/rss", "http://economics/rss"],
+            "derick": ["http://world/rss"],
+        }, cache=FeedCache(self.cache_path))
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual([e.title for e in result["mindy"]], ["Headline from http://world/rss", "Headline from http://economics/rss"])
+        self.assertEqual([e.title for e in result["derick"]], ["Headline from http://world/rss"])
+
+    @patch('scraper.requests.get')
+    @patch('scraper.feedparser.parse')
+    def test_not_modified_feed_is_served_from_cache_without_parsing(self, mock_parse, mock_get):
+        mock_get.return_value = make_response(content=rss("Cached Headline"), headers={
+            "ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2026 00:00:00 GMT", "Content-Length": "1000"})
+        fetch_headlines(["http://test.com/rss"], cache=FeedCache(self.cache_path))
+
+        mock_get.return_value = make_response(status_code=304)
+        cache = FeedCache(self.cache_path)
+        headlines = fetch_headlines(["http://test.com/rss"], cache=cache)
+
+        self.assertEqual(headlines, ["Cached Headline"])
+        mock_parse.assert_not_called()
+        mock_get.return_value.iter_content.assert_not_called()
+        sent_headers = mock_get.call_args[1]['headers']
+        self.assertEqual(sent_headers["If-None-Match"], '"v1"')
+        self.assertEqual(sent_headers["If-Modified-Since"], "Mon, 01 Jan 2026 00:00:00 GMT")
+        self.assertEqual(cache.stats["not_modified"], 1)
+        self.assertEqual(cache.stats["bytes_saved"], 1000)
+
+    def test_save_replaces_the_cache_without_leaving_temp_files(self):
+        cache = FeedCache(self.cache_path)
+        cache.entries["http://test.com/rss"] = {"etag": '"v1"'}
+        cache.save()
+        cache.save()
+        self.assertEqual(os.listdir(self.tmp.name), ["feeds.json"])
+        self.assertEqual(FeedCache(self.cache_path).entries, cache.entries)
+
+    @patch('scraper.requests.get')
+    def test_unsupported_format_falls_back_to_feedparser(self, mock_get):
+        rdf = (b"<?xml version='1.0'?><rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#' "
+               b"xmlns='http://purl.org/rss/1.0/'><channel rdf:about='x'><title>Feed</title></channel>"
+               b"<item rdf:about='http://news/1'><title>RDF Headline</title><link>http://news/1</link></item></rdf:RDF>")
+        mock_get.return_value = make_response(content=rdf)
+
+        headlines = fetch_headlines(["http://test.com/rdf"], cache=FeedCache(self.cache_path))
+        self.assertEqual(headlines, ["RDF Headline"])
+
+class TestFeedReader(unittest.TestCase):
+
+    def test_rss_entries_are_structured_records(self):
+        entry = next(iter_entries([rss("Storm &amp; Flood")]))
+
+        self.assertEqual(entry.title, "Storm & Flood")
+        self.assertEqual(entry.link, "http://news/0")
+        self.assertEqual(entry.guid, "id-0")
+        self.assertEqual(entry.published, "2026-01-05T10:00:00+00:00")
+        self.assertEqual(entry.summary, "Summary of Storm & Flood")
+
+    def test_stops_reading_after_limit(self):
+        body = rss(*[f"Headline {i}" for i in range(50)])
+        chunks = [body[i:i + 64] for i in range(0, len(body), 64)]
+        consumed = []
+
+        def stream():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        entries = list(iter_entries(stream(), limit=2))
+
+        self.assertEqual([e.title for e in entries], ["Headline 0", "Headline 1"])
+        self.assertLess(len(consumed), len(chunks) // 5)
+
+    def test_atom_entries(self):
+        atom = (b"<feed xmlns='http://www.w3.org/2005/Atom'><title>Feed</title>"
+                b"<entry><title>Atom Headline</title><link rel='alternate' href='http://news/a'/>"
+                b"<id>tag:a</id><updated>2026-01-05T10:00:00Z</updated><summary>Short</summary></entry></feed>")
+        entry = next(iter_entries([atom]))
+
+        self.assertEqual((entry.title, entry.link, entry.guid, entry.summary), ("Atom Headline", "http://news/a", "tag:a", "Short"))
+        self.assertEqual(entry.published, "2026-01-05T10:00:00+00:00")
+
+if __name__ == '__main__':
+    unittest.main()
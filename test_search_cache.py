@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from search_cache import SearchCache
+from researcher import perform_research
+from rate_limit import TokenBucket
+
+class TestSearchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        limiter = patch('researcher.get_search_limiter', return_value=TokenBucket(rate=1000, capacity=100))
+        limiter.start()
+        self.addCleanup(limiter.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalized_query_hits_and_expires(self):
+        cache = SearchCache(self.tmp.name, ttl_seconds=60)
+        cache.put("Inflation rate 2026", 2, [{"title": "T", "href": "http://a", "body": "B"}])
+
+        self.assertEqual(cache.get("  inflation RATE 2026 ", 2)[0]["href"], "http://a")
+        self.assertIsNone(cache.get("inflation rate 2026", 3))
+
+        cache.ttl = 0
+        time.sleep(0.01)
+        self.assertIsNone(cache.get("inflation rate 2026", 2))
+        self.assertEqual(cache.stats["hits"], 1)
+        self.assertEqual(cache.stats["expired"], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = SearchCache(self.tmp.name, max_bytes=10 ** 9)
+        for i in range(3):
+            cache.put(f"query {i}", 2, [{"body": "x" * 200}])
+            path = os.path.join(self.tmp.name, f"{cache.key(f'query {i}', 2)}.json")
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+        cache.get("query 0", 2)  # now the most recently used
+
+        # Entry sizes vary by a few bytes with the created_at timestamp.
+        cache.max_bytes = os.path.getsize(path) * 2 + 32
+        cache.put("query 3", 2, [{"body": "x" * 200}])
+
+        self.assertIsNotNone(cache.get("query 0", 2))
+        self.assertIsNone(cache.get("query 1", 2))
+        self.assertEqual(cache.stats["evicted"], 2)
+
+    @patch('researcher.DDGS')
+    def test_perform_research_only_searches_on_a_miss(self, mock_ddgs):
+        mock_ddgs.return_value.__enter__.return_value.text.return_value = [
+            {"title": "BoE decision", "href": "http://boe", "body": "Rates held"}]
+        cache = SearchCache(self.tmp.name)
+
+        with patch('researcher.get_search_cache', return_value=cache):
+            first = perform_research(["Bank of England interest rate decision"])
+            second = perform_research(["bank of england interest rate decision"])
+            bypassed = perform_research(["Bank of England interest rate decision"], use_cache=False)
+
+        self.assertEqual(first[0]["url"], "http://boe")
+        self.assertEqual(second[0]["url"], "http://boe")
+        self.assertEqual(bypassed[0]["url"], "http://boe")
+        self.assertEqual(mock_ddgs.return_value.__enter__.return_value.text.call_count, 2)
+
+    @patch('researcher.backoff_delays', return_value=iter([0]))
+    @patch('researcher.DDGS')
+    def test_parallel_research_keeps_query_order_and_retries_rate_limits(self, mock_ddgs, _):
+        from ddgs.exceptions import RatelimitException
+        calls = {}
+
+        def text(query, max_results):
+            calls[query] = calls.get(query, 0) + 1
+            if query == "q2" and calls[query] == 1:
+                raise RatelimitException("202 Ratelimit")
+            time.sleep(0.05 if query == "q1" else 0)
+            return [{"title": query, "href": f"http://{query}", "body": ""}]
+
+        mock_ddgs.return_value.__enter__.return_value.text.side_effect = text
+        results = perform_research(["q1", "q2", "q3"], use_cache=False)
+
+        self.assertEqual([r["query"] for r in results], ["q1", "q2", "q3"])
+        self.assertEqual(calls["q2"], 2)
+
+    @patch('researcher.DDGS')
+    def test_malformed_queries_are_unpacked_or_dropped(self, mock_ddgs):
+        text = mock_ddgs.return_value.__enter__.return_value.text
+        text.side_effect = lambda query, max_results: [{"title": query, "href": f"http://{query}", "body": ""}]
+        cache = SearchCache(self.tmp.name)
+
+        with patch('researcher.get_search_cache', return_value=cache):
+            results = perform_research([{"query": "q1"}, ["q2", None], 3, "", "q1", {"text": "q3"}])
+
+        self.assertEqual([r["query"] for r in results], ["q1", "q2", "q1"])
+        self.assertEqual(text.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
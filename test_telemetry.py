@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+import ai_client
+import telemetry
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(telemetry.finish)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.jsonl = os.path.join(self.dir.name, "run.jsonl")
+        self.prom = os.path.join(self.dir.name, "storybuilder.prom")
+
+    def test_disabled_instrumentation_is_a_no_op(self):
+        @telemetry.traced("analyze")
+        def stage(x):
+            return x * 2
+
+        self.assertIs(telemetry.span("analyze"), telemetry.span("generate"))
+        with telemetry.article("alice", "Headline") as record:
+            self.assertIsNone(record)
+            self.assertEqual(stage(2), 4)
+        self.assertEqual(telemetry.finish(), [])
+
+    @patch('ai_client.get_response_cache', return_value=None)
+    @patch('ai_client.OpenAI')
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_article_records_spans_tokens_and_cost(self, mock_openai, _):
+        ai_client.reset_clients()
+        self.addCleanup(ai_client.reset_clients)
+        mock_openai.return_value.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+            usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=500))
+        telemetry.configure(self.jsonl, self.prom)
+
+        @telemetry.traced("analyze")
+        def analyze():
+            with telemetry.span("analyze"):
+                return ai_client.chat_completion("analyze", [{"role": "user", "content": "hi"}])
+
+        with telemetry.article("alice", "Headline"):
+            analyze()
+            telemetry.annotate(outcome="published")
+        lines = telemetry.finish()
+
+        with open(self.jsonl) as f:
+            article, run = [json.loads(line) for line in f]
+        self.assertEqual(article["outcome"], "published")
+        self.assertEqual(list(article["stages"]), ["analyze"])
+        self.assertEqual(article["tokens"]["gpt-4o"], {"calls": 1, "prompt": 1000, "completion": 500})
+        self.assertAlmostEqual(article["cost_usd"], (1000 * 2.5 + 500 * 10) / 1e6)
+        self.assertEqual(run["stages"]["analyze"]["count"], 1)
+        self.assertEqual(run["personalities"]["alice"]["articles"], 1)
+        self.assertIn("alice: 1 articles", "\n".join(lines))
+
+        with open(self.prom) as f:
+            text = f.read()
+        self.assertIn('storybuilder_stage_duration_seconds_count{stage="analyze"} 1', text)
+        self.assertIn('storybuilder_articles{personality="alice",outcome="published"} 1', text)
+
+    @patch('generator.chat_completion', side_effect=TimeoutError("timed out"))
+    @patch('image_generator.image_generation', side_effect=RuntimeError("content policy"))
+    @patch.dict('os.environ', {'AI_API_KEY': 'key'})
+    def test_failures_returned_by_stages_are_counted(self, *mocks):
+        from generator import generate_story
+        from image_generator import generate_image
+        telemetry.configure(self.jsonl, self.prom)
+
+        self.assertEqual(generate_story("Headline", "calm")[0], "Error")
+        self.assertIsNone(generate_image("a prompt"))
+        telemetry.finish()
+
+        with open(self.jsonl) as f:
+            run = json.loads(f.readline())
+        self.assertEqual(run["stages"]["generate"]["errors"], 1)
+        self.assertEqual(run["stages"]["image"]["errors"], 1)
+        with open(self.prom) as f:
+            self.assertIn('storybuilder_stage_errors{stage="generate"} 1', f.read())
+
+    def test_percentiles(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(telemetry.percentile(values, 0.5), 50.0)
+        self.assertEqual(telemetry.percentile(values, 0.95), 95.0)
+        self.assertEqual(telemetry.percentile([3.0], 0.95), 3.0)
+        self.assertEqual(telemetry.percentile([], 0.5), 0.0)
+
+if __name__ == '__main__':
+    unittest.main()